@@ -0,0 +1,165 @@
+"""
+Module summary: Drawing detections onto images.
+
+Boxes and labels are drawn with OpenCV from plain arrays, so any detections can be drawn, including
+boxes that were tracked rather than inferred and labels translated to another language. OpenCV's fonts
+only cover ASCII, so labels with accents or in other scripts are rendered with a FreeType font through
+PIL, as ultralytics' Annotator does.
+"""
+
+import functools
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# A TrueType font covering the scripts of the target languages. Without it, common system fonts are tried,
+# then the Arial Unicode font ultralytics downloads for its own annotations.
+ANNOTATION_FONT = os.environ.get('ANNOTATION_FONT')
+SYSTEM_FONTS = (
+    '/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial Unicode.ttf',
+)
+
+_scratch = threading.local()
+
+
+def class_color(class_id):
+    """Returns a stable, distinct BGR color for a class id."""
+    hue = (int(class_id) * 47) % 180
+    color = cv2.cvtColor(np.uint8([[[hue, 200, 230]]]), cv2.COLOR_HSV2BGR)[0, 0]
+    return int(color[0]), int(color[1]), int(color[2])
+
+
+@functools.lru_cache(maxsize=8)
+def unicode_font(size):
+    """
+    Loads the font non-ASCII labels are drawn with.
+
+    Args:
+        size (int): The font size in pixels.
+
+    Returns:
+        PIL.ImageFont.FreeTypeFont: The first font found among ANNOTATION_FONT, SYSTEM_FONTS and the
+        ultralytics Arial Unicode font, or PIL's default font.
+    """
+    from PIL import ImageFont  # Deferred, only needed for non-ASCII labels
+
+    for path in (ANNOTATION_FONT,) + SYSTEM_FONTS:
+        if path and os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                continue
+    try:
+        from ultralytics.utils.checks import check_font
+
+        return ImageFont.truetype(str(check_font('Arial.Unicode.ttf')), size)
+    except Exception as e:
+        print(f"No Unicode font available for the annotations, using PIL's default font: {e}")
+        return ImageFont.load_default(size)
+
+
+def _put_unicode_text(image, text, origin, font):
+    """Draws white text whose top-left corner is at `origin`, clipped to the image."""
+    from PIL import Image, ImageDraw
+
+    left, top, right, bottom = font.getbbox(text)
+    mask = Image.new('L', (max(right, 1), max(bottom, 1)), 0)
+    ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=font)
+    alpha = np.asarray(mask, dtype=np.float32)[:, :, None] / 255
+
+    x, y = origin
+    height = min(alpha.shape[0], image.shape[0] - y)
+    width = min(alpha.shape[1], image.shape[1] - x)
+    if height <= 0 or width <= 0:
+        return
+    region = image[y:y + height, x:x + width]
+    alpha = alpha[:height, :width]
+    region[:] = (region * (1 - alpha) + 255 * alpha).astype(image.dtype)
+
+
+def draw_detections(image, boxes, class_ids, confidences, labels, out=None):
+    """
+    Draws boxes with their label and confidence.
+
+    Args:
+        image (numpy.ndarray): The BGR image to draw on.
+        boxes (numpy.ndarray): The (N, 4) xyxy boxes.
+        class_ids (numpy.ndarray): The (N,) class ids, used for the colors.
+        confidences (numpy.ndarray): The (N,) confidences. None omits them from the labels.
+        labels (Sequence[str]): The (N,) labels to write above the boxes.
+        out (numpy.ndarray, optional): The image to draw into. None draws into a copy of `image`, and `image`
+            itself may be passed to draw in place.
+
+    Returns:
+        numpy.ndarray: The annotated image.
+    """
+    if out is None:
+        out = image.copy()
+    elif out is not image:
+        np.copyto(out, image)
+
+    thickness = max(1, round(sum(out.shape[:2]) / 600))
+    font_scale = thickness / 3
+    for index, (box, class_id, label) in enumerate(zip(boxes, class_ids, labels)):
+        x1, y1, x2, y2 = (int(value) for value in box)
+        color = class_color(class_id)
+        cv2.rectangle(out, (x1, y1), (x2, y2), color, thickness, cv2.LINE_AA)
+
+        text = label if confidences is None else f"{label} {float(confidences[index]):.2f}"
+        if not text.isascii():
+            font = unicode_font(max(12, round(sum(out.shape[:2]) * 0.0175)))
+            _, _, text_width, text_height = font.getbbox(text)
+            top = max(y1 - text_height, 0)
+            cv2.rectangle(out, (x1, top), (x1 + text_width, top + text_height), color, -1)
+            _put_unicode_text(out, text, (max(x1, 0), top), font)
+            continue
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        top = max(y1 - text_height - baseline, 0)
+        cv2.rectangle(out, (x1, top), (x1 + text_width, top + text_height + baseline), color, -1)
+        cv2.putText(out, text, (x1, top + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255),
+                    thickness, cv2.LINE_AA)
+    return out
+
+
+def scratch_buffer(shape, dtype=np.uint8):
+    """
+    Returns a buffer owned by the calling thread, reused by its next call with the same shape.
+
+    Drawing into it saves allocating a full frame per annotated image. Its content is overwritten by the
+    next call on the same thread, so it must be consumed, e.g. encoded, before then.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the buffer.
+        dtype (numpy.dtype, optional): The type of its elements. Defaults to uint8.
+
+    Returns:
+        numpy.ndarray: The uninitialized buffer.
+    """
+    buffer = getattr(_scratch, 'buffer', None)
+    if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+        buffer = _scratch.buffer = np.empty(shape, dtype=dtype)
+    return buffer
+
+
+def encode_jpeg(image, quality=90):
+    """
+    Encodes a BGR image as a JPEG in memory.
+
+    Args:
+        image (numpy.ndarray): The BGR image.
+        quality (int, optional): The JPEG quality, from 0 to 100. Defaults to 90.
+
+    Returns:
+        bytes: The encoded image.
+
+    Raises:
+        ValueError: If the image cannot be encoded.
+    """
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError(f"Could not encode image of shape {image.shape} as JPEG")
+    return encoded.tobytes()
@@ -0,0 +1,141 @@
+"""
+Module summary: The grammar of the spoken summaries.
+
+Summaries and the changes announced by the scene monitor are built as a list of tokens, each of which is
+a word or a fixed phrase of a small, closed vocabulary: the introductions, counts, object names, "located",
+the position and distance phrases and punctuation. Text-to-speech backends either join the tokens into a sentence or, offline, play a
+pre-rendered clip per token.
+"""
+
+SUMMARY_INTRODUCTION = "Summary of inferences:"
+LOCATED = "located"
+# Introductions of the objects that appeared in or left the scene, see monitor.describe_changes
+APPEARED = "New:"
+DEPARTED = "Gone:"
+# Relative horizontal and vertical positions, from left to right and from top to bottom
+HORIZONTAL_PHRASES = ("to the left of the camera", "in front of the camera", "to the right of the camera")
+VERTICAL_PHRASES = ("towards the top of the view", "at the center of the view", "towards the bottom of the view")
+# Phrases of the finer grids, keyed by the number of columns or rows
+HORIZONTAL_PHRASES_BY_GRID = {
+    3: HORIZONTAL_PHRASES,
+    5: ("to the far left of the camera", "to the left of the camera", "in front of the camera",
+        "to the right of the camera", "to the far right of the camera"),
+}
+VERTICAL_PHRASES_BY_GRID = {
+    3: VERTICAL_PHRASES,
+    5: ("at the very top of the view", "towards the top of the view", "at the center of the view",
+        "towards the bottom of the view", "at the very bottom of the view"),
+}
+# Estimated distances, from the nearest to the farthest, see spatial.estimate_distances
+DISTANCE_PHRASES = ("close by", "a few steps away", "far away")
+PUNCTUATION = (",", ".")
+# Counts up to this number are part of the pre-rendered vocabulary
+MAX_RENDERED_COUNT = 20
+
+
+def position_phrase(column, row, columns=3, rows=3):
+    """
+    Returns the phrase for a cell of a grid, e.g. (0, 0) -> 'to the left of the camera and towards ...'.
+
+    :param column: The column of the cell, from left to right.
+    :param row: The row of the cell, from top to bottom.
+    :param columns: The number of columns of the grid, 3 or 5.
+    :param rows: The number of rows of the grid, 3 or 5.
+    :raises KeyError: If the grid size has no phrases.
+    """
+    return f"{HORIZONTAL_PHRASES_BY_GRID[columns][column]} and {VERTICAL_PHRASES_BY_GRID[rows][row]}"
+
+
+def position_phrases():
+    """Returns the position phrases of every supported grid, without duplicates."""
+    phrases = [position_phrase(column, row, columns, rows)
+               for columns in HORIZONTAL_PHRASES_BY_GRID for rows in VERTICAL_PHRASES_BY_GRID
+               for column in range(columns) for row in range(rows)]
+    return list(dict.fromkeys(phrases))
+
+
+def pluralize(name, count):
+    """Returns the name of an object for a count, following the grammar of the summaries."""
+    return name if count == 1 else f"{name}s"
+
+
+def build_announcement(groups, columns=3, rows=3):
+    """
+    Builds the tokens of a summary.
+
+    The groups of an object are announced together, with the count of each place when there are several.
+
+    :param groups: The groups of detections, see spatial.summarize.
+    :param columns: The number of columns of the grid the groups were binned into.
+    :param rows: The number of rows of the grid the groups were binned into.
+    :return: The tokens, e.g. ["Summary of inferences:", "3", "chairs", "located", "2", "<position>", ",",
+        "1", "<position>", ".", ...].
+    """
+    places_by_name = {}
+    for group in groups:
+        places_by_name.setdefault(group['name'], []).append(group)
+
+    tokens = [SUMMARY_INTRODUCTION]
+    for name, places in places_by_name.items():
+        total = sum(place['count'] for place in places)
+        tokens += [str(total), pluralize(name, total), LOCATED]
+        for index, place in enumerate(places):
+            if index:
+                tokens.append(",")
+            if len(places) > 1:
+                tokens.append(str(place['count']))
+            tokens.append(position_phrase(place['column'], place['row'], columns, rows))
+            if place.get('distance') is not None:
+                tokens.append(DISTANCE_PHRASES[place['distance']])
+        tokens.append(".")
+    return tokens
+
+
+def build_change_announcement(appeared, departed):
+    """
+    Builds the tokens announcing the objects that appeared in or left the scene.
+
+    :param appeared: The count of each object name that appeared.
+    :param departed: The count of each object name that left.
+    :return: The tokens, e.g. ["New:", "2", "persons", ",", "1", "chair", ".", "Gone:", "1", "cup", "."], or
+        an empty list if nothing changed.
+    """
+    tokens = []
+    for introduction, counts in ((APPEARED, appeared), (DEPARTED, departed)):
+        if not counts:
+            continue
+        tokens.append(introduction)
+        for index, (name, count) in enumerate(counts.items()):
+            if index:
+                tokens.append(",")
+            tokens += [str(count), pluralize(name, count)]
+        tokens.append(".")
+    return tokens
+
+
+def render_text(tokens):
+    """Joins the tokens of a summary into a sentence."""
+    text = ""
+    for token in tokens:
+        if token in PUNCTUATION or not text:
+            text += token
+        else:
+            text += f" {token}"
+    return text
+
+
+def vocabulary(object_names, max_count=MAX_RENDERED_COUNT):
+    """
+    Lists every token a summary can contain.
+
+    :param object_names: The object names, in the language of the summary.
+    :param max_count: The largest count to include.
+    :return: The tokens, without duplicates and without punctuation.
+    """
+    tokens = [SUMMARY_INTRODUCTION, LOCATED, APPEARED, DEPARTED]
+    tokens += [str(count) for count in range(1, max_count + 1)]
+    for name in object_names:
+        tokens += [pluralize(name, 1), pluralize(name, 2)]
+    tokens += position_phrases()
+    tokens += DISTANCE_PHRASES
+    return list(dict.fromkeys(tokens))
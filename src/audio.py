@@ -10,7 +10,13 @@
 
 import gtts
 #from gtts import gTTS
+import hashlib
 import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 #import vlc
 #import subprocess
 #from playsound import playsound
@@ -20,48 +26,143 @@ import os
 #from audioplayer import AudioPlayer
 from pygame import mixer
 
-output = os.path.relpath("uploads/output.mp3")
+# Synthesized phrases are kept here, keyed by their text and language, so recurring phrases are rendered once
+AUDIO_CACHE_FOLDER = os.path.relpath("tts_cache")
+# Size above which the least recently spoken phrases are deleted from the cache, in megabytes
+AUDIO_CACHE_MAX_MB = float(os.environ.get('AUDIO_CACHE_MAX_MB', 50))
+# Number of phrases synthesized ahead of the one being played
+SYNTHESIS_WORKERS = 2
+# How often playback completion is checked, in seconds
+PLAYBACK_POLL_INTERVAL = 0.02
+
+_synthesis_pool = ThreadPoolExecutor(max_workers=SYNTHESIS_WORKERS)
+_cache_lock = threading.Lock()
+
+
+def split_phrases(text):
+    """
+    Splits a summary into phrases that can be synthesized and played independently.
+
+    :param text: The text to split, e.g. "Summary of inferences: 2 chairs located to the left. 1 cup located ...".
+    :return: The non-empty phrases, in order.
+    """
+    return [phrase.strip() for phrase in re.split(r'(?<=[.:;!?])\s+', text) if phrase.strip()]
+
+
+def phrase_cache_path(text, language):
+    """Returns the cache file of the audio for a phrase in a language."""
+    key = hashlib.sha1(f"{language}\n{text}".encode('utf-8')).hexdigest()
+    return os.path.join(AUDIO_CACHE_FOLDER, language, f"{key}.mp3")
+
+
+def synthesize_phrase(text, language):
+    """
+    Synthesizes a phrase, reusing the cached audio if it was synthesized before.
+
+    :param text: The phrase to synthesize.
+    :param language: The target language code (e.g., 'en', 'fr', 'es').
+    :return: The path of the audio file.
+    """
+    path = phrase_cache_path(text, language)
+    if os.path.exists(path):
+        try:
+            os.utime(path)  # The modification time records the last use, for trim_audio_cache
+        except OSError:
+            pass
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A temporary file of its own, so that concurrent syntheses of a phrase never write to the same file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as file:
+        try:
+            gtts.gTTS(text=text, lang=language).write_to_fp(file)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    os.replace(file.name, path)  # Never leave a partial file behind in the cache
+    trim_audio_cache()
+    return path
+
+
+def trim_audio_cache(max_bytes=None):
+    """
+    Deletes the least recently spoken phrases until the cache fits its size limit.
+
+    :param max_bytes: The size limit in bytes. Defaults to AUDIO_CACHE_MAX_MB.
+    :return: The number of files deleted.
+    """
+    if max_bytes is None:
+        max_bytes = int(AUDIO_CACHE_MAX_MB * 1024 * 1024)
+    with _cache_lock:
+        files = []
+        for directory, _, names in os.walk(AUDIO_CACHE_FOLDER):
+            for name in names:
+                if name.endswith('.mp3'):
+                    path = os.path.join(directory, name)
+                    try:
+                        status = os.stat(path)
+                    except OSError:
+                        continue  # Deleted meanwhile
+                    files.append((status.st_mtime, status.st_size, path))
+        total = sum(size for _, size, _ in files)
+        deleted = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            deleted += 1
+        return deleted
+
+
+def _ensure_mixer():
+    """Initializes the mixer once, it is kept initialized across announcements."""
+    if not mixer.get_init():
+        mixer.init()
+
+
+def play_file(path):
+    """
+    Plays an audio file and returns once it has finished.
+
+    :param path: The audio file to play.
+    """
+    _ensure_mixer()
+    mixer.music.load(path)
+    mixer.music.play()
+    # Wait for the sound to finish playing, sleeping between checks rather than spinning
+    while mixer.music.get_busy():
+        time.sleep(PLAYBACK_POLL_INTERVAL)
+
 
 def synthesize_audio(text, language):
     """
     Synthesizes audio from text in a specified language and plays it.
 
+    The text is split into phrases. The first phrase is played as soon as it is synthesized while the
+    following ones are synthesized in the background, and phrases already in the cache are not synthesized
+    again.
+
     :param text: The text to synthesize.
     :param language: The target language code (e.g., 'en', 'fr', 'es').
     """
-    try:
-        # Generate the audio
-        tts = gtts.gTTS(text=text, lang=language)
-        output_file = output
-        tts.save(output_file)
-
-        # Play the audio
-        #p = vlc.MediaPlayer("file:///" + output_file)
-        #p.play()
-        mixer.init()
-        mixer.music.load(output_file)
-        mixer.music.play()
-        # Wait for the sound to finish playing
-        while mixer.music.get_busy():
-            continue  # Loop until the audio is finished playing
-
-        #AudioPlayer(output_file).play(block=True)
-        #sound = AudioSegment.from_wav(output_file)
-        #play(sound)
-        #subprocess.run(['aplay', output_file], check=True)
-        #wave_obj = sa.WaveObject.from_wav_file(output_file)
-        #play_obj = wave_obj.play()
-        #play_obj.wait_done()
-        #playsound(output_file)
-
-        # Optional: Remove the file after playback
-        #os.remove(output_file)
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    finally:
+    phrases = split_phrases(text)
+    pending = [_synthesis_pool.submit(synthesize_phrase, phrase, language) for phrase in phrases]
+    for phrase, future in zip(phrases, pending):
+        try:
+            play_file(future.result())
+        except Exception as e:
+            print(f"An error occurred while speaking {phrase!r}: {e}")
+
+
+def shutdown_audio():
+    """Releases the mixer, to be called when the application exits."""
+    if mixer.get_init():
         mixer.quit()
-        #pass
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+"""
+Module summary: Dynamic micro-batching of inference requests.
+
+Concurrent requests queue their images per model size. A worker per size takes the oldest request and
+keeps collecting queued images until the batch is full or the oldest request has waited long enough,
+runs the whole batch through the model at once, and hands each request its own results back. Queue
+depth, batch sizes and request latencies are recorded for monitoring.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+LATENCY_WINDOW = 1000  # Number of recent request latencies the percentiles are computed over
+
+
+def percentile(values, fraction):
+    """Returns the value below which the given fraction of the sorted values fall, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Request:
+    __slots__ = ('images', 'future', 'enqueued_at')
+
+    def __init__(self, images):
+        self.images = images
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BatchScheduler:
+    """
+    Groups concurrent inference requests into batches, per model size.
+
+    Args:
+        run_batch (Callable[[str, List], List]): Runs a model size on a list of images and returns one
+            result per image.
+        max_batch_size (int, optional): Maximum number of images per batch. Defaults to 8.
+        max_wait_ms (float, optional): Maximum time the oldest request waits for the batch to fill. Defaults to 10.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._workers = {}
+        self._pid = os.getpid()
+        self._batch_sizes = {}
+        self._latencies = {}
+        self._batches = Counter()
+
+    def _queue_for(self, model_size):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads do not survive a fork, the workers are started again in the child process
+                self._queues.clear()
+                self._workers.clear()
+                self._pid = os.getpid()
+            if model_size not in self._queues:
+                self._queues[model_size] = queue.Queue()
+                self._batch_sizes[model_size] = Counter()
+                self._latencies[model_size] = deque(maxlen=LATENCY_WINDOW)
+                worker = threading.Thread(target=self._work, args=(model_size, self._queues[model_size]),
+                                          name=f'batch-{model_size}', daemon=True)
+                self._workers[model_size] = worker
+                worker.start()
+            return self._queues[model_size]
+
+    def submit(self, model_size, images):
+        """
+        Runs a model size on images, batched with the images of concurrent requests.
+
+        Args:
+            model_size (str): The model size to run.
+            images (List[numpy.ndarray]): The BGR images of this request.
+
+        Returns:
+            List: One result per image, in order.
+
+        Raises:
+            Exception: Whatever the model raised for the batch this request was part of.
+        """
+        request = _Request(list(images))
+        self._queue_for(model_size).put(request)
+        return request.future.result()
+
+    def _work(self, model_size, requests):
+        carry = None  # A request that did not fit in the previous batch
+        while True:
+            first = carry if carry is not None else requests.get()
+            carry = None
+            batch = [first]
+            count = len(first.images)
+            deadline = first.enqueued_at + self.max_wait_s
+            while count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait()
+                except queue.Empty:
+                    break
+                if count + len(request.images) > self.max_batch_size:
+                    carry = request
+                    break
+                batch.append(request)
+                count += len(request.images)
+
+            images = [image for request in batch for image in request.images]
+            try:
+                results = self.run_batch(model_size, images)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            finished_at = time.monotonic()
+            offset = 0
+            with self._lock:
+                self._batches[model_size] += 1
+                self._batch_sizes[model_size][len(images)] += 1
+                for request in batch:
+                    self._latencies[model_size].append((finished_at - request.enqueued_at) * 1000)
+            for request in batch:
+                request.future.set_result(results[offset:offset + len(request.images)])
+                offset += len(request.images)
+
+    def stats(self):
+        """
+        Reports the state of the scheduler.
+
+        Returns:
+            Dict[str, Dict]: For each model size, the 'queue_depth', the number of 'batches' run, the
+            'batch_size_histogram' and the 'p50_ms' and 'p99_ms' request latencies, queueing included.
+        """
+        with self._lock:
+            report = {}
+            for model_size, pending in self._queues.items():
+                latencies = list(self._latencies[model_size])
+                report[model_size] = {
+                    'queue_depth': pending.qsize(),
+                    'batches': self._batches[model_size],
+                    'batch_size_histogram': dict(sorted(self._batch_sizes[model_size].items())),
+                    'p50_ms': percentile(latencies, 0.50),
+                    'p99_ms': percentile(latencies, 0.99),
+                }
+            return report
@@ -0,0 +1,501 @@
+"""
+Module summary: Offline benchmark of the capture-to-speech path.
+
+Drives the scanner and the detection service end to end without hardware, network or speakers, and
+reports where the time goes. The GPIO pins come from fake_gpio, the camera replays fixture frames, the
+translator returns the names unchanged and speech synthesis and playback are replaced by stubs that
+optionally simulate their duration. The models are the real ones unless --stub-models is given, which
+replaces them with a model that returns fixed boxes after a configurable delay.
+
+Every call to a stage function (decode, inference, translation, annotation, summary, synthesis, ...)
+is timed while the scenarios run. The report holds, per scenario, the latency distribution of every
+stage and of the whole iteration, the throughput, and the peak resident memory of the process so far.
+Reports are saved as JSON, and a previous report can be given with --compare to print the changes.
+
+Example:
+    python benchmark.py --stub-models --iterations 20 --output ./benchmarks/baseline.json
+    python benchmark.py --stub-models --iterations 20 --compare ./benchmarks/baseline.json
+"""
+
+import os
+
+os.environ.setdefault('GPIO_BACKEND', 'fake')  # Before the GPIO handler is imported
+
+import argparse
+import functools
+import glob
+import json
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from batching import percentile
+
+FIXTURE_SIZE = (1280, 720)
+FIXTURE_SEED = 7
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+BUTTON_PIN = 17
+SIMULATED_WORDS_PER_SECOND = 2.5
+REGRESSION_THRESHOLD = 0.10  # Relative slow-down of a median reported as a regression by --compare
+
+
+def synthetic_frame(index, size=FIXTURE_SIZE):
+    """Draws a deterministic cluttered room-like scene: a gradient with a few filled shapes."""
+    width, height = size
+    rng = np.random.default_rng(FIXTURE_SEED + index)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = np.linspace(40, 200, width, dtype=np.uint8)[None, :, None]
+    for _ in range(8):
+        x, y = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 200))
+        w, h = int(rng.integers(40, 200)), int(rng.integers(40, 200))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        if rng.random() < 0.5:
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, -1)
+        else:
+            cv2.circle(frame, (x + w // 2, y + h // 2), min(w, h) // 2, color, -1)
+    return frame
+
+
+def load_fixtures(folder, count):
+    """
+    Loads the fixture images and videos, generating synthetic ones if no folder is given.
+
+    Args:
+        folder (str): A folder of recorded images and videos, or None.
+        count (int): The number of synthetic images to generate.
+
+    Returns:
+        Tuple[List[numpy.ndarray], List[str]]: The BGR images and the video paths.
+    """
+    if folder:
+        paths = sorted(glob.glob(os.path.join(folder, '*')))
+        images = [cv2.imread(path) for path in paths if path.lower().endswith(IMAGE_EXTENSIONS)]
+        videos = [path for path in paths if path.lower().endswith(VIDEO_EXTENSIONS)]
+        return [image for image in images if image is not None], videos
+
+    images = [synthetic_frame(index) for index in range(count)]
+    video_path = os.path.join(tempfile.mkdtemp(prefix='benchmark-'), 'synthetic.mp4')
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), 15, FIXTURE_SIZE)
+    for index in range(45):
+        frame = images[index % len(images)].copy()
+        cv2.circle(frame, (100 + index * 20, 360), 60, (30, 30, 220), -1)  # A moving object to track
+        writer.write(frame)
+    writer.release()
+    return images, [video_path]
+
+
+class FixtureCamera:
+    """Replays frames like a cv2.VideoCapture, at a fixed frame rate."""
+
+    def __init__(self, frames, fps=30.0):
+        self.frames = frames
+        self.interval = 1.0 / fps
+        self.index = 0
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        time.sleep(self.interval)
+        self.index += 1
+        return True
+
+    def read(self, image=None):
+        self.grab()
+        frame = self.frames[self.index % len(self.frames)]
+        if image is None or image.shape != frame.shape:
+            return True, frame.copy()
+        np.copyto(image, frame)
+        return True, image
+
+    def release(self):
+        pass
+
+
+class IdentityTranslator:
+    """A translator that returns the text unchanged, so no request leaves the machine."""
+
+    def translate(self, text):
+        return text
+
+    def translate_batch(self, texts):
+        return list(texts)
+
+
+class StubModel:
+    """
+    Stands in for a YOLOv10 model: returns a fixed set of boxes per image after a delay.
+
+    Args:
+        size (str): The model size, larger sizes are slower and more confident.
+        latency_ms (float): The delay of the smallest size, per image.
+    """
+
+    SIZE_FACTORS = {'n': 1, 's': 2, 'm': 4, 'b': 5, 'l': 6, 'x': 8}
+
+    def __init__(self, size, latency_ms):
+        from translation import COCO_CLASS_NAMES
+
+        self.size = size
+        self.names = dict(enumerate(COCO_CLASS_NAMES))
+        self.factor = self.SIZE_FACTORS.get(size, 1)
+        self.latency_s = latency_ms * self.factor / 1000
+
+    def __call__(self, images, verbose=False, imgsz=None):
+        import torch
+        from ultralytics.engine.results import Results
+
+        images = images if isinstance(images, list) else [images]
+        results = []
+        for index, image in enumerate(images):
+            time.sleep(self.latency_s * ((imgsz or 640) / 640) ** 2)
+            height, width = image.shape[:2]
+            rng = np.random.default_rng(index)
+            count = 6
+            x1 = rng.uniform(0, width * 0.8, count)
+            y1 = rng.uniform(0, height * 0.8, count)
+            boxes = np.stack([x1, y1, x1 + width * 0.15, y1 + height * 0.2,
+                              np.clip(rng.uniform(0.3, 0.7, count) + 0.05 * self.factor, 0, 1),
+                              rng.choice([0, 56, 62, 41], count)], axis=1)
+            results.append(Results(image, path='', names=self.names,
+                                   boxes=torch.tensor(boxes, dtype=torch.float32)))
+        return results
+
+
+class StubModels(dict):
+    """Replaces the model registry of detector.py with stub models."""
+
+    def __init__(self, latency_ms):
+        super().__init__()
+        self.latency_ms = latency_ms
+
+    def __missing__(self, size):
+        model = self[size] = StubModel(size, self.latency_ms)
+        return model
+
+    def prewarm(self, sizes):
+        for size in sizes:
+            self[size]
+
+
+class StageTimer:
+    """Times every call of the functions it wraps, per stage, for the scenario being run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._patches = []
+        self.samples = {}
+
+    def wrap(self, module, name, stage):
+        """Replaces a module function by a timed version of it until `restore` is called."""
+        original = getattr(module, name)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, (time.perf_counter() - start) * 1000)
+
+        setattr(module, name, timed)
+        self._patches.append((module, name, original))
+
+    def record(self, stage, milliseconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(milliseconds)
+
+    def restore(self):
+        for module, name, original in reversed(self._patches):
+            setattr(module, name, original)
+        self._patches = []
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+
+def distribution(samples):
+    """Summarizes latencies in milliseconds by their count, mean and percentiles."""
+    return {
+        'count': len(samples),
+        'mean_ms': float(np.mean(samples)) if samples else None,
+        'p50_ms': percentile(samples, 0.50),
+        'p90_ms': percentile(samples, 0.90),
+        'p99_ms': percentile(samples, 0.99),
+        'max_ms': max(samples) if samples else None,
+    }
+
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Kilobytes on Linux
+
+
+class Benchmark:
+    """
+    Sets up the stubbed environment and runs the scenarios.
+
+    Args:
+        images (List[numpy.ndarray]): The fixture images.
+        videos (List[str]): The fixture videos.
+        language (str): The language of the summaries.
+        stub_models (bool): Replace the models with StubModel.
+        stub_latency_ms (float): The delay of the smallest stub model.
+        simulate_playback (bool): Make the speech stubs take as long as speaking the text would.
+    """
+
+    def __init__(self, images, videos, language='fr', stub_models=False, stub_latency_ms=20.0,
+                 simulate_playback=False):
+        import audio
+        import detector
+        import main
+        from translation import TranslationCache
+
+        self.images = images
+        self.videos = videos
+        self.language = language
+        self.simulate_playback = simulate_playback
+        self.audio, self.detector, self.main = audio, detector, main
+
+        detector.translations = TranslationCache(None, translator_factory=lambda source, target: IdentityTranslator())
+        if stub_models:
+            detector.models = StubModels(stub_latency_ms)
+        self._phrases = {}
+        audio.synthesize_phrase = self._synthesize_phrase
+        audio.play_file = self._play_file
+
+        self.timer = StageTimer()
+        for module, name, stage in ((detector, 'decode_image', 'decode'), (detector, 'run_model', 'inference'),
+                                    (detector, 'translate_vocabulary', 'translation'),
+                                    (detector, 'encode_annotated_image', 'annotation'),
+                                    (detector, 'cascade_detect', 'cascade'),
+                                    (main, 'summarize', 'summarize'), (main, 'build_announcement', 'announcement'),
+                                    (audio, 'synthesize_phrase', 'tts_synthesis'), (audio, 'play_file', 'playback')):
+            self.timer.wrap(module, name, stage)
+
+    def _synthesize_phrase(self, text, language):
+        path = f'{language}:{len(self._phrases)}'
+        self._phrases[path] = text
+        return path
+
+    def _play_file(self, path):
+        if self.simulate_playback:
+            time.sleep(len(self._phrases.get(path, '').split()) / SIMULATED_WORDS_PER_SECOND)
+
+    def image(self, iteration):
+        return self.images[iteration % len(self.images)]
+
+    def run(self, name, scenario, iterations):
+        """
+        Runs a scenario and reports its stages.
+
+        Args:
+            name (str): The scenario name.
+            scenario (Callable[[int], None]): Runs one iteration.
+            iterations (int): The number of timed iterations, after one warm-up iteration.
+
+        Returns:
+            Dict: The 'iterations', the 'total' and per-stage latency distributions, the 'throughput_per_s'
+            and the 'peak_rss_bytes'.
+        """
+        scenario(0)  # Warm-up: loads the models and fills the translation table
+        self.timer.reset()
+        totals = []
+        start = time.perf_counter()
+        for iteration in range(iterations):
+            iteration_start = time.perf_counter()
+            scenario(iteration)
+            totals.append((time.perf_counter() - iteration_start) * 1000)
+        elapsed = time.perf_counter() - start
+        report = {
+            'iterations': iterations,
+            'total': distribution(totals),
+            'stages': {stage: distribution(samples) for stage, samples in sorted(self.timer.samples.items())},
+            'throughput_per_s': iterations / elapsed if elapsed else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+        print(f"{name}: p50 {report['total']['p50_ms']:.1f} ms, {report['throughput_per_s']:.2f}/s")
+        return report
+
+    def scenario_button_to_speech(self, iterations):
+        """Press the fake button, grab the latest camera frame, detect locally and speak the summary."""
+        import fake_gpio
+        from camera_capture import FrameGrabber
+        from detector_backend import LocalDetector
+        from gpio_handler_no_debounce import ButtonListener
+        from tts_backends import GTTSBackend
+
+        fake_gpio.setmode(fake_gpio.BCM)
+        fake_gpio.setup(BUTTON_PIN, fake_gpio.IN, pull_up_down=fake_gpio.PUD_UP)
+        fake_gpio.set_input(BUTTON_PIN, fake_gpio.HIGH)
+        button = ButtonListener(fake_gpio, BUTTON_PIN, debounce_ms=5)
+        button.start()
+        grabber = FrameGrabber(FixtureCamera(self.images))
+        grabber.start()
+        detector, tts = LocalDetector(), GTTSBackend()
+
+        def iteration(_):
+            fake_gpio.press(BUTTON_PIN, duration=0.02)
+            button.wait_for_press()
+            start = time.perf_counter()
+            frame, slot = grabber.latest()
+            self.timer.record('capture', (time.perf_counter() - start) * 1000)
+            try:
+                self.main.process_image(frame, self.language, detector, tts)
+            finally:
+                grabber.release(slot)
+
+        try:
+            return self.run('button_to_speech', iteration, iterations)
+        finally:
+            grabber.stop()
+            button.stop()
+            fake_gpio.cleanup()
+
+    def scenario_http_get_detections(self, iterations):
+        """Post raw frames to /get_detections through the Flask test client, with the result cache cleared."""
+        from image_io import RAW_BGR_MIMETYPE, SHAPE_HEADER, encode_raw_frame
+
+        client = self.detector.app.test_client()
+
+        def iteration(index):
+            self.detector.result_cache.clear()
+            start = time.perf_counter()
+            frame_bytes, shape = encode_raw_frame(self.image(index))
+            self.timer.record('frame_encode', (time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            ok, _ = cv2.imencode('.png', self.image(index))
+            self.timer.record('png_encode', (time.perf_counter() - start) * 1000)  # What older clients sent
+            start = time.perf_counter()
+            response = client.post('/get_detections?auto_select=true&min_confidence=0.5&layout=binary'
+                                   f'&target_language={self.language}', data=bytes(frame_bytes),
+                                   headers={'Content-Type': RAW_BGR_MIMETYPE, SHAPE_HEADER: shape})
+            self.timer.record('http', (time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(response.get_data(as_text=True))
+
+        return self.run('http_get_detections', iteration, iterations)
+
+    def scenario_detect_objects(self, iterations):
+        """Detect, translate and annotate with a fixed model size."""
+        return self.run('detect_objects', lambda index: self.detector.detect_objects(
+            self.image(index), 'en', self.language, model_size='n', annotate=True), iterations)
+
+    def scenario_get_best_model(self, iterations):
+        """Select the model size with the confidence cascade."""
+        return self.run('get_best_model', lambda index: self.detector.get_best_model(
+            self.image(index), 0.9, self.language, 'en'), iterations)
+
+    def scenario_detect_objects_in_video(self, iterations):
+        """Annotate a whole video with the pipelined engine, striding the inference."""
+        def iteration(index):
+            output = self.detector.detect_objects_in_video(self.videos[index % len(self.videos)], self.language,
+                                                           model_size='n', stride=3)
+            os.remove(output)
+
+        return self.run('detect_objects_in_video', iteration, iterations)
+
+    def scenario_synthesize_audio(self, iterations):
+        """Split, synthesize and play a typical summary with the speech stubs."""
+        text = ("Summary of inferences: 3 chairs located 2 to the left of the camera and towards the bottom "
+                "of the view, 1 in front of the camera and at the center of the view. 1 person located to "
+                "the right of the camera and at the center of the view.")
+        return self.run('synthesize_audio', lambda _: self.audio.synthesize_audio(text, 'en'), iterations)
+
+
+SCENARIOS = ('button_to_speech', 'http_get_detections', 'detect_objects', 'get_best_model',
+             'detect_objects_in_video', 'synthesize_audio')
+
+
+def compare_reports(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Lists how the median latencies changed since a baseline report.
+
+    Args:
+        current (Dict): The new report.
+        baseline (Dict): The baseline report.
+        threshold (float, optional): The relative slow-down flagged as a regression. Defaults to 10%.
+
+    Returns:
+        List[str]: One line per scenario and stage present in both reports.
+    """
+    lines = []
+    for name, scenario in current['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            continue
+        rows = [('total', scenario['total'], reference['total'])]
+        rows += [(stage, stats, reference['stages'][stage]) for stage, stats in scenario['stages'].items()
+                 if stage in reference['stages']]
+        for stage, stats, old in rows:
+            if not stats['p50_ms'] or not old['p50_ms']:
+                continue
+            change = stats['p50_ms'] / old['p50_ms'] - 1
+            flag = '  REGRESSION' if change > threshold else ''
+            lines.append(f"{name:<24} {stage:<16} {old['p50_ms']:9.2f} -> {stats['p50_ms']:9.2f} ms "
+                         f"({change:+.1%}){flag}")
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the capture-to-speech path offline.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'Comma separated scenarios. Defaults to all: {", ".join(SCENARIOS)}.')
+    parser.add_argument('--iterations', type=int, default=10, help='Timed iterations per scenario. Defaults to 10.')
+    parser.add_argument('--fixtures', help='Folder of recorded images and videos. Defaults to synthetic fixtures.')
+    parser.add_argument('--language', default='fr', help='Language of the summaries. Defaults to fr.')
+    parser.add_argument('--stub-models', action='store_true', help='Replace the models with fixed-latency stubs.')
+    parser.add_argument('--stub-latency-ms', type=float, default=20.0,
+                        help='Per-image latency of the smallest stub model. Defaults to 20.')
+    parser.add_argument('--simulate-playback', action='store_true',
+                        help='Make the speech stubs take as long as speaking the summaries would.')
+    parser.add_argument('--output', default=os.path.join('benchmarks', f'benchmark-{int(time.time())}.json'),
+                        help='Where the JSON report is saved.')
+    parser.add_argument('--compare', help='A previous JSON report to compare with.')
+    args = parser.parse_args()
+
+    fixture_images, fixture_videos = load_fixtures(args.fixtures, count=8)
+    if not fixture_images:
+        sys.exit(f"No fixture images in {args.fixtures}")
+    benchmark = Benchmark(fixture_images, fixture_videos, args.language, args.stub_models, args.stub_latency_ms,
+                          args.simulate_playback)
+
+    results = {}
+    for scenario_name in filter(None, args.scenarios.split(',')):
+        if scenario_name not in SCENARIOS:
+            sys.exit(f"Unknown scenario {scenario_name!r}, expected one of {SCENARIOS}")
+        if scenario_name == 'detect_objects_in_video' and not fixture_videos:
+            print("Skipping detect_objects_in_video, there is no fixture video")
+            continue
+        results[scenario_name] = getattr(benchmark, f'scenario_{scenario_name}')(args.iterations)
+    benchmark.timer.restore()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'cpus': os.cpu_count()},
+        'settings': {'iterations': args.iterations, 'fixtures': args.fixtures or 'synthetic',
+                     'language': args.language, 'stub_models': args.stub_models,
+                     'stub_latency_ms': args.stub_latency_ms, 'simulate_playback': args.simulate_playback,
+                     'runtime': benchmark.detector.INFERENCE_RUNTIME,
+                     'resolution_policy': benchmark.detector.RESOLUTION_POLICY},
+        'scenarios': results,
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Report saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            for line in compare_reports(report, json.load(baseline_file)):
+                print(line)
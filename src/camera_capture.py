@@ -0,0 +1,196 @@
+"""
+Module summary: Continuous camera capture into a ring buffer of preallocated frames.
+
+A dedicated thread reads the camera as fast as it delivers frames, so the V4L2 driver's internal queue
+never holds stale images and consumers always get the freshest frame without waiting for a read. Frames
+are decoded straight into a small ring of preallocated arrays. A consumer holds the slot it was given
+until it releases it, which keeps the writer off that slot without copying the frame.
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+SHARPNESS_SIZE = (160, 120)
+
+
+def sharpness(frame):
+    """Scores the sharpness of a BGR frame as the variance of the Laplacian of a small grayscale copy."""
+    gray = cv2.cvtColor(cv2.resize(frame, SHARPNESS_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class FrameGrabber:
+    """
+    Reads a camera on a background thread into a ring buffer.
+
+    Args:
+        camera (cv2.VideoCapture): An opened camera.
+        buffer_size (int, optional): Number of preallocated frames in the ring. Defaults to 4.
+        score_sharpness (bool, optional): Score every frame so that `sharpest` can be used. Defaults to True.
+    """
+
+    def __init__(self, camera, buffer_size=4, score_sharpness=True):
+        if buffer_size < 2:
+            raise ValueError("buffer_size must be at least 2")
+        self.camera = camera
+        self.buffer_size = buffer_size
+        self.score_sharpness = score_sharpness
+
+        self._buffers = []
+        self._sequence = [0] * buffer_size  # Capture number of the frame in each slot, 0 if empty
+        self._sharpness = [0.0] * buffer_size
+        self._consumed = [True] * buffer_size
+        self._holds = [0] * buffer_size
+        self._write_index = 0
+        self._frame_count = 0
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._fps = 0.0
+        self._last_capture_at = None
+        # Frames replaced in the ring before any consumer looked at them. Expected: a button-driven scanner
+        # only looks at the frame captured when the button is pressed, so nearly every frame is overwritten.
+        self.overwritten = 0
+        self.dropped = 0  # Frames discarded because consumers held every slot, a sign of frames not released
+        self.failures = 0  # Reads that returned no frame
+
+    def start(self):
+        """Allocates the ring from the first frame and starts the capture thread."""
+        if self._thread is not None:
+            return
+        ret, first = self.camera.read()
+        if not ret:
+            raise RuntimeError("Could not read a frame from the camera")
+        self._buffers = [np.empty_like(first) for _ in range(self.buffer_size)]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='frame-grabber', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the capture thread. The camera is left open."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _next_slot(self):
+        """Returns the next slot that no consumer holds, or None if they are all held. Must hold the lock."""
+        for offset in range(self.buffer_size):
+            index = (self._write_index + offset) % self.buffer_size
+            if self._holds[index] == 0:
+                return index
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                index = self._next_slot()
+                if index is not None:
+                    # The slot is invisible to consumers while it is being written
+                    self._sequence[index] = 0
+            if index is None:
+                self.camera.grab()  # Every slot is held, keep the driver queue drained anyway
+                self.dropped += 1
+                continue
+
+            slot = self._buffers[index]
+            ret, frame = self.camera.read(slot)
+            if not ret:
+                self.failures += 1
+                time.sleep(0.01)
+                continue
+            if frame is not slot:
+                # The resolution changed, the slot is reallocated by OpenCV
+                self._buffers[index] = frame
+            score = sharpness(frame) if self.score_sharpness else 0.0
+
+            now = time.monotonic()
+            with self._new_frame:
+                if self._last_capture_at is not None:
+                    interval = now - self._last_capture_at
+                    instant_fps = 1.0 / interval if interval > 0 else 0.0
+                    self._fps = instant_fps if self._fps == 0 else 0.9 * self._fps + 0.1 * instant_fps
+                self._last_capture_at = now
+
+                if not self._consumed[index]:
+                    self.overwritten += 1
+                self._frame_count += 1
+                self._sequence[index] = self._frame_count
+                self._sharpness[index] = score
+                self._consumed[index] = False
+                self._write_index = (index + 1) % self.buffer_size
+                self._new_frame.notify_all()
+
+    def _hold(self, index):
+        self._holds[index] += 1
+        self._consumed[index] = True
+        return self._buffers[index], index
+
+    def latest(self, timeout=1.0):
+        """
+        Returns the most recent frame without copying it.
+
+        The slot is held, so the capture thread will not overwrite it, until `release` is called with the
+        returned slot index.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the first frame. Defaults to 1.
+
+        Returns:
+            Tuple[numpy.ndarray, int]: The frame and its slot index, or (None, None) on timeout.
+        """
+        with self._new_frame:
+            if not self._new_frame.wait_for(lambda: any(self._sequence), timeout):
+                return None, None
+            index = max(range(self.buffer_size), key=lambda i: self._sequence[i])
+            return self._hold(index)
+
+    def sharpest(self, last_n=None, timeout=1.0):
+        """
+        Returns the sharpest of the most recent frames without copying it, holding its slot like `latest`.
+
+        Args:
+            last_n (int, optional): Number of recent frames to choose from. Defaults to the whole ring.
+            timeout (float, optional): Seconds to wait for the first frame. Defaults to 1.
+
+        Returns:
+            Tuple[numpy.ndarray, int]: The frame and its slot index, or (None, None) on timeout.
+        """
+        with self._new_frame:
+            if not self._new_frame.wait_for(lambda: any(self._sequence), timeout):
+                return None, None
+            filled = sorted((i for i in range(self.buffer_size) if self._sequence[i]),
+                            key=lambda i: self._sequence[i], reverse=True)
+            candidates = filled[:last_n] if last_n else filled
+            index = max(candidates, key=lambda i: self._sharpness[i])
+            return self._hold(index)
+
+    def release(self, index):
+        """Lets the capture thread reuse a slot returned by `latest` or `sharpest`."""
+        if index is None:
+            return
+        with self._lock:
+            self._holds[index] = max(0, self._holds[index] - 1)
+
+    def stats(self):
+        """
+        Reports the capture statistics.
+
+        Returns:
+            Dict[str, float]: The smoothed capture 'fps', the number of 'captured' frames, the number of
+            frames 'overwritten' in the ring before anyone looked at them, which is normal, the number of
+            frames 'dropped' because every slot was held, and the number of failed reads, 'failures'.
+        """
+        with self._lock:
+            return {'fps': self._fps, 'captured': self._frame_count, 'overwritten': self.overwritten,
+                    'dropped': self.dropped, 'failures': self.failures}
@@ -0,0 +1,232 @@
+"""
+Module summary: Fast camera discovery.
+
+Instead of opening cv2.VideoCapture on every index from 0 to 49, the V4L2 device nodes under /dev are
+enumerated and their capabilities queried directly, which filters out the codec, ISP and metadata nodes
+a Raspberry Pi exposes. The last device that worked is remembered, together with its resolution, in a
+small state file and tried first on the next start, with the same timeout as the probes, so a stale
+device cannot hang the start. Remaining candidates are probed in parallel, each with a timeout.
+"""
+
+import concurrent.futures
+import fcntl
+import glob
+import json
+import os
+import re
+import struct
+
+import cv2
+
+DEFAULT_STATE_FILE = './models/camera.json'
+PROBE_TIMEOUT_S = 3.0
+FALLBACK_INDICES = 10
+
+# struct v4l2_capability: driver[16], card[32], bus_info[32], version, capabilities, device_caps, reserved[3]
+_V4L2_CAPABILITY = struct.Struct('16s32s32sIII12x')
+_VIDIOC_QUERYCAP = 0x80685600  # _IOR('V', 0, struct v4l2_capability)
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+
+def _device_index(path):
+    match = re.search(r'(\d+)$', path)
+    return int(match.group(1)) if match else None
+
+
+def query_capabilities(path):
+    """
+    Queries the V4L2 capabilities of a device node.
+
+    Args:
+        path (str): The device node, e.g. '/dev/video0'.
+
+    Returns:
+        Dict: The 'path', 'index', 'driver', 'card', 'bus_info' and whether the node can 'capture' video,
+        or None if the node cannot be queried.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buffer = bytearray(_V4L2_CAPABILITY.size)
+        fcntl.ioctl(fd, _VIDIOC_QUERYCAP, buffer)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    driver, card, bus_info, _, capabilities, device_caps = _V4L2_CAPABILITY.unpack(buffer)
+    if capabilities & V4L2_CAP_DEVICE_CAPS:
+        capabilities = device_caps  # The capabilities of this node rather than of the whole device
+    return {
+        'path': path,
+        'index': _device_index(path),
+        'driver': driver.rstrip(b'\0').decode(errors='replace'),
+        'card': card.rstrip(b'\0').decode(errors='replace'),
+        'bus_info': bus_info.rstrip(b'\0').decode(errors='replace'),
+        'capture': bool(capabilities & V4L2_CAP_VIDEO_CAPTURE),
+    }
+
+
+def list_video_devices():
+    """
+    Lists the video capture nodes of the system.
+
+    Returns:
+        List[Dict]: The capabilities of every /dev/video* node that can capture video, sorted by index.
+    """
+    devices = [query_capabilities(path) for path in glob.glob('/dev/video*')]
+    devices = [device for device in devices if device is not None and device['capture']]
+    return sorted(devices, key=lambda device: device['index'] if device['index'] is not None else 1 << 30)
+
+
+def load_state(state_file=DEFAULT_STATE_FILE):
+    """Returns the remembered camera, as saved by `save_state`, or None."""
+    try:
+        with open(state_file, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(state, state_file=DEFAULT_STATE_FILE):
+    """Remembers the camera that worked, so that it is opened first next time."""
+    directory = os.path.dirname(state_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    temp_path = f"{state_file}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump(state, file)
+    os.replace(temp_path, state_file)
+
+
+def open_camera(index, width=None, height=None):
+    """
+    Opens a camera and checks that it delivers a frame.
+
+    Args:
+        index (int): The V4L2 device index.
+        width (int, optional): The requested frame width.
+        height (int, optional): The requested frame height.
+
+    Returns:
+        cv2.VideoCapture: The opened camera, or None if it cannot be opened or read.
+    """
+    camera = cv2.VideoCapture(index, cv2.CAP_V4L2)
+    if not camera.isOpened():
+        camera.release()
+        return None
+    if width and height:
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    ret, _ = camera.read()
+    if not ret:
+        camera.release()
+        return None
+    return camera
+
+
+def _describe(camera, index):
+    return {
+        'index': index,
+        'width': int(camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+
+
+def _release_when_done(future):
+    """Releases the camera of a probe that is still hanging once it eventually returns."""
+    future.add_done_callback(lambda done: done.result() and done.result().release())
+
+
+def open_camera_with_timeout(index, width=None, height=None, timeout=PROBE_TIMEOUT_S):
+    """
+    Opens a camera like `open_camera`, giving up if it takes longer than a timeout.
+
+    Args:
+        index (int): The V4L2 device index.
+        width (int, optional): The requested frame width.
+        height (int, optional): The requested frame height.
+        timeout (float, optional): Seconds to wait for the camera. Defaults to PROBE_TIMEOUT_S.
+
+    Returns:
+        cv2.VideoCapture: The opened camera, or None if it cannot be opened or read in time.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(open_camera, index, width, height)
+    executor.shutdown(wait=False)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        _release_when_done(future)
+        return None
+
+
+def probe_cameras(indices, timeout=PROBE_TIMEOUT_S):
+    """
+    Opens the candidate cameras in parallel and keeps the first one that delivers a frame.
+
+    Args:
+        indices (List[int]): The device indices to try, in order of preference.
+        timeout (float, optional): Seconds to wait for the probes. Defaults to PROBE_TIMEOUT_S.
+
+    Returns:
+        Tuple[cv2.VideoCapture, int]: The opened camera and its index, or (None, None).
+    """
+    if not indices:
+        return None, None
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(indices))
+    futures = {index: executor.submit(open_camera, index) for index in indices}
+    concurrent.futures.wait(futures.values(), timeout=timeout)
+
+    chosen, chosen_index = None, None
+    for index in indices:  # Preference order, regardless of which probe finished first
+        future = futures[index]
+        if not future.done():
+            continue
+        camera = future.result()
+        if camera is None:
+            continue
+        if chosen is None:
+            chosen, chosen_index = camera, index
+        else:
+            camera.release()
+
+    # Probes still hanging release their camera when they eventually return
+    for future in futures.values():
+        if not future.done():
+            _release_when_done(future)
+    executor.shutdown(wait=False)
+    return chosen, chosen_index
+
+
+def discover_camera(state_file=DEFAULT_STATE_FILE, timeout=PROBE_TIMEOUT_S):
+    """
+    Finds a working camera, trying the remembered one first.
+
+    Args:
+        state_file (str, optional): Where the last working camera is remembered.
+        timeout (float, optional): Seconds to wait for the remembered camera, then for the parallel probes.
+
+    Returns:
+        Tuple[cv2.VideoCapture, int]: The opened camera and its index, or (None, None) if none works.
+    """
+    state = load_state(state_file)
+    if state is not None:
+        camera = open_camera_with_timeout(state['index'], state.get('width'), state.get('height'), timeout)
+        if camera is not None:
+            return camera, state['index']
+        print(f"Remembered camera {state['index']} is unavailable, searching for another one")
+
+    indices = [device['index'] for device in list_video_devices() if device['index'] is not None]
+    if not indices:
+        indices = list(range(FALLBACK_INDICES))  # The device nodes cannot be enumerated, try the usual indices
+    if state is not None:
+        indices = [index for index in indices if index != state['index']]
+    camera, index = probe_cameras(indices, timeout)
+    if camera is not None:
+        save_state(_describe(camera, index), state_file)
+    return camera, index
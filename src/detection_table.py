@@ -0,0 +1,175 @@
+"""
+Module summary: Columnar representation of detections.
+
+The boxes of a model result are pulled out as NumPy arrays in a single transfer, and filtering, label
+lookup and position bucketing are done on whole columns instead of box by box. The table serializes to
+JSON as a handful of flat lists, plus a label table holding each detected class once, and can still
+produce the per-detection dictionaries that clients of /get_detections have always received.
+"""
+
+import numpy as np
+
+
+class DetectionTable:
+    """
+    The detections of one image, one array per attribute.
+
+    Args:
+        class_ids (numpy.ndarray): The (N,) class ids.
+        confidences (numpy.ndarray): The (N,) confidences.
+        boxes (numpy.ndarray): The (N, 4) x1, y1, x2, y2 boxes, in pixels.
+        names (Dict[int, str]): The object name of each class id, in the source language.
+        translated_names (Dict[int, str]): The object name of each class id, in the target language.
+        image_width (int): The width of the image the boxes refer to.
+        image_height (int): The height of the image the boxes refer to.
+    """
+
+    def __init__(self, class_ids, confidences, boxes, names, translated_names, image_width, image_height):
+        self.class_ids = np.asarray(class_ids, dtype=np.int32)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.names = names
+        self.translated_names = translated_names
+        self.image_width = int(image_width)
+        self.image_height = int(image_height)
+
+    @classmethod
+    def from_result(cls, result, names, translated_names):
+        """
+        Builds the table of a model result.
+
+        Args:
+            result (ultralytics.engine.results.Results): The result returned by the model for one image.
+            names (Dict[int, str]): The object name of each class id, in the source language.
+            translated_names (Dict[int, str]): The object name of each class id, in the target language.
+
+        Returns:
+            DetectionTable: The table.
+        """
+        data = result.boxes.data.cpu().numpy()  # Rows of x1, y1, x2, y2, confidence, class
+        height, width = result.orig_shape
+        return cls(data[:, 5], data[:, 4], data[:, :4], names, translated_names, width, height)
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def select(self, mask):
+        """Returns the table of the detections selected by a boolean mask or an index array."""
+        return DetectionTable(self.class_ids[mask], self.confidences[mask], self.boxes[mask], self.names,
+                              self.translated_names, self.image_width, self.image_height)
+
+    def above(self, min_confidence):
+        """Returns the table of the detections whose confidence is at least `min_confidence`."""
+        return self.select(self.confidences >= min_confidence)
+
+    def labels(self, translated=True):
+        """
+        Looks up the object name of every detection.
+
+        Args:
+            translated (bool, optional): Use the names in the target language. Defaults to True.
+
+        Returns:
+            numpy.ndarray: The (N,) names.
+        """
+        table = self.translated_names if translated else self.names
+        unique_ids, inverse = np.unique(self.class_ids, return_inverse=True)
+        lookup = np.array([table.get(int(class_id), 'unknown') for class_id in unique_ids], dtype=object)
+        return lookup[inverse]
+
+    def centers(self):
+        """Returns the (N, 2) x, y centers of the boxes."""
+        return (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+
+    def grid_cells(self, columns=3, rows=3):
+        """
+        Buckets the box centers into a grid laid over the image.
+
+        Args:
+            columns (int, optional): The number of columns, from left to right. Defaults to 3.
+            rows (int, optional): The number of rows, from top to bottom. Defaults to 3.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The (N,) column and the (N,) row of each detection.
+        """
+        centers = self.centers()
+        column = np.floor(centers[:, 0] * columns / max(self.image_width, 1)).astype(np.int32)
+        row = np.floor(centers[:, 1] * rows / max(self.image_height, 1)).astype(np.int32)
+        return np.clip(column, 0, columns - 1), np.clip(row, 0, rows - 1)
+
+    def to_columns(self):
+        """
+        Serializes the table into JSON-compatible columns.
+
+        Returns:
+            Dict: The 'class_ids', the 'confidences', the 'boxes' flattened as x1, y1, x2, y2 per detection,
+            the 'names' and 'translated_names' of the detected classes keyed by class id, and the
+            'image_width' and 'image_height'.
+        """
+        present = np.unique(self.class_ids).tolist()
+        return {
+            'class_ids': self.class_ids.tolist(),
+            'confidences': np.round(self.confidences.astype(np.float64), 4).tolist(),
+            'boxes': np.round(self.boxes.astype(np.float64), 1).ravel().tolist(),
+            'names': {str(class_id): self.names.get(class_id, 'unknown') for class_id in present},
+            'translated_names': {str(class_id): self.translated_names.get(class_id, 'unknown')
+                                 for class_id in present},
+            'image_width': self.image_width,
+            'image_height': self.image_height,
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Rebuilds a table serialized with `to_columns`.
+
+        Args:
+            columns (Dict): The serialized table.
+
+        Returns:
+            DetectionTable: The table.
+        """
+        return cls(columns['class_ids'], columns['confidences'], columns['boxes'],
+                   {int(class_id): name for class_id, name in columns['names'].items()},
+                   {int(class_id): name for class_id, name in columns['translated_names'].items()},
+                   columns['image_width'], columns['image_height'])
+
+    @classmethod
+    def from_records(cls, records, image_width, image_height):
+        """
+        Builds a table from per-detection dictionaries, see `to_records`.
+
+        The dictionaries carry no class ids, so each distinct object name is given its own id.
+
+        Args:
+            records (List[Dict]): The detections, with 'name', 'confidence', 'box' and 'translated_name' keys.
+            image_width (int): The width of the image the boxes refer to.
+            image_height (int): The height of the image the boxes refer to.
+
+        Returns:
+            DetectionTable: The table.
+        """
+        ids = {}
+        for record in records:
+            ids.setdefault(record.get('name', 'unknown'), len(ids))
+        names = {class_id: name for name, class_id in ids.items()}
+        translated_names = {ids[record.get('name', 'unknown')]: record.get('translated_name', 'unknown')
+                            for record in records}
+        boxes = [np.asarray(record.get('box', [0, 0, 0, 0]), dtype=np.float32).reshape(4) for record in records]
+        return cls([ids[record.get('name', 'unknown')] for record in records],
+                   [record.get('confidence', 0.0) for record in records],
+                   np.asarray(boxes, dtype=np.float32), names, translated_names, image_width, image_height)
+
+    def to_records(self):
+        """
+        Converts the table into one dictionary per detection, the historical format of /get_detections.
+
+        Returns:
+            List[Dict[str, Union[str, float, List[List[float]]]]]: The detections, with their 'name',
+            'confidence', 'box' nested as [[x1, y1, x2, y2]] and 'translated_name'.
+        """
+        return [{'name': name, 'confidence': confidence, 'box': [box], 'translated_name': translated_name}
+                for name, confidence, box, translated_name in zip(self.labels(translated=False).tolist(),
+                                                                   self.confidences.tolist(),
+                                                                   self.boxes.tolist(),
+                                                                   self.labels().tolist())]
@@ -10,76 +10,93 @@ Citation:
   arXiv preprint arXiv:2405.14458, 2024
 """
 
+import io
 import os
 import tempfile
 import threading
+import time
 
 import cv2
 import numpy as np
-import wget
-from PIL import Image
 from deep_translator import GoogleTranslator
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
 #import sys
 #sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
-from ultralytics import YOLOv10
+from annotation import draw_detections, encode_jpeg, scratch_buffer
+from batching import BatchScheduler
+from detection_table import DetectionTable
+from image_io import RAW_BGR_MIMETYPE, SHAPE_HEADER, decode_image
+from janitor import FileJanitor
+from model_registry import ModelRegistry
+from resolution import ResolutionPolicy
+from result_cache import ResultCache, image_digest
+from runtimes import create_loader
+import telemetry
+from video_pipeline import VideoPipeline
+import wire
+from translation import TranslationCache
 
 app = Flask(__name__)
 #app.run(debug=False)
-# Dictionary to keep track of file creation times
-file_creation_times = {}
 
 # List of model sizes in ascending order
 model_sizes = ['n', 's', 'm', 'b', 'l', 'x']
 model_urls = {size: f'https://github.com/THU-MIG/yolov10/releases/download/v1.1/yolov10{size}.pt' for size in
               model_sizes}
-models = {}
-
 # Ensure the necessary directories exist
 UPLOAD_FOLDER = './uploads'
+TEMP_FOLDER = os.path.join(UPLOAD_FOLDER, 'tmp')  # Generated outputs, e.g. annotated videos
 MODEL_FOLDER = './models'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+if not os.path.exists(TEMP_FOLDER):
+    os.makedirs(TEMP_FOLDER)
 if not os.path.exists(MODEL_FOLDER):
     os.makedirs(MODEL_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MODEL_FOLDER'] = MODEL_FOLDER
 
-# Ensure the models are downloaded and loaded
-for size in model_sizes:
-    model_path = os.path.join(MODEL_FOLDER, f'yolov10{size}.pt')
-    if not os.path.exists(model_path):
-        print(f"Downloading model {model_path}...")
-        wget.download(model_urls[size], model_path)
-    models[size] = YOLOv10(model_path)
+# Uploaded and generated files are deleted after UPLOAD_MAX_AGE_MINUTES, or earlier, oldest first, when they
+# take more than UPLOAD_QUOTA_MB. Files left by a previous run are picked up again on startup.
+UPLOAD_MAX_AGE_MINUTES = float(os.environ.get('UPLOAD_MAX_AGE_MINUTES', 60))
+UPLOAD_QUOTA_MB = float(os.environ.get('UPLOAD_QUOTA_MB', 512))
+janitor = FileJanitor(UPLOAD_FOLDER, UPLOAD_MAX_AGE_MINUTES * 60, int(UPLOAD_QUOTA_MB * 1024 * 1024))
+janitor.start()
+
+# Models are downloaded and loaded the first time a size is requested, the least recently used
+# ones are evicted once their weights exceed the memory budget
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 256))
+PREWARM_MODEL_SIZES = [size for size in os.environ.get('PREWARM_MODEL_SIZES', 'n').split(',') if size]
+# The models run with PyTorch by default. INFERENCE_RUNTIME=onnx exports them to ONNX Runtime and onnx-int8
+# also quantizes them, calibrated on the frames of CALIBRATION_FOLDER. Exports are cached next to the weights.
+INFERENCE_RUNTIME = os.environ.get('INFERENCE_RUNTIME', 'torch')
+CALIBRATION_FOLDER = os.path.join(MODEL_FOLDER, 'calibration')
+models = ModelRegistry(MODEL_FOLDER, model_sizes, model_urls, memory_budget_mb=MODEL_MEMORY_BUDGET_MB,
+                       loader=create_loader(INFERENCE_RUNTIME, CALIBRATION_FOLDER))
+
+# Label translations are memoized and persisted, set TRANSLATION_OFFLINE=1 to only use the pre-built table
+TRANSLATION_CACHE_PATH = os.path.join(MODEL_FOLDER, 'translations.json')
+translations = TranslationCache(TRANSLATION_CACHE_PATH, offline=os.environ.get('TRANSLATION_OFFLINE') == '1')
 
 DEFAULT_MINIMUM_INFERENCE = 0.9
+# Number of frames sampled across a video to select its model size, and the fraction of their detections that
+# must reach the minimum confidence for a size to be selected
+VIDEO_SAMPLE_FRAMES = 5
+VIDEO_SELECTION_QUORUM = 0.9
+# Padding added around a low-confidence box, as a fraction of its size, before it is re-scored by a larger model
+CASCADE_CROP_PADDING = 0.15
+# Minimum overlap between a re-scored box and the original box for the two to be considered the same object
+CASCADE_MATCH_IOU = 0.5
+# Crops narrower or shorter than this, in pixels, e.g. of degenerate boxes or boxes clamped at the image edge,
+# are not re-scored and their detection from the smaller model is kept
+CASCADE_MIN_CROP_SIZE = 8
+# Size of the cache of detection results and annotated images, keyed by the content of the uploaded image
+RESULT_CACHE_MB = float(os.environ.get('RESULT_CACHE_MB', 64))
+# Quality of the annotated JPEG images, from 0 to 100
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 90))
 # Maximum file size configuration for FLASK
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB limit for uploads
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-#TODO: allow creations if the file size differs (because that means its a different language on the bounded boxes)
-def should_create_new_file(filename, timeout=60):
-    """
-    Determines if a new annotated file should be created based on the creation time of the existing file.
-
-    Args:
-        filename (str): The name of the file to check.
-        timeout (int): The time duration in seconds to check against.
-
-    Returns:
-        bool: True if a new file should be created, False otherwise.
-    """
-    current_time = datetime.now()
-    if filename in file_creation_times:
-        creation_time = file_creation_times[filename]
-        if (current_time - creation_time).total_seconds() < timeout:
-            return False
-    return True
-
-
 @app.route('/supported_languages', methods=['GET', 'POST'])
 def supported_languages():
     """
@@ -115,6 +132,9 @@ def translate_name(name, target_language, source_language):
     """
     Translates a given name from the Source Language to the specified target language using the Deep-Learning Language class.
 
+    Translations are served from the persistent translation table, the translator is only contacted for
+    names that have never been translated for this language pair.
+
     Args:
         source_language: The source language to translate from
         name (str): The name to be translated.
@@ -122,30 +142,255 @@ def translate_name(name, target_language, source_language):
 
     Returns:
         str: The translated name if successful, otherwise the original name.
+    """
+    return translations.translate(name, target_language=target_language, source_language=source_language)
+
+
+def translate_vocabulary(names, source_language, target_language, class_ids=None):
+    """
+    Translates a model's whole class vocabulary, only contacting the translator for the classes that are used.
+
+    The names of `class_ids` are translated in bulk if they were never translated, see
+    `TranslationCache.translate_vocabulary`. The other names are taken from the translation table, so the
+    result always covers the whole vocabulary and only changes when a class is translated for the first time.
+
+    Args:
+        names (Dict[int, str]): The class names of the model, indexed by class id.
+        source_language (str): The source language to translate from.
+        target_language (str): The target language code to translate the names into.
+        class_ids (Iterable[int], optional): The class ids to translate now, e.g. those that were detected.
+            Defaults to the whole vocabulary.
+
+    Returns:
+        Tuple[Dict[int, str], Dict[int, str]]: The names in the source language and the translated names,
+        both indexed by class id.
+    """
+    ids = list(names)
+    needed = ids if class_ids is None else {int(class_id) for class_id in class_ids}
+    with telemetry.span('translation'):
+        english_names = [names[class_id] for class_id in ids]
+        source_list = translations.translate_vocabulary(english_names, target_language=source_language,
+                                                        source_language='en',
+                                                        needed=[names[class_id] for class_id in needed])
+        source_names = dict(zip(ids, source_list))
+        translated_list = translations.translate_vocabulary(source_list, target_language=target_language,
+                                                            source_language=source_language,
+                                                            needed=[source_names[class_id] for class_id in needed])
+    return source_names, dict(zip(ids, translated_list))
+
+
+# The ultralytics predictor of a model keeps per-call state (arguments, dataset, batch), so a model must not
+# run on two threads at once, e.g. the batch workers of two input sizes or a video alongside a request
+_model_locks = {size: threading.Lock() for size in model_sizes}
+
+
+def call_model(model_size, images, imgsz=None):
+    """
+    Runs a model size, one call at a time per size.
+
+    Args:
+        model_size (str): The size of the model.
+        images (Union[str, numpy.ndarray, List[numpy.ndarray]]): The image path, BGR image, or batch of BGR images.
+        imgsz (int, optional): The input size the images are resized to. Defaults to the model's own.
+
+    Returns:
+        List[ultralytics.engine.results.Results]: One result per input image.
+    """
+    model = models[model_size]
+    with _model_locks[model_size]:
+        if imgsz:
+            return model(images, verbose=False, imgsz=int(imgsz))
+        return model(images, verbose=False)
+
+
+def _run_batch(batch_key, images):
+    """Runs a model size on a batch of images, used by the batch scheduler. Keys are 'size' or 'size@imgsz'."""
+    model_size, _, imgsz = batch_key.partition('@')
+    return call_model(model_size, images, int(imgsz) if imgsz else None)
+
+
+# Concurrent requests for the same model size are grouped into batches of up to BATCH_MAX_SIZE images,
+# waiting at most BATCH_MAX_WAIT_MS for a batch to fill. Set BATCHING=0 to run every request on its own.
+BATCHING_ENABLED = os.environ.get('BATCHING', '1') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+batch_scheduler = BatchScheduler(_run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+# With RESOLUTION_POLICY=adaptive, images are first run at ADAPTIVE_LOW_IMGSZ, and again at ADAPTIVE_HIGH_IMGSZ,
+# on tiles for large images, only where small or uncertain objects were found. "fixed" runs the model's own size.
+RESOLUTION_POLICY = os.environ.get('RESOLUTION_POLICY', 'fixed')
+ADAPTIVE_LOW_IMGSZ = int(os.environ.get('ADAPTIVE_LOW_IMGSZ', 320))
+ADAPTIVE_HIGH_IMGSZ = int(os.environ.get('ADAPTIVE_HIGH_IMGSZ', 640))
+
+
+def read_image_file(path):
+    """
+    Reads an image file from disk.
+
+    Args:
+        path (str): The path of the image.
+
+    Returns:
+        numpy.ndarray: The BGR image.
 
     Raises:
-        Exception: If there is an error during the translation process.
+        FileNotFoundError: If the image cannot be read.
     """
-    try:
-        translated_text = GoogleTranslator(source=source_language, target=target_language).translate(name)
-        return translated_text
-    except Exception as e:
-        print(f"Translation error: {e}")
-        return name  # Return original name if translation fails
+    with telemetry.span('file_read'):
+        image = cv2.imread(path)
+    if image is None:
+        raise FileNotFoundError(f"Could not read image: {path}")
+    return image
+
+
+def run_model(image, model_size='n', imgsz=None, batching=None):
+    """
+    Runs a single model size on an image, a list of images, or an image path.
+
+    When batching is on, the images are queued and run together with those of concurrent requests
+    for the same model size and input size. Either way, a model size runs one call at a time, see `call_model`.
+
+    Args:
+        image (Union[str, numpy.ndarray, List[numpy.ndarray]]): The image path, BGR image, or batch of BGR images.
+        model_size (str, optional): The size of the model to use for detection. Defaults to 'n'.
+        imgsz (int, optional): The input size the images are resized to. Defaults to the model's own.
+        batching (bool, optional): Whether to batch the images with those of concurrent requests, e.g. False
+            for a caller that never has concurrent requests. Defaults to BATCHING_ENABLED.
+
+    Returns:
+        List[ultralytics.engine.results.Results]: One result per input image.
+
+    Raises:
+        FileNotFoundError: If the image path cannot be read.
+    """
+    if not (BATCHING_ENABLED if batching is None else batching):
+        with telemetry.span('inference', model_size):
+            return call_model(model_size, image, imgsz)
 
+    if isinstance(image, str):
+        image = read_image_file(image)
+    images = image if isinstance(image, list) else [image]
+    with telemetry.span('inference', model_size):
+        return batch_scheduler.submit(f'{model_size}@{imgsz}' if imgsz else model_size, images)
 
-def detect_objects(image_path, source_language, target_language, model_size='n'):
+
+def infer(image, model_size='n', batching=None):
+    """
+    Runs a model size on a whole image, following the RESOLUTION_POLICY.
+
+    Args:
+        image (Union[str, numpy.ndarray]): The image path, or the BGR image.
+        model_size (str, optional): The size of the model to use for detection. Defaults to 'n'.
+        batching (bool, optional): Whether to batch with concurrent requests, see `run_model`. Defaults to
+            BATCHING_ENABLED.
+
+    Returns:
+        Tuple[ultralytics.engine.results.Results, List[Dict]]: The result, and for each pass of the adaptive
+        policy its 'imgsz', the number of 'inputs' it ran on and its 'latency_ms'. Empty with the fixed policy.
+
+    Raises:
+        FileNotFoundError: If the image cannot be read or the model returns no results.
+    """
+    if RESOLUTION_POLICY != 'adaptive':
+        results = run_model(image, model_size, batching=batching)
+        if not results or len(results) == 0:
+            description = image if isinstance(image, str) else f"in-memory image {getattr(image, 'shape', '')}"
+            raise FileNotFoundError(f"No results returned from model for {description}")
+        return results[0], []
+
+    if isinstance(image, str):
+        image = read_image_file(image)
+
+    first_results = []
+
+    def run(images, imgsz):
+        results = run_model(images, model_size, imgsz, batching)
+        if not first_results:
+            first_results.extend(results)
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+    policy = ResolutionPolicy(run, low_imgsz=ADAPTIVE_LOW_IMGSZ, high_imgsz=ADAPTIVE_HIGH_IMGSZ)
+    detections, resolution_latencies = policy.detect(image)
+    result = first_results[0]  # The first pass ran on the whole image
+    result.update(boxes=result.boxes.data.new_tensor(detections))
+    return result, resolution_latencies
+
+
+def format_resolution_latencies(resolution_latencies):
+    """Formats the passes of the adaptive policy as '320=8.1,640x3=30.2' for use in a response header."""
+    return ','.join(f"{timing['imgsz']}" + (f"x{timing['inputs']}" if timing['inputs'] > 1 else '')
+                    + f"={timing['latency_ms']:.1f}" for timing in resolution_latencies)
+
+
+def build_detection_table(result, source_language, target_language):
+    """
+        Converts the boxes of a model result into a columnar table with translated names.
+
+        The table holds the names of the whole vocabulary, but only the detected classes are translated.
+
+        Args:
+            result (ultralytics.engine.results.Results): The result returned by the model for one image.
+            source_language (str): The source language to translate from.
+            target_language (str): The target language code to translate the object names into.
+
+        Returns:
+            DetectionTable: The detections, one array per attribute.
+    """
+    # Translated from English to the actual source language, as we don't have a hardcoded list of all the objects in every language available.
+    class_ids = np.unique(result.boxes.cls.cpu().numpy()).astype(int)
+    source_names, translated_names = translate_vocabulary(result.names, source_language, target_language, class_ids)
+    return DetectionTable.from_result(result, source_names, translated_names)
+
+
+def build_detections(result, source_language, target_language):
+    """
+        Converts the boxes of a model result into detection dictionaries with translated names.
+
+        Args:
+            result (ultralytics.engine.results.Results): The result returned by the model for one image.
+            source_language (str): The source language to translate from.
+            target_language (str): The target language code to translate the object names into.
+
+        Returns:
+            List[Dict[str, Union[str, float, List[int]]]]: The detections, see `detect_objects`.
+    """
+    return build_detection_table(result, source_language, target_language).to_records()
+
+
+def encode_annotated_image(image, table, quality=None):
+    """
+    Draws the detections onto an image and encodes it as a JPEG, without going through the disk.
+
+    The boxes are drawn into a buffer reused across the calls of the thread, the image itself is left untouched.
+
+    Args:
+        image (numpy.ndarray): The BGR image the boxes were detected in.
+        table (DetectionTable): The detections to draw, labelled with their translated names.
+        quality (int, optional): The JPEG quality. Defaults to JPEG_QUALITY.
+
+    Returns:
+        bytes: The annotated image, encoded as a JPEG.
+    """
+    with telemetry.span('annotation'):
+        annotated = draw_detections(image, table.boxes, table.class_ids, table.confidences,
+                                    table.labels(), out=scratch_buffer(image.shape, image.dtype))
+    with telemetry.span('jpeg_encode'):
+        return encode_jpeg(annotated, JPEG_QUALITY if quality is None else quality)
+
+
+def detect_objects(image_path, source_language, target_language, model_size='n', annotate=False):
     """
         Detects objects in an image using a specified model size and translates the object names to the target language.
 
         Args:
             source_language: The source language to translate from
-            image_path (str): The path to the image file.
+            image_path (Union[str, numpy.ndarray]): The path to the image file, or the image as a BGR array.
             model_size (str, optional): The size of the model to use for detection. Defaults to 'n'.
             target_language (str, optional): The target language code to translate the object names into. Defaults to 'en'.
+            annotate (bool, optional): Also draw the detections and encode the image. Defaults to False.
 
         Returns:
-            Tuple[PIL.Image.Image, List[Dict[str, Union[str, float, List[int]]]]]: A tuple containing the annotated image as a PIL Image object and a list of dictionaries representing the detected objects. Each dictionary contains the following keys:
+            Tuple[Optional[bytes], List[Dict[str, Union[str, float, List[int]]]]]: A tuple containing the annotated image encoded as a JPEG, None unless `annotate` is set, and a list of dictionaries representing the detected objects. Each dictionary contains the following keys:
                 - 'name' (str): The name of the detected object.
                 - 'confidence' (float): The confidence score of the detection.
                 - 'box' (List[int]): The bounding box coordinates of the detected object.
@@ -153,36 +398,139 @@ def detect_objects(image_path, source_language, target_language, model_size='n')
 
         Raises:
             FileNotFoundError: If no results are returned from the model for the given image path.
-            TypeError: If the annotated image is not a numpy array.
 
     """
-    model = models[model_size]
-    print(f"Using model size: {model_size} for detection in: {image_path}")
-    results = model(image_path)
-
-    if not results or len(results) == 0:
-        raise FileNotFoundError(f"No results returned from model for image path: {image_path}")
-
-    annotated_image = results[0].plot()
-    detections = []
-    for box in results[0].boxes:
-        detection = {
-            'name': translate_name(results[0].names[int(box.cls)], source_language='en', target_language=source_language), # Translate from English to the actual source language, as we don't have a hardcoded list of all the objects in every language available.
-            'confidence': float(box.conf),
-            'box': box.xyxy.tolist(),
-            'translated_name': translate_name(name=results[0].names[int(box.cls)], target_language=target_language, source_language=source_language)  # Add translated name of the object
-        }
-        print(type(detection['box']))
-        print(detection['box'])
-        print(detection['name'])
-        detections.append(detection)
+    result, resolution_latencies = infer(image_path, model_size)
+    telemetry.log('detect', model_size=model_size, source=image_path if isinstance(image_path, str) else None,
+                  detections=len(result.boxes), resolution_latencies=resolution_latencies)
+
+    table = build_detection_table(result, source_language, target_language)
+    jpeg = encode_annotated_image(result.orig_img, table) if annotate else None
+    return jpeg, table.to_records()
+
+
+def _box_iou(box, boxes):
+    """Returns the intersection over union between one xyxy box and an (N, 4) array of xyxy boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def _crop_around(image, box, padding):
+    """Crops a padded region around an xyxy box, returning the crop and its top-left offset in the image."""
+    height, width = image.shape[:2]
+    pad_x = (box[2] - box[0]) * padding
+    pad_y = (box[3] - box[1]) * padding
+    x1 = int(max(0, box[0] - pad_x))
+    y1 = int(max(0, box[1] - pad_y))
+    x2 = int(min(width, box[2] + pad_x))
+    y2 = int(min(height, box[3] + pad_y))
+    return image[y1:y2, x1:x2], (x1, y1)
+
+
+def cascade_detect(image_path, min_confidence, source_language, target_language, batching=None):
+    """
+    Detects objects with the smallest model and escalates only the uncertain detections to larger models.
 
-    if isinstance(annotated_image, np.ndarray):
-        annotated_image_pil = Image.fromarray(annotated_image)
-    else:
-        raise TypeError("Annotated image is not a numpy array")
+    The whole image is processed once by the smallest model, following the RESOLUTION_POLICY. Every detection whose confidence is below
+    `min_confidence` is cropped out, with some padding, and the crops are re-scored as a single batch by the
+    next model size. A re-scored box replaces the original one when it overlaps it and is more confident.
+    Detections whose crop would be smaller than CASCADE_MIN_CROP_SIZE keep their first score.
+    This repeats with larger sizes until every detection clears the threshold or the sizes run out, so each
+    model size runs at most once per request.
+
+    Args:
+        image_path (Union[str, numpy.ndarray]): The path to the image, or the image as a BGR array.
+        min_confidence (float): The minimum confidence score to consider a detection as valid.
+        source_language (str): The source language to translate from.
+        target_language (str): The target language code to translate the object names into.
+        batching (bool, optional): Whether to batch with concurrent requests, see `run_model`. Defaults to
+            BATCHING_ENABLED.
 
-    return annotated_image_pil, detections
+    Returns:
+        Dict: A dictionary with the following keys:
+            - 'model_size' (str): The largest model size that had to be consulted.
+            - 'result' (ultralytics.engine.results.Results): The merged result, ready for annotation.
+            - 'table' (DetectionTable): The detections, one array per attribute.
+            - 'detections' (List[Dict]): The detections, see `detect_objects`.
+            - 'tier_latencies' (List[Dict]): For each model size that ran, its 'model_size', the number of
+              'inputs' it processed and its 'latency_ms'.
+            - 'resolution_latencies' (List[Dict]): The passes of the adaptive resolution policy over the
+              whole image, see `infer`.
+
+    Raises:
+        FileNotFoundError: If the image cannot be read or the model returns no results.
+    """
+    image = read_image_file(image_path) if isinstance(image_path, str) else image_path
+    if image is None:
+        raise FileNotFoundError(f"Could not read image: {image_path}")
+
+    tier_latencies = []
+    used_size = model_sizes[0]
+    start = time.perf_counter()
+    result, resolution_latencies = infer(image, used_size, batching)
+    tier_latencies.append({'model_size': used_size, 'inputs': 1,
+                           'latency_ms': (time.perf_counter() - start) * 1000})
+
+    data = result.boxes.data.clone()  # Rows of x1, y1, x2, y2, confidence, class
+    pending = [i for i in range(len(data)) if float(data[i, 4]) < min_confidence]
+    too_small = []
+
+    for size in model_sizes[1:]:
+        crops, offsets, escalated = [], [], []
+        for i in pending:
+            crop, offset = _crop_around(image, data[i, :4].tolist(), CASCADE_CROP_PADDING)
+            if min(crop.shape[:2]) < CASCADE_MIN_CROP_SIZE:
+                too_small.append(i)
+                continue
+            crops.append(crop)
+            offsets.append(offset)
+            escalated.append(i)
+        pending = escalated
+        if not pending:
+            break
+
+        CASCADE_ESCALATIONS.inc(len(crops), model_size=size)
+        start = time.perf_counter()
+        crop_results = run_model(crops, size, batching=batching)
+        tier_latencies.append({'model_size': size, 'inputs': len(crops),
+                               'latency_ms': (time.perf_counter() - start) * 1000})
+        used_size = size
+
+        still_pending = []
+        for i, crop_result, (offset_x, offset_y) in zip(pending, crop_results, offsets):
+            candidates = crop_result.boxes.data.cpu().numpy()
+            if len(candidates):
+                candidates[:, [0, 2]] += offset_x
+                candidates[:, [1, 3]] += offset_y
+                overlaps = _box_iou(data[i, :4].cpu().numpy(), candidates[:, :4])
+                best = int(np.argmax(overlaps))
+                if overlaps[best] >= CASCADE_MATCH_IOU and candidates[best, 4] > float(data[i, 4]):
+                    data[i] = data.new_tensor(candidates[best, :6])
+            if float(data[i, 4]) < min_confidence:
+                still_pending.append(i)
+        pending = still_pending
+
+    result.update(boxes=data)
+    CASCADE_RESULTS.inc(model_size=used_size)
+    telemetry.log('cascade', model_sizes=[tier['model_size'] for tier in tier_latencies], tier_latencies=tier_latencies,
+                  detections=len(data), below_min_confidence=len(pending) + len(too_small), too_small=len(too_small),
+                  min_confidence=min_confidence)
+
+    table = build_detection_table(result, source_language, target_language)
+    return {
+        'model_size': used_size,
+        'result': result,
+        'table': table,
+        'detections': table.to_records(),
+        'tier_latencies': tier_latencies,
+        'resolution_latencies': resolution_latencies,
+    }
 
 
 def choose_model_based_on_confidence(detections, min_confidence):
@@ -211,6 +559,9 @@ def get_best_model(image_path, min_confidence, target_language, source_language)
     """
     Get the best model for the given image path based on the confidence levels of the detections.
 
+    The detection runs through `cascade_detect`, so each model size is used at most once and only on the
+    detections that the smaller sizes were unsure about.
+
     Args:
         image_path (str): The path to the image.
         min_confidence (float): The minimum confidence score to consider a detection as valid.
@@ -225,98 +576,270 @@ def get_best_model(image_path, min_confidence, target_language, source_language)
 
             If no model meets the minimum confidence requirement, the last model size in the `model_sizes` list is returned along with the detections.
     """
-    for size in model_sizes:
-        _, detections = detect_objects(image_path, source_language, target_language, model_size=size)
-        if all(d['confidence'] >= min_confidence for d in detections):
-            return size, detections
-    return model_sizes[-1], detections
+    cascade = cascade_detect(image_path, min_confidence, source_language, target_language)
+    return cascade['model_size'], cascade['detections']
+
+
+def format_tier_latencies(tier_latencies):
+    """Formats the per-tier latencies of a cascade as 'n=12.3,s=45.6' for use in a response header."""
+    return ','.join(f"{tier['model_size']}={tier['latency_ms']:.1f}" for tier in tier_latencies)
+
+
+def _cached_result_size(entry):
+    """Approximates the memory used by a cached detection result, in bytes."""
+    table = entry['table']
+    return len(entry['jpeg'] or b'') + table.boxes.nbytes + table.confidences.nbytes + table.class_ids.nbytes
+
+
+result_cache = ResultCache(int(RESULT_CACHE_MB * 1024 * 1024), sizeof=_cached_result_size)
+
+# Metrics exposed at /metrics. Stage latencies are recorded by telemetry.span, the state of the result cache,
+# the janitor, the models and the batch scheduler is read from their statistics when the metrics are scraped.
+REQUEST_SECONDS = telemetry.registry.histogram('detector_request_seconds', 'Time spent serving the requests.',
+                                               ('route',))
+REQUESTS = telemetry.registry.counter('detector_requests_total', 'Requests served, by route and status.',
+                                      ('route', 'status'))
+CASCADE_ESCALATIONS = telemetry.registry.counter(
+    'detector_cascade_escalations_total', 'Detections re-scored by a larger model size in the cascade.', ('model_size',))
+CASCADE_RESULTS = telemetry.registry.counter(
+    'detector_cascade_total', 'Cascades run, by the largest model size that had to be consulted.', ('model_size',))
+for _name, _key, _kind, _documentation in (
+        ('detector_result_cache_entries', 'entries', 'gauge', 'Detection results in the result cache.'),
+        ('detector_result_cache_bytes', 'bytes', 'gauge', 'Approximate size of the result cache.'),
+        ('detector_result_cache_hits_total', 'hits', 'counter', 'Requests served from the result cache.'),
+        ('detector_result_cache_misses_total', 'misses', 'counter', 'Requests that ran a detection.'),
+        ('detector_result_cache_coalesced_total', 'coalesced', 'counter',
+         'Requests that waited for the same detection running for another request.'),
+        ('detector_result_cache_evictions_total', 'evictions', 'counter', 'Results evicted from the result cache.')):
+    telemetry.registry.callback(_name, _documentation, lambda key=_key: result_cache.stats()[key], _kind)
+for _name, _key, _kind, _documentation in (
+        ('detector_upload_files', 'files', 'gauge', 'Uploaded and generated files awaiting deletion.'),
+        ('detector_upload_bytes', 'bytes', 'gauge', 'Size of the uploaded and generated files.'),
+        ('detector_upload_pinned_files', 'pinned', 'gauge', 'Files in use, which are not deleted until released.'),
+        ('detector_upload_expired_total', 'expired', 'counter', 'Files deleted once they expired.'),
+        ('detector_upload_evicted_total', 'evicted', 'counter', 'Files deleted early to respect the upload quota.'),
+        ('detector_upload_disk_free_bytes', 'disk_free_bytes', 'gauge', 'Free space on the disk of the upload folder.')):
+    telemetry.registry.callback(_name, _documentation, lambda key=_key: janitor.stats()[key], _kind)
+telemetry.registry.callback('detector_model_resident_bytes', 'Estimated memory used by the resident model weights.',
+                            lambda: models.resident_bytes())
+telemetry.registry.callback('detector_batch_queue_depth', 'Inference requests waiting for a batch, by model size.',
+                            lambda: [({'model_size': size}, stats['queue_depth'])
+                                     for size, stats in batch_scheduler.stats().items()])
+
+
+@app.before_request
+def _begin_request_trace():
+    telemetry.begin_trace(request.path)
+    request.environ['telemetry.start'] = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = time.perf_counter() - request.environ.get('telemetry.start', time.perf_counter())
+    REQUEST_SECONDS.observe(elapsed, route=route)
+    REQUESTS.inc(route=route, status=response.status_code)
+    telemetry.log('request', route=route, status=response.status_code, duration_ms=round(elapsed * 1000, 3),
+                  cache=response.headers.get('X-Cache'))
+    telemetry.end_trace()
+    return response
+
+
+def cached_detect(image, source_language, target_language, model_size='n', min_confidence=None, annotate=False):
+    """
+    Detects objects in an image, serving the result from the result cache when the same image was already processed.
+
+    Results are keyed by the pixels of the image and every parameter that affects them. Concurrent requests
+    for the same key wait for a single detection. The annotated image is encoded on the first request that
+    needs it and cached with the detections.
+
+    Args:
+        image (numpy.ndarray): The BGR image.
+        source_language (str): The source language to translate from.
+        target_language (str): The target language code to translate the object names into.
+        model_size (str, optional): The model size to use, ignored when `min_confidence` is given. Defaults to 'n'.
+        min_confidence (float, optional): Selects the model sizes with `cascade_detect`, escalating the
+            detections below this confidence. Defaults to None.
+        annotate (bool, optional): Also return the annotated image. Defaults to False.
+
+    Returns:
+        Tuple[Dict, bool]: The cached entry, with the 'model_size', 'table', 'tier_latencies' and
+        'resolution_latencies' of the detection and the annotated 'jpeg' bytes if requested, and whether it was served from the cache.
+
+    Raises:
+        FileNotFoundError: If the model returns no results.
+    """
+    auto_select = min_confidence is not None
+    key = (image_digest(image), 'auto' if auto_select else model_size, min_confidence, source_language,
+           target_language)
+
+    def compute():
+        if auto_select:
+            cascade = cascade_detect(image, min_confidence, source_language, target_language)
+            used_size, result, tier_latencies = cascade['model_size'], cascade['result'], cascade['tier_latencies']
+            table, resolution_latencies = cascade['table'], cascade['resolution_latencies']
+        else:
+            result, resolution_latencies = infer(image, model_size)
+            used_size, tier_latencies = model_size, []
+            table = build_detection_table(result, source_language, target_language)
+        return {
+            'model_size': used_size,
+            'table': table,
+            'tier_latencies': tier_latencies,
+            'resolution_latencies': resolution_latencies,
+            'jpeg': encode_annotated_image(image, table) if annotate else None,
+        }
 
+    entry, cached = result_cache.get_or_compute(key, compute)
+    if annotate and entry['jpeg'] is None:
+        # Cached by a request that only needed the detections
+        entry = dict(entry, jpeg=encode_annotated_image(image, entry['table']))
+        result_cache.put(key, entry)
+    return entry, cached
 
-def detect_objects_in_video(video_path, target_language, model_size='n'):
+
+def create_video_pipeline(video_path, target_language, model_size='n', stride=1):
+    """
+    Builds the pipelined detection engine for a video.
+
+    Args:
+        video_path (str): The path to the video file.
+        target_language (str): The language the labels drawn on the frames are translated into.
+        model_size (str, optional): The size of the YOLOv10 model to use. Defaults to 'n'.
+        stride (int, optional): Run the model on every stride-th frame and track the boxes in between. Defaults to 1.
+
+    Returns:
+        VideoPipeline: The pipeline, not started yet.
+
+    Raises:
+        FileNotFoundError: If the video file cannot be opened.
+    """
+    def infer(frame):
+        boxes = run_model(frame, model_size)[0].boxes
+        return boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy().astype(int), boxes.conf.cpu().numpy()
+
+    _, labels = translate_vocabulary(models[model_size].names, 'en', target_language)
+    return VideoPipeline(video_path, infer, labels, stride=stride)
+
+
+def detect_objects_in_video(video_path, target_language, model_size='n', stride=1):
     """
     Detects objects in a video using a specified YOLOv10 model size.
     Args:
         video_path (str): The path to the video file.
         model_size (str, optional): The size of the YOLOv10 model to use. Defaults to 'n'.
         target_language (str, optional): The target language for translating object names. Defaults to 'en'.
+        stride (int, optional): Run the model on every stride-th frame and track the boxes in between. Defaults to 1.
     Returns:
-        str: The path to the temporary video file with annotated frames.
+        str: The path to the temporary video file with annotated frames, in the TEMP_FOLDER.
     Raises:
         FileNotFoundError: If the video file cannot be opened.
     Note:
-        This function uses the YOLOv10 model to detect objects in the video frames. It writes the annotated frames
-        to a temporary video file and returns its path. The annotated frames include bounding boxes and labels
-        for the detected objects. The target_language parameter is used for translating the object names to the
-        specified language.
+        This function uses the YOLOv10 model to detect objects in the video frames. Decoding, inference and
+        annotation run as a pipeline of threads, see `VideoPipeline`, and the annotated frames are written
+        to a temporary video file whose path is returned. The annotated frames include bounding boxes and
+        labels for the detected objects, translated to the target_language.
     Example:
         #detect_objects_in_video('path/to/video.mp4', 'm', 'fr')
         'path/to/temp_video.mp4'
     """
-    model = models[model_size]
+    pipeline = create_video_pipeline(video_path, target_language, model_size, stride)
+    temp_output_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4', dir=TEMP_FOLDER)
+    temp_output_file.close()
+    with telemetry.span('video', model_size):
+        pipeline.write(temp_output_file.name)
+    telemetry.log('video_annotated', model_size=model_size, stride=stride, inferred_frames=pipeline.inferred_frames,
+                  tracked_frames=pipeline.tracked_frames)
+    return temp_output_file.name
+
+
+def sample_video_frames(video_path, count):
+    """
+    Decodes frames spread evenly across a video, seeking to each one rather than decoding the whole video.
+
+    Args:
+        video_path (str): The path to the video file.
+        count (int): The number of frames to sample.
+
+    Returns:
+        List[numpy.ndarray]: The sampled BGR frames, in order. Frames that cannot be decoded are skipped.
+
+    Raises:
+        FileNotFoundError: If the video file cannot be opened or no frame can be read.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise FileNotFoundError(f"Could not open video file: {video_path}")
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    temp_output_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-    out = cv2.VideoWriter(temp_output_file.name, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total > 0:
+        positions = sorted({int((i + 0.5) * total / count) for i in range(count)})
+    else:
+        positions = [0]  # Unknown length, e.g. some streamed containers, only the first frame is reliable
 
-    while cap.isOpened():
+    frames = []
+    for position in positions:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)
         ret, frame = cap.read()
-        if not ret:
-            break
+        if ret:
+            frames.append(frame)
+    cap.release()
 
-        results = model(frame)
-        if not results or len(results) == 0:
-            continue
+    if not frames:
+        raise FileNotFoundError(f"Could not read frame from video path: {video_path}")
+    return frames
 
-        annotated_frame = results[0].plot()
-        if isinstance(annotated_frame, np.ndarray):
-            out.write(annotated_frame)
-        else:
-            raise TypeError("Annotated frame is not a numpy array")
 
-    cap.release()
-    out.release()
+def confidence_statistics(results, min_confidence):
+    """
+    Aggregates the confidences of the detections of several frames.
 
-    return temp_output_file.name
+    Args:
+        results (List[ultralytics.engine.results.Results]): The results of one model size on the sampled frames.
+        min_confidence (float): The minimum confidence score to consider a detection as valid.
+
+    Returns:
+        Dict[str, float]: The number of 'detections', the 'mean' and 10th percentile 'p10' confidence, and the
+        fraction of detections 'above' the minimum confidence. The statistics are None without detections.
+    """
+    confidences = np.concatenate([result.boxes.conf.cpu().numpy() for result in results]) if results else np.zeros(0)
+    if len(confidences) == 0:
+        return {'detections': 0, 'mean': None, 'p10': None, 'above': None}
+    return {
+        'detections': int(len(confidences)),
+        'mean': float(confidences.mean()),
+        'p10': float(np.percentile(confidences, 10)),
+        'above': float(np.mean(confidences >= min_confidence)),
+    }
 
 
 def get_best_model_for_video(video_path, min_confidence, target_language):
     """
         Get the best model size for a given video file based on the confidence levels of the detected objects.
 
+        VIDEO_SAMPLE_FRAMES frames spread across the video are decoded in memory and each model size, from the
+        smallest, runs on all of them as a single batch. The first size for which at least VIDEO_SELECTION_QUORUM
+        of the detections reach the minimum confidence is selected.
+
         Args:
             video_path (str): The path to the video file.
             min_confidence (float): The minimum confidence score to consider a detection as valid.
             target_language (str, optional): The target language for translating object names. Defaults to 'en'.
+                Unused, the selection does not depend on the object names.
 
         Returns:
-            str: The model size that meets the minimum confidence requirement among the detected objects in the first frame of the video. If no detection meets the requirement, the last model size in the list is returned.
+            str: The model size that meets the minimum confidence requirement among the detected objects in the sampled frames of the video. If no model size meets the requirement, the last model size in the list is returned.
 
         Raises:
-            FileNotFoundError: If the video file cannot be opened or if the first frame of the video cannot be read.
+            FileNotFoundError: If the video file cannot be opened or if none of the sampled frames of the video can be read.
 
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise FileNotFoundError(f"Could not open video file: {video_path}")
-
-    ret, frame = cap.read()
-    cap.release()
-
-    if not ret:
-        raise FileNotFoundError(f"Could not read frame from video path: {video_path}")
-
-    temp_image_path = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg').name
-    cv2.imwrite(temp_image_path, frame)
+    frames = sample_video_frames(video_path, VIDEO_SAMPLE_FRAMES)
 
     for size in model_sizes:
-        _, detections = detect_objects(temp_image_path, 'en', target_language, model_size=size)
-        if all(d['confidence'] >= min_confidence for d in detections):
+        statistics = confidence_statistics(run_model(frames, size), min_confidence)
+        telemetry.log('video_model_selection', model_size=size, frames=len(frames), **statistics)
+        if statistics['detections'] == 0 or statistics['above'] >= VIDEO_SELECTION_QUORUM:
             return size
 
     return model_sizes[-1]
@@ -327,32 +850,70 @@ def delete_file_after_timeout(file_path, timeout):
         Schedules the deletion of a file after a specified timeout.
 
         Args:
-            file_path (str): The path to the file to be deleted.
+            file_path (str): The path to the file to be deleted, inside the upload folder.
             timeout (int): The duration in minutes after which the file will be deleted.
 
         Returns:
             None
 
-        This function creates a timer that, after the specified timeout, deletes the file
-        located at the given file path. If the file does not exist at the time of deletion,
-        no action is taken. The function does not return anything.
+        The deletion is handed to the janitor of the upload folder, which deletes every scheduled file
+        from a single thread. The file may be deleted earlier if the upload folder exceeds its size quota.
+        If the file does not exist at the time of deletion, no action is taken.
 
         Example:
-            delete_file_after_timeout('/path/to/file.txt', 10)
-            # The file at '/path/to/file.txt' will be deleted after 10 minutes.
+            delete_file_after_timeout('./uploads/file.txt', 10)
+            # The file at './uploads/file.txt' will be deleted after 10 minutes.
     """
+    janitor.schedule(file_path, timeout * 60)
+
+
+def read_uploaded_image():
+    """
+    Reads the image of the current request into memory, without going through the disk.
+
+    The image is accepted either as a multipart 'file' field, encoded (PNG, JPEG, ...) or as raw BGR pixels,
+    or as the raw request body. Raw BGR pixels are recognised by their 'application/x-raw-bgr' mimetype or by
+    a shape given in the 'X-Frame-Shape' header or the 'shape' field, and are decoded without a copy.
+    The received bytes are only written to the upload folder if the 'save_upload' field is 'true'.
+
+    Returns:
+        Tuple[numpy.ndarray, str]: The BGR image and a safe file name for it.
+
+    Raises:
+        ValueError: If no image was sent, its file name is invalid, or it cannot be decoded.
+    """
+    shape = request.headers.get(SHAPE_HEADER) or request.values.get('shape')
+    file = request.files.get('file')
+    if file:
+        filename = secure_filename(file.filename)
+        if not filename:
+            raise ValueError('Invalid file name')
+        data = file.read()
+        if file.mimetype == RAW_BGR_MIMETYPE and shape is None:
+            raise ValueError(f'Raw frames require the {SHAPE_HEADER} header')
+    else:
+        data = request.get_data(cache=False)
+        if not data:
+            raise ValueError('No file uploaded')
+        if shape is None and request.mimetype == RAW_BGR_MIMETYPE:
+            raise ValueError(f'Raw frames require the {SHAPE_HEADER} header')
+        filename = 'frame.raw' if shape is not None else 'frame.png'
+
+    with telemetry.span('decode'):
+        image = decode_image(data, shape)
 
-    def delete_file():
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Deleted file: {file_path} after {timeout} minutes.")
+    if request.values.get('save_upload') == 'true':
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        with telemetry.span('file_write'), open(file_path, 'wb') as saved_file:
+            saved_file.write(data)
+        telemetry.log('upload_saved', path=file_path, bytes=len(data))
+        delete_file_after_timeout(file_path, 60)
 
-    threading.Timer(timeout * 60, delete_file).start()
+    return image, filename
 
 
 @app.route('/detect', methods=['POST'])
 def detect():
-    #TODO: prevent the detect endpoint from being hit twice for the same request. Currently, one of the requests returns the annotated image and the detections, whilst the other returns merely the detections.
     """
     Detect objects in an uploaded image file and return the annotated image.
 
@@ -361,20 +922,23 @@ def detect():
     response with an error message and a status code of 400. If the filename is invalid, it
     returns a JSON response with an error message and a status code of 400.
 
-    The uploaded file is saved to a temporary folder specified in the Flask application's
-    configuration. After a specified timeout, the file is deleted.
+    The uploaded image is decoded in memory by 'read_uploaded_image', and is only saved to the
+    upload folder when the 'save_upload' field is 'true'. Raw BGR frames with an 'X-Frame-Shape'
+    header are accepted as well as encoded images.
 
     The function also retrieves the values of the 'auto_select' and 'target_language' form
-    fields. If 'auto_select' is set to 'true', the function calls the 'get_best_model' function
-    to determine the best model size for object detection based on the uploaded file and the
-    target language. Otherwise, it calls the 'detect_objects' function with the specified model
-    size and target language.
+    fields. If 'auto_select' is set to 'true', the 'cascade_detect' function escalates uncertain
+    detections to larger models, and the merged result of the cascade is annotated. Otherwise, the
+    specified model size is used.
 
-    The function then calls the 'detect_objects' function again with the best model size and
-    target language to obtain the annotated image and the detections. The annotated image is
-    saved to a temporary file in the same folder. After a specified timeout, the file is deleted.
+    Detections and annotated images go through 'cached_detect', so an image that was already
+    processed with the same parameters is served from memory, and concurrent duplicate requests
+    wait for a single detection. The 'X-Cache' header tells whether the result was cached.
 
-    The function returns a response with the annotated image and the model size as a header.
+    The function returns a response with the annotated image and the model size as a header. When
+    the cascade ran, the latency of each model size is reported in the 'Tier-Latencies-Ms' header,
+    and with the adaptive resolution policy, the latency of each input size in the
+    'Resolution-Latencies-Ms' header.
 
     If a 'FileNotFoundError' occurs during the execution of the function, it returns a JSON
     response with an error message and a status code of 500. If any other exception occurs, it
@@ -387,50 +951,34 @@ def detect():
         A Flask response object with the annotated image and the model size as a header.
 
     Raises:
-        FileNotFoundError: If the uploaded file or the annotated image file is not found.
+        FileNotFoundError: If the model returns no results.
         Exception: If any other error occurs during the execution of the function.
     """
-    file = request.files.get('file')
-    if not file:
-        return jsonify({'error': 'No file uploaded'}), 400
-
-    filename = secure_filename(file.filename)
-    if not filename:
-        return jsonify({'error': 'Invalid file name'}), 400
-
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
-
-    print(f"File saved to: {file_path}")
-
-    delete_file_after_timeout(file_path, 60)
+    try:
+        image, filename = read_uploaded_image()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    auto_select = request.form.get('auto_select') == 'true'
-    target_language = request.form.get('target_language', 'en')  # Retrieve target language
-    source_language = request.form.get('source_language', 'en') # Retrieve Source Language
+    auto_select = request.values.get('auto_select') == 'true'
+    target_language = request.values.get('target_language', 'en')  # Retrieve target language
+    source_language = request.values.get('source_language', 'en') # Retrieve Source Language
 
     try:
+        min_confidence = None
         if auto_select:
-            min_confidence = float(request.form.get('min_confidence', DEFAULT_MINIMUM_INFERENCE))
-            best_model_size, detections = get_best_model(file_path, min_confidence, target_language, source_language)
-        else:
-            model_size = request.form.get('model_size', 'n')
-            best_model_size, detections = detect_objects(file_path, source_language, target_language, model_size=size)
-
-        # Annotate image and save only if we should create a new file
-        annotated_image_pil, detections = detect_objects(file_path, source_language, target_language, model_size=best_model_size)
-
-        temp_annotated_image_path = os.path.join(app.config['UPLOAD_FOLDER'], f'annotated_{filename}')
-
-        if should_create_new_file(temp_annotated_image_path):
-            annotated_image_pil.save(temp_annotated_image_path, 'JPEG')
-            file_creation_times[temp_annotated_image_path] = datetime.now()
-            print(f"Annotated image saved to: {temp_annotated_image_path}")
-
-        delete_file_after_timeout(temp_annotated_image_path, 60)
-
-        response = send_file(temp_annotated_image_path, mimetype='image/jpeg')
-        response.headers['Model-Size'] = best_model_size
+            min_confidence = float(request.values.get('min_confidence', DEFAULT_MINIMUM_INFERENCE))
+        entry, cached = cached_detect(image, source_language, target_language,
+                                      model_size=request.values.get('model_size', 'n'),
+                                      min_confidence=min_confidence, annotate=True)
+
+        response = send_file(io.BytesIO(entry['jpeg']), mimetype='image/jpeg',
+                             download_name=f'annotated_{os.path.splitext(filename)[0]}.jpg')
+        response.headers['Model-Size'] = entry['model_size']
+        response.headers['X-Cache'] = 'HIT' if cached else 'MISS'
+        if entry['tier_latencies']:
+            response.headers['Tier-Latencies-Ms'] = format_tier_latencies(entry['tier_latencies'])
+        if entry['resolution_latencies']:
+            response.headers['Resolution-Latencies-Ms'] = format_resolution_latencies(entry['resolution_latencies'])
         return response
     except FileNotFoundError as e:
         print(f"FileNotFoundError: {str(e)}")
@@ -448,13 +996,19 @@ def get_detections():
         parameter named 'file'. The function checks if the file is present and valid. If not, it returns a
         JSON response with an error message and a 400 status code.
 
-        If the file is valid, the function retrieves the filename, checks if it is valid, and constructs the
-        file path. It then retrieves the 'auto_select' and 'target_language' parameters from the request
-        form. If 'auto_select' is true, it retrieves the 'min_confidence' parameter as well.
+        If the file is valid, the function decodes it in memory with 'read_uploaded_image', so nothing is
+        written to disk unless 'save_upload' is 'true'. Raw BGR frames sent as the request body with an
+        'X-Frame-Shape' header are accepted too. It then retrieves the 'auto_select' and 'target_language'
+        parameters from the request. If 'auto_select' is true, it retrieves the 'min_confidence' parameter as well.
 
-        The function calls either the 'get_best_model' or 'detect_objects' function, depending on the
-        'auto_select' parameter, to determine the 'best_model_size' and 'detections'. It constructs a
-        response data dictionary with the 'model_size' and 'detections' keys.
+        The function calls 'cached_detect', which runs 'cascade_detect' when 'auto_select' is true and the
+        given model size otherwise, unless the same image was already processed with the same parameters.
+        It constructs a response data dictionary with the 'model_size', 'detections' and 'tier_latencies'
+        keys, and tells whether the result was cached in the 'X-Cache' header. With 'layout' set to
+        'columns', the 'detections' list is replaced by a 'table' of flat columns, see
+        `DetectionTable.to_columns`, which also carries the image dimensions. With 'layout' set to
+        'binary', the detections are sent in the compact format of the wire module instead of JSON, and
+        the label table is left out when the client's 'X-Label-Table' header shows it already holds it.
 
         If an exception occurs during the process, the function catches it, prints an error message, and
         returns a JSON response with the error message and a 500 status code.
@@ -466,34 +1020,49 @@ def get_detections():
             A JSON response with the 'model_size' and 'detections' keys, or a JSON response with an error
             message and a 500 status code.
     """
-    file = request.files.get('file')
-    if not file:
-        return jsonify({'error': 'No file uploaded'}), 400
-
-    filename = secure_filename(file.filename)
-    if not filename:
-        return jsonify({'error': 'Invalid file name'}), 400
-
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        image, _ = read_uploaded_image()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    auto_select = request.form.get('auto_select') == 'true'
-    source_language = request.form.get('source_language', 'en')
-    target_language = request.form.get('target_language', 'en')  # Retrieve target language
+    auto_select = request.values.get('auto_select') == 'true'
+    source_language = request.values.get('source_language', 'en')
+    target_language = request.values.get('target_language', 'en')  # Retrieve target language
 
     try:
+        min_confidence = None
         if auto_select:
-            min_confidence = float(request.form.get('min_confidence', DEFAULT_MINIMUM_INFERENCE))
-            best_model_size, detections = get_best_model(file_path, min_confidence, target_language, source_language)
-        else:
-            model_size = request.form.get('model_size', 'n')
-            best_model_size, detections = detect_objects(file_path, model_size=model_size,
-                                                         target_language=target_language, source_language=source_language)
+            min_confidence = float(request.values.get('min_confidence', DEFAULT_MINIMUM_INFERENCE))
+        entry, cached = cached_detect(image, source_language, target_language,
+                                      model_size=request.values.get('model_size', 'n'),
+                                      min_confidence=min_confidence)
+
+        layout = request.values.get('layout')
+        if layout == 'binary':
+            # A malformed id is ignored, the client then receives the full label table again
+            label_table_id = wire.parse_label_table_id(request.headers.get(wire.LABEL_TABLE_HEADER))
+            response = Response(wire.encode(entry['table'], entry['model_size'], label_table_id),
+                                mimetype=wire.WIRE_MIMETYPE)
+            response.headers['X-Cache'] = 'HIT' if cached else 'MISS'
+            if entry['tier_latencies']:
+                response.headers['Tier-Latencies-Ms'] = format_tier_latencies(entry['tier_latencies'])
+            if entry['resolution_latencies']:
+                response.headers['Resolution-Latencies-Ms'] = format_resolution_latencies(
+                    entry['resolution_latencies'])
+            return response
 
         response_data = {
-            'model_size': best_model_size,
-            'detections': detections
+            'model_size': entry['model_size'],
+            'tier_latencies': entry['tier_latencies'],
+            'resolution_latencies': entry['resolution_latencies']
         }
-        return jsonify(response_data)
+        if layout == 'columns':
+            response_data['table'] = entry['table'].to_columns()
+        else:
+            response_data['detections'] = entry['table'].to_records()
+        response = jsonify(response_data)
+        response.headers['X-Cache'] = 'HIT' if cached else 'MISS'
+        return response
     except Exception as e:
         print(f"Error in /get_detections: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -521,7 +1090,11 @@ def detect_video():
             in the video using the YOLOv10 model, and returns an annotated video file. The 'auto_select'
             parameter determines whether to automatically select the model size based on the minimum
             confidence, or to use a manually selected model size. The 'target_language' parameter is used
-            for translating object names to the specified language.
+            for translating object names to the specified language. A 'stride' above 1 runs the model on
+            every stride-th frame only and tracks the boxes in between.
+
+            With 'stream' set to 'true', the annotated frames are sent as a multipart/x-mixed-replace stream
+            of JPEG images while the video is still being processed, instead of an MP4 file at the end.
 
         Example:
             POST /detect_video
@@ -529,7 +1102,9 @@ def detect_video():
                 "file": <video file>,
                 "auto_select": true,
                 "min_confidence": 0.9,
-                "target_language": "en"
+                "target_language": "en",
+                "stride": 3,
+                "stream": false
             }
             Response:
                 <annotated video file>
@@ -543,31 +1118,133 @@ def detect_video():
         return jsonify({'error': 'Invalid file name'}), 400
 
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
+    with telemetry.span('file_write'):
+        file.save(file_path)
 
+    # Pinned until the response is closed, so that the upload quota never deletes a video still being read
+    janitor.pin(file_path)
     delete_file_after_timeout(file_path, 60)
+    response = None
 
     auto_select = request.form.get('auto_select') == 'true'
     target_language = request.form.get('target_language', 'en')  # Retrieve target language
+    stream = request.form.get('stream') == 'true'
 
     try:
+        stride = int(request.form.get('stride', 1))
         if auto_select:
             min_confidence = float(request.form.get('min_confidence', DEFAULT_MINIMUM_INFERENCE))
             best_model_size = get_best_model_for_video(file_path, min_confidence, target_language)
         else:
             best_model_size = request.form.get('model_size', 'n')
 
-        annotated_video_path = detect_objects_in_video(file_path, target_language, model_size=best_model_size)
-
-        delete_file_after_timeout(annotated_video_path, 60)
-
-        return send_file(annotated_video_path, mimetype='video/mp4')
+        if stream:
+            pipeline = create_video_pipeline(file_path, target_language, best_model_size, stride)
+            response = Response(stream_with_context(pipeline.stream_jpeg(boundary='frame')),
+                                mimetype='multipart/x-mixed-replace; boundary=frame')
+            response.headers['Model-Size'] = best_model_size
+            response.call_on_close(lambda: janitor.unpin(file_path))
+            return response
+
+        annotated_video_path = detect_objects_in_video(file_path, target_language, model_size=best_model_size,
+                                                       stride=stride)
+
+        janitor.pin(annotated_video_path)
+        try:
+            delete_file_after_timeout(annotated_video_path, 60)
+            response = send_file(annotated_video_path, mimetype='video/mp4')
+        except Exception:
+            janitor.unpin(annotated_video_path)
+            raise
+        response.call_on_close(lambda: janitor.unpin(annotated_video_path))
+        return response
     except FileNotFoundError as e:
         print(f"FileNotFoundError: {str(e)}")
         return jsonify({'error': f'FileNotFoundError: {str(e)}'}), 500
     except Exception as e:
         print(f"Error in /detect_video: {str(e)}")
         return jsonify({'error': str(e)}), 500
+    finally:
+        if response is None or not stream:
+            janitor.unpin(file_path)  # The streamed video is still being read, it is released on close
+
+
+@app.route('/model_stats', methods=['GET'])
+def model_stats():
+    """
+    Reports which model sizes are resident, how long each took to load and how much memory its weights use.
+
+    Returns:
+        JSON: The inference runtime, the memory budget, the total resident size and per-size statistics from
+        the model registry.
+
+    Example:
+        curl http://localhost:5000/model_stats
+    """
+    return jsonify(dict(models.stats(), runtime=INFERENCE_RUNTIME))
+
+
+@app.route('/batch_stats', methods=['GET'])
+def batch_stats():
+    """
+    Reports the state of the inference batch scheduler.
+
+    Returns:
+        JSON: For each model size, the queue depth, the number of batches run, the batch size histogram
+        and the p50/p99 request latencies in milliseconds.
+
+    Example:
+        curl http://localhost:5000/batch_stats
+    """
+    return jsonify({'enabled': BATCHING_ENABLED, 'max_batch_size': BATCH_MAX_SIZE,
+                    'max_wait_ms': BATCH_MAX_WAIT_MS, 'model_sizes': batch_scheduler.stats()})
+
+
+@app.route('/storage_stats', methods=['GET'])
+def storage_stats():
+    """
+    Reports the disk usage of the upload folder.
+
+    Returns:
+        JSON: The number and size of the uploaded and generated files, how many are in use, the quota and
+        maximum age, how many files were deleted because they expired or to respect the quota, and the free
+        space on the disk.
+
+    Example:
+        curl http://localhost:5000/storage_stats
+    """
+    return jsonify(janitor.stats())
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """
+    Reports the state of the detection result cache.
+
+    Returns:
+        JSON: The number of cached results, their size and the limit in bytes, and the hit, miss, coalesced
+        and eviction counts.
+
+    Example:
+        curl http://localhost:5000/cache_stats
+    """
+    return jsonify(result_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Exposes the metrics of the service in the Prometheus text format.
+
+    Returns:
+        The latency histograms of the requests and of each stage (decode, inference per model size,
+        translation, annotation, file I/O), the request and cascade escalation counts, and the state of the
+        result cache, the upload janitor, the models and the batch scheduler.
+
+    Example:
+        curl http://localhost:5000/metrics
+    """
+    return Response(telemetry.registry.render(), content_type=telemetry.PROMETHEUS_MIMETYPE)
 
 
 @app.errorhandler(413)
@@ -587,5 +1264,7 @@ def file_too_large(e):
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only, see serve.py for deployments. The reloader is off, it would load the models twice.
+    models.prewarm(PREWARM_MODEL_SIZES)
+    app.run(debug=True, use_reloader=False, threaded=True)
 
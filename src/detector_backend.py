@@ -0,0 +1,198 @@
+"""
+Module summary: Interchangeable detector backends for the scanner.
+
+The "remote" backend posts frames to the Flask detection server, as the scanner always did. The "local"
+backend imports the detection engine from detector.py and calls it in-process, which saves the HTTP hop,
+the JSON serialization and the second copy of the model on single-board deployments. Both return a
+`DetectionResult`.
+"""
+
+import os
+
+import requests
+
+from detection_table import DetectionTable
+from image_io import RAW_BGR_MIMETYPE, SHAPE_HEADER, encode_raw_frame
+import wire
+
+DETECTOR_MODES = ('local', 'remote')
+DEFAULT_BACKEND_URL = "http://localhost:5000"
+
+
+class DetectionResult:
+    """
+    The detections for one image, regardless of the backend that produced them.
+
+    Attributes:
+        model_size (str): The model size that produced the detections.
+        detections (List[Dict]): The detections, with 'name', 'confidence', 'box' and 'translated_name' keys.
+        image_width (int): The width of the image the boxes refer to.
+        image_height (int): The height of the image the boxes refer to.
+        tier_latencies (List[Dict]): The latency of each model size the cascade ran, if known.
+        table (DetectionTable): The detections as columns, if the backend provided them.
+    """
+
+    def __init__(self, model_size, detections, image_width, image_height, tier_latencies=None, table=None):
+        self.model_size = model_size
+        self.detections = detections
+        self.image_width = image_width
+        self.image_height = image_height
+        self.tier_latencies = tier_latencies or []
+        self.table = table
+
+    @classmethod
+    def from_table(cls, model_size, table, tier_latencies=None):
+        """Builds the result of a DetectionTable, deriving the per-detection dictionaries from its columns."""
+        return cls(model_size, table.to_records(), table.image_width, table.image_height, tier_latencies, table)
+
+    def __repr__(self):
+        return (f"DetectionResult(model_size={self.model_size!r}, detections={len(self.detections)}, "
+                f"image_width={self.image_width}, image_height={self.image_height})")
+
+
+def _parse_tier_latencies(header):
+    """Parses a 'Tier-Latencies-Ms' header, e.g. 'n=12.3,s=45.6', into the latency of each model size."""
+    tiers = []
+    for part in filter(None, (header or '').split(',')):
+        model_size, _, latency = part.partition('=')
+        tiers.append({'model_size': model_size, 'latency_ms': float(latency)})
+    return tiers
+
+
+def _image_size(image):
+    """Returns the (width, height) of a frame, or (1, 1) when only a path is known."""
+    if isinstance(image, str):
+        return 1, 1
+    return image.shape[1], image.shape[0]
+
+
+class RemoteDetector:
+    """
+    Sends frames to the detection server over HTTP.
+
+    :param backend_url: The base URL of the detection server.
+    :param min_confidence: The confidence below which the server escalates detections to larger models.
+    :param timeout: The request timeout in seconds.
+    """
+
+    def __init__(self, backend_url=DEFAULT_BACKEND_URL, min_confidence=0.25, timeout=60):
+        self.backend_url = backend_url
+        self.min_confidence = min_confidence
+        self.timeout = timeout
+        self.session = requests.Session()  # Keeps the connection to the server alive between scans
+        self.label_tables = {}  # Label tables received from the server, keyed by id
+        self._label_table_ids = {}  # The id of the current label table of each language
+
+    def detect(self, image, language):
+        """
+        Detects the objects in an image.
+
+        :param image: The BGR frame, sent as raw pixels, or the path of an image file.
+        :param language: The language code the object names are translated into.
+        :return: A DetectionResult.
+        :raises requests.RequestException: If the server cannot be reached.
+        :raises RuntimeError: If the server reports an error.
+        :raises ValueError: If the binary response cannot be decoded.
+        """
+        parameters = {'auto_select': 'true', 'min_confidence': str(self.min_confidence), 'model_size': 'n',
+                      'target_language': language, 'layout': 'binary'}
+        url = f"{self.backend_url}/get_detections"
+        headers = {}
+        if language in self._label_table_ids:
+            headers[wire.LABEL_TABLE_HEADER] = str(self._label_table_ids[language])
+
+        if isinstance(image, str):
+            with open(image, 'rb') as file:
+                files = {'file': (os.path.basename(image), file.read(), 'image/png')}
+            response = self.session.post(url, files=files, data=parameters, timeout=self.timeout,
+                                         headers=headers)
+        else:
+            # Raw pixels avoid encoding and decoding a PNG on every scan
+            frame_bytes, shape = encode_raw_frame(image)
+            headers.update({'Content-Type': RAW_BGR_MIMETYPE, SHAPE_HEADER: shape})
+            response = self.session.post(url, data=frame_bytes, params=parameters, timeout=self.timeout,
+                                         headers=headers)
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Error in detections request: {response.text}")
+
+        if response.headers.get('Content-Type', '').startswith(wire.WIRE_MIMETYPE):
+            model_size, table, label_table_id = wire.decode(response.content, self.label_tables)
+            self._label_table_ids[language] = label_table_id
+            return DetectionResult.from_table(model_size, table,
+                                              _parse_tier_latencies(response.headers.get('Tier-Latencies-Ms')))
+
+        # Servers predating the binary layout
+        detections_data = response.json()
+        if 'table' in detections_data:
+            return DetectionResult.from_table(detections_data.get('model_size'),
+                                              DetectionTable.from_columns(detections_data['table']),
+                                              detections_data.get('tier_latencies'))
+        image_width, image_height = _image_size(image)
+        return DetectionResult(
+            detections_data.get('model_size'),
+            detections_data.get('detections', []),
+            detections_data.get('image_width', image_width),
+            detections_data.get('image_height', image_height),
+            detections_data.get('tier_latencies'),
+        )
+
+
+class LocalDetector:
+    """
+    Runs the detection engine of detector.py in this process.
+
+    The engine is imported on first use, so the remote mode never pays for loading it. A single scanner
+    never has concurrent requests to batch, so by default the models are called directly instead of waiting
+    for a batch.
+
+    :param min_confidence: The confidence below which detections are escalated to larger models.
+    :param source_language: The language the object names are produced in before translation.
+    :param batching: Whether the scans are batched by the engine. Defaults to False.
+    """
+
+    def __init__(self, min_confidence=0.25, source_language='en', batching=False):
+        self.min_confidence = min_confidence
+        self.source_language = source_language
+        self.batching = batching
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import detector  # Deferred, it loads the models and the translation table
+            self._engine = detector
+        return self._engine
+
+    def warm_up(self):
+        """Imports the engine and loads its pre-warmed model sizes before the first scan."""
+        self.engine.models.prewarm(self.engine.PREWARM_MODEL_SIZES)
+
+    def detect(self, image, language):
+        """
+        Detects the objects in an image.
+
+        :param image: The BGR frame or the path of an image file.
+        :param language: The language code the object names are translated into.
+        :return: A DetectionResult.
+        """
+        cascade = self.engine.cascade_detect(image, self.min_confidence, self.source_language, language,
+                                             batching=self.batching)
+        return DetectionResult.from_table(cascade['model_size'], cascade['table'], cascade['tier_latencies'])
+
+
+def create_detector(mode, backend_url=DEFAULT_BACKEND_URL, min_confidence=0.25):
+    """
+    Builds the detector backend for a mode.
+
+    :param mode: Either "local" or "remote".
+    :param backend_url: The detection server used by the remote mode.
+    :param min_confidence: The confidence below which detections are escalated to larger models.
+    :return: A LocalDetector or a RemoteDetector.
+    :raises ValueError: If the mode is unknown.
+    """
+    if mode == 'local':
+        return LocalDetector(min_confidence=min_confidence)
+    if mode == 'remote':
+        return RemoteDetector(backend_url, min_confidence=min_confidence)
+    raise ValueError(f"Unknown detector mode: {mode!r}, expected one of {DETECTOR_MODES}")
@@ -0,0 +1,122 @@
+"""
+Module summary: In-memory stand-in for RPi.GPIO.
+
+It implements the subset of the RPi.GPIO API used by the scanner, so that button handling can be run
+and tested on a regular Linux machine. Pin levels are driven with `set_input` or `press`, and edge
+callbacks are run on a separate thread, as RPi.GPIO does.
+
+Example:
+    GPIO_BACKEND=fake python main.py
+"""
+
+import threading
+import time
+
+BCM = 11
+BOARD = 10
+IN = 1
+OUT = 0
+HIGH = 1
+LOW = 0
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+_lock = threading.Lock()
+_levels = {}
+_callbacks = {}  # pin -> (edge, callback)
+
+
+def setmode(mode):
+    pass
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=None):
+    with _lock:
+        if direction == OUT:
+            _levels[channel] = LOW if initial is None else initial
+        else:
+            _levels[channel] = HIGH if pull_up_down == PUD_UP else LOW
+
+
+def input(channel):
+    with _lock:
+        return _levels.get(channel, LOW)
+
+
+def output(channel, value):
+    set_input(channel, value)
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    with _lock:
+        if channel in _callbacks:
+            raise RuntimeError(f"Conflicting edge detection already enabled for GPIO channel {channel}")
+        _callbacks[channel] = (edge, callback)
+
+
+def remove_event_detect(channel):
+    with _lock:
+        _callbacks.pop(channel, None)
+
+
+def cleanup(channel=None):
+    with _lock:
+        if channel is None:
+            _levels.clear()
+            _callbacks.clear()
+        else:
+            _levels.pop(channel, None)
+            _callbacks.pop(channel, None)
+
+
+def set_input(channel, value):
+    """
+    Drives a pin to a level, running its edge callback if the level changed.
+
+    Args:
+        channel (int): The pin number.
+        value (int): HIGH or LOW.
+
+    Returns:
+        threading.Thread: The thread running the callback, or None if no callback fired.
+    """
+    with _lock:
+        previous = _levels.get(channel, LOW)
+        _levels[channel] = value
+        edge, callback = _callbacks.get(channel, (None, None))
+
+    if callback is None or previous == value:
+        return None
+    rising = value == HIGH
+    if edge == BOTH or (edge == RISING and rising) or (edge == FALLING and not rising):
+        thread = threading.Thread(target=callback, args=(channel,), daemon=True)
+        thread.start()
+        return thread
+    return None
+
+
+def press(channel, duration=0.1, active_level=LOW):
+    """
+    Simulates pressing and releasing a button wired to a pin.
+
+    Args:
+        channel (int): The pin number.
+        duration (float, optional): How long the button is held, in seconds. Defaults to 0.1.
+        active_level (int, optional): The level of the pin while pressed. Defaults to LOW, for a pull-up.
+    """
+    released_level = HIGH if active_level == LOW else LOW
+    pressed = set_input(channel, active_level)
+    if pressed is not None:
+        pressed.join()
+    time.sleep(duration)
+    released = set_input(channel, released_level)
+    if released is not None:
+        released.join()
@@ -1,13 +1,131 @@
-import RPi.GPIO as GPIO
 import cv2
+from camera_capture import FrameGrabber
+from camera_discovery import discover_camera
 #import libcamera
 #from picamera2 import PiCamera2
 #import picamera
 import os
+import queue
+import threading
+import time
+
+# Set GPIO_BACKEND=fake to drive the button from fake_gpio on a machine without GPIO pins
+if os.environ.get('GPIO_BACKEND') == 'fake':
+    import fake_gpio as GPIO
+else:
+    import RPi.GPIO as GPIO
+
+SHORT_PRESS = 'short'
+LONG_PRESS = 'long'
+
+
+class PressEvent:
+    """A completed button press, classified as short or long by how long the button was held."""
+
+    def __init__(self, kind, duration, timestamp):
+        self.kind = kind
+        self.duration = duration
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return f"PressEvent(kind={self.kind!r}, duration={self.duration:.3f})"
+
+
+class ButtonListener:
+    """
+    Turns the edges of a button pin into a queue of press events, without polling.
+
+    Edges are delivered by the GPIO library's interrupt callback. Edges that do not change the pressed
+    state are ignored. An edge closer than the debounce delay to the previous accepted edge is not acted
+    on immediately: the pin is read again once the delay has passed, so that a fast tap whose release
+    falls within the delay still ends the press.
+
+    :param gpio: The GPIO module, RPi.GPIO or fake_gpio.
+    :param pin: The BCM number of the button pin, already set up as an input.
+    :param debounce_ms: Minimum time between two accepted edges, in milliseconds.
+    :param long_press_s: Presses held at least this long are reported as long presses.
+    :param active_low: True if the pin reads LOW while the button is pressed, as with a pull-up.
+    """
+
+    def __init__(self, gpio, pin, debounce_ms=50, long_press_s=1.0, active_low=True):
+        self.gpio = gpio
+        self.pin = pin
+        self.debounce_s = debounce_ms / 1000
+        self.long_press_s = long_press_s
+        self.active_level = gpio.LOW if active_low else gpio.HIGH
+        self.events = queue.Queue()
+        self._lock = threading.Lock()
+        self._pressed_at = None
+        self._last_edge_at = 0.0
+        self._recheck = None  # Timer reading the pin again once the debounce delay has passed
+        self._started = False
+
+    def start(self):
+        """Starts listening for edges on the pin."""
+        if not self._started:
+            self.gpio.add_event_detect(self.pin, self.gpio.BOTH, callback=self._on_edge)
+            self._started = True
+
+    def stop(self):
+        """Stops listening for edges on the pin."""
+        if self._started:
+            self.gpio.remove_event_detect(self.pin)
+            self._started = False
+        with self._lock:
+            if self._recheck is not None:
+                self._recheck.cancel()
+                self._recheck = None
+
+    def _on_edge(self, channel):
+        with self._lock:
+            now = time.monotonic()
+            remaining = self._last_edge_at + self.debounce_s - now
+            if remaining > 0:
+                # Bouncing, or a very fast tap: look at the settled level once the delay has passed
+                if self._recheck is None:
+                    self._recheck = threading.Timer(remaining, self._recheck_level, args=(channel,))
+                    self._recheck.daemon = True
+                    self._recheck.start()
+                return
+            pressed = self.gpio.input(self.pin) == self.active_level
+            if pressed and self._pressed_at is None:
+                self._pressed_at = now
+                self._last_edge_at = now
+            elif not pressed and self._pressed_at is not None:
+                duration = now - self._pressed_at
+                self._pressed_at = None
+                self._last_edge_at = now
+                kind = LONG_PRESS if duration >= self.long_press_s else SHORT_PRESS
+                self.events.put(PressEvent(kind, duration, time.time()))
+
+    def _recheck_level(self, channel):
+        with self._lock:
+            self._recheck = None
+        self._on_edge(channel)
+
+    def wait_for_press(self, timeout=None):
+        """
+        Blocks until the button is pressed and released.
+
+        :param timeout: Maximum time to wait, in seconds. None waits forever.
+        :return: The PressEvent, or None on timeout.
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear(self):
+        """Discards the presses that have not been consumed yet."""
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
 
 
 class GPIOHandler:
-    def __init__(self, button_pin=17):
+    def __init__(self, button_pin=17, debounce_ms=50, long_press_s=1.0):
         # Set up GPIO mode
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
@@ -17,25 +135,17 @@ class GPIOHandler:
 
         # Setup pin as input
         GPIO.setup(self.BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.button = ButtonListener(GPIO, self.BUTTON_PIN, debounce_ms=debounce_ms, long_press_s=long_press_s)
 
-        # Initialize the camera with dynamic index detection
-        #self.camera = cv2.VideoCapture(1)  # Specify the correct path
-        #self.camera = cv2
-        #self.camera.release()
-        #self.camera = None
-        for index in range(50):  # TODO: Improve detection
-          #  if (index == 14):
-           #     continue
-            temp_camera = cv2.VideoCapture(index)
-            if temp_camera.isOpened():
-                self.camera = temp_camera
-                print(f"Camera initialized at index {index}")
-                break
-            temp_camera.release()
-
-
+        # Initialize the camera, trying the last camera that worked before probing the V4L2 devices
+        self.camera, index = discover_camera()
         if self.camera is None:
             raise RuntimeError("No available cameras found!")
+        print(f"Camera initialized at index {index}")
+
+        # Background capture, see start_capture
+        self.grabber = None
+        self._held_slot = None
 
         # Set the directory for uploads
         self.upload_directory = './uploads'
@@ -44,23 +154,67 @@ class GPIOHandler:
 
     def is_button_pressed(self):
         """Return True if button is pressed (LOW due to pull-up)"""
-        return GPIO.input(self.BUTTON_PIN)
-
-    def take_picture(self):
-        #self.camera = cv2.VideoCapture(0)
-        """Capture an image and save it to the specified path"""
-        ret, frame = self.camera.read()
-        if ret:
-                image_path = os.path.join(self.upload_directory, 'current.png')
-                cv2.imwrite(image_path, frame)
-                print(f"Image captured and saved to {image_path}")
+        return GPIO.input(self.BUTTON_PIN) == GPIO.LOW
+
+    def wait_for_press(self, timeout=None):
+        """
+        Block, without polling, until the button is pressed and released.
+
+        :param timeout: Maximum time to wait, in seconds. None waits forever.
+        :return: A PressEvent whose kind is SHORT_PRESS or LONG_PRESS, or None on timeout.
+        """
+        self.button.start()
+        return self.button.wait_for_press(timeout)
+
+    def start_capture(self, buffer_size=4):
+        """
+        Start reading the camera continuously on a background thread.
+
+        Once started, take_picture returns the freshest frame from the ring buffer immediately instead of
+        reading the camera, whose driver queue may hold frames captured long before the button press.
+
+        :param buffer_size: Number of preallocated frames in the ring buffer.
+        """
+        if self.grabber is None:
+            self.grabber = FrameGrabber(self.camera, buffer_size=buffer_size)
+        self.grabber.start()
+
+    def capture_stats(self):
+        """Return the capture FPS, frame and failure counts, see FrameGrabber.stats, or None if background capture is not running."""
+        return self.grabber.stats() if self.grabber is not None else None
+
+    def take_picture(self, save_to_disk=False, sharpest=False):
+        """
+        Capture an image and return it as a BGR array.
+
+        With background capture running, the frame is a view into the ring buffer rather than a copy. It
+        stays valid until the next call to take_picture.
+
+        :param save_to_disk: Also write the image to the upload directory as current.png.
+        :param sharpest: With background capture running, return the sharpest of the buffered frames
+                         rather than the most recent one.
+        :return: The captured frame, or None if the capture failed.
+        """
+        if self.grabber is not None and self.grabber.running:
+            self.grabber.release(self._held_slot)
+            frame, self._held_slot = self.grabber.sharpest() if sharpest else self.grabber.latest()
+            ret = frame is not None
         else:
-	        print("failed to capture image")
-        # Release camera
-        #self.camera.release()
+            ret, frame = self.camera.read()
+        if not ret:
+            print("failed to capture image")
+            return None
+        if save_to_disk:
+            image_path = os.path.join(self.upload_directory, 'current.png')
+            cv2.imwrite(image_path, frame)
+            print(f"Image captured and saved to {image_path}")
+        return frame
 
     def cleanup(self):
         """Clean up GPIO and camera on shutdown"""
+        self.button.stop()
+        if self.grabber is not None:
+            self.grabber.stop()
         self.camera.release()
         GPIO.cleanup()
 
@@ -71,8 +225,9 @@ if __name__ == "__main__":
 
         print("Press the button (Ctrl+C to exit)...")
         while True:
-            if gpio.is_button_pressed():
-                gpio_handler.take_picture()  # Take a picture when the button is pressed
+            event = gpio.wait_for_press()
+            print(event)
+            gpio.take_picture(save_to_disk=True)  # Take a picture when the button is pressed
 
     except KeyboardInterrupt:
         print("\nExiting...")
@@ -0,0 +1,88 @@
+"""
+Module summary: In-memory image transport between the scanner and the detection server.
+
+Frames travel either as an encoded image (PNG, JPEG, ...) or as raw BGR pixels accompanied by a shape
+header such as ``480x640x3``. Raw frames must have three channels, like the images the models are fed. Raw frames are decoded without copying: the returned array is a read-only
+view over the received bytes, which is all the model needs as input.
+"""
+
+import cv2
+import numpy as np
+
+RAW_BGR_MIMETYPE = 'application/x-raw-bgr'
+SHAPE_HEADER = 'X-Frame-Shape'
+CHANNELS = 3  # Raw frames are BGR
+
+
+def format_shape(shape):
+    """Formats an array shape as a shape header, e.g. (480, 640, 3) -> '480x640x3'."""
+    return 'x'.join(str(dimension) for dimension in shape)
+
+
+def parse_shape(value):
+    """
+    Parses a shape header.
+
+    Args:
+        value (str): The shape as 'HEIGHTxWIDTHx3'.
+
+    Returns:
+        Tuple[int, int, int]: The parsed shape.
+
+    Raises:
+        ValueError: If the header is malformed or the frame is not BGR.
+    """
+    try:
+        shape = tuple(int(dimension) for dimension in value.lower().split('x'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid frame shape: {value!r}")
+    if len(shape) != 3 or any(dimension <= 0 for dimension in shape):
+        raise ValueError(f"Invalid frame shape: {value!r}, expected HEIGHTxWIDTHx{CHANNELS}")
+    if shape[2] != CHANNELS:
+        raise ValueError(f"Raw frames must be BGR with {CHANNELS} channels, got {shape[2]}")
+    return shape
+
+
+def decode_image(data, shape=None):
+    """
+    Decodes an image received in memory.
+
+    Args:
+        data (Union[bytes, bytearray, memoryview]): The encoded image, or the raw BGR pixels if `shape` is given.
+        shape (Union[str, Tuple[int, int, int]], optional): The shape of a raw BGR frame. None means `data` is
+            encoded.
+
+    Returns:
+        numpy.ndarray: The BGR image. Raw frames are returned as a read-only view over `data`.
+
+    Raises:
+        ValueError: If the data is empty, cannot be decoded, is not a BGR frame, or does not match the shape.
+    """
+    if not data:
+        raise ValueError("Empty image")
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if shape is not None:
+        shape = parse_shape(shape if isinstance(shape, str) else format_shape(shape))
+        if buffer.size != int(np.prod(shape)):
+            raise ValueError(f"Frame of {buffer.size} bytes does not match shape {format_shape(shape)}")
+        return buffer.reshape(shape)
+
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def encode_raw_frame(frame):
+    """
+    Prepares a frame to be sent as raw BGR pixels.
+
+    Args:
+        frame (numpy.ndarray): The BGR frame, as returned by the camera.
+
+    Returns:
+        Tuple[memoryview, str]: The pixel buffer, copied only if the frame is not contiguous, and its shape header.
+    """
+    frame = np.ascontiguousarray(frame)
+    return memoryview(frame).cast('B'), format_shape(frame.shape)
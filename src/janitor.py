@@ -0,0 +1,173 @@
+"""
+Module summary: Scheduled cleanup of uploaded and temporary files.
+
+A single background thread deletes the files of a folder once they expire, instead of one sleeping
+timer thread per file. Expiry times are kept in a heap, so the thread only wakes up when the next file
+is due. On top of the age limit, the total size of the files is bounded: when a new file exceeds the
+quota, the files closest to expiry are deleted early. Files that are in use, e.g. a video being processed
+or sent, are pinned and never deleted until they are unpinned.
+
+Expiry times derive from the modification times of the files, so the files left behind by a previous
+run of the server are found again and cleaned up on startup.
+"""
+
+import heapq
+import os
+import shutil
+import threading
+import time
+
+
+class FileJanitor:
+    """
+    Deletes the files of a folder, and of its sub-folders, after a maximum age or when they exceed a size quota.
+
+    Args:
+        root (str): The folder to manage.
+        max_age_s (float): The default time, in seconds, files are kept after their last modification.
+        max_bytes (int): The maximum total size of the files, in bytes.
+    """
+
+    def __init__(self, root, max_age_s, max_bytes):
+        self.root = root
+        self.max_age_s = max_age_s
+        self.max_bytes = max_bytes
+        self._condition = threading.Condition()
+        self._heap = []  # (expires_at, path), may hold stale entries for files that were rescheduled
+        self._files = {}  # path -> (expires_at, size)
+        self._pinned = {}  # path -> number of users of the file, which is not deleted while it is in use
+        self._bytes = 0
+        self._thread = None
+        self._pid = None
+        self.expired = 0
+        self.evicted = 0
+
+    def start(self):
+        """Registers the files already in the folder and starts the cleanup thread, unless it is running."""
+        with self._condition:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            # Threads do not survive a fork, so a forked worker starts its own thread
+            self._pid = os.getpid()
+            self._recover()
+            self._thread = threading.Thread(target=self._run, name='file-janitor', daemon=True)
+            self._thread.start()
+
+    def _recover(self):
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(directory, filename))
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                self._track(path, status.st_mtime + self.max_age_s, status.st_size)
+
+    def _track(self, path, expires_at, size):
+        previous = self._files.get(path)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._files[path] = (expires_at, size)
+        self._bytes += size
+        heapq.heappush(self._heap, (expires_at, path))
+
+    def schedule(self, path, max_age_s=None):
+        """
+        Schedules the deletion of a file, deleting the files closest to expiry if the quota is exceeded.
+
+        Args:
+            path (str): The file, inside the managed folder.
+            max_age_s (float, optional): The time, in seconds, to keep the file from now. Defaults to the
+                maximum age of the janitor.
+        """
+        self.start()
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        expires_at = time.time() + (self.max_age_s if max_age_s is None else max_age_s)
+        with self._condition:
+            self._track(os.path.normpath(path), expires_at, size)
+            self._enforce_quota()
+            self._condition.notify()
+
+    def pin(self, path):
+        """
+        Marks a file as in use, so that it is neither evicted nor expired until `unpin` is called.
+
+        Args:
+            path (str): The file, inside the managed folder.
+        """
+        path = os.path.normpath(path)
+        with self._condition:
+            self._pinned[path] = self._pinned.get(path, 0) + 1
+
+    def unpin(self, path):
+        """
+        Releases a file marked as in use by `pin`. A file that expired meanwhile is deleted.
+
+        Args:
+            path (str): The file, inside the managed folder.
+        """
+        path = os.path.normpath(path)
+        with self._condition:
+            users = self._pinned.pop(path, 0) - 1
+            if users > 0:
+                self._pinned[path] = users
+            elif path in self._files:
+                # Its heap entry may have been skipped while it was pinned
+                heapq.heappush(self._heap, (self._files[path][0], path))
+                self._enforce_quota()
+                self._condition.notify()
+
+    def _enforce_quota(self):
+        pinned = []
+        while self._bytes > self.max_bytes and len(self._files) > 1 and self._heap:
+            expires_at, path = heapq.heappop(self._heap)
+            if self._files.get(path, (None,))[0] != expires_at:
+                continue  # Stale entry
+            if path in self._pinned:
+                pinned.append((expires_at, path))
+                continue
+            self._delete(path)
+            self.evicted += 1
+        for entry in pinned:
+            heapq.heappush(self._heap, entry)
+
+    def _delete(self, path):
+        _, size = self._files.pop(path)
+        self._bytes -= size
+        try:
+            os.remove(path)
+            print(f"Deleted file: {path}")
+        except FileNotFoundError:
+            pass  # Already removed, e.g. by the janitor of another worker
+        except OSError as e:
+            print(f"Could not delete {path}: {e}")
+
+    def _run(self):
+        with self._condition:
+            while True:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    expires_at, path = heapq.heappop(self._heap)
+                    # A pinned file is pushed back by `unpin`
+                    if self._files.get(path, (None,))[0] == expires_at and path not in self._pinned:
+                        self._delete(path)
+                        self.expired += 1
+                self._condition.wait(timeout=self._heap[0][0] - now if self._heap else None)
+
+    def stats(self):
+        """
+        Reports the disk usage of the managed folder.
+
+        Returns:
+            Dict[str, Union[int, float]]: The number of tracked 'files', their 'bytes' and the 'max_bytes'
+            quota, the number of 'pinned' files in use, the 'max_age_s', the number of files deleted because they 'expired' or were 'evicted'
+            to respect the quota, and the 'disk_free_bytes' left on the device.
+        """
+        with self._condition:
+            return {'files': len(self._files), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'pinned': len(self._pinned),
+                    'max_age_s': self.max_age_s, 'expired': self.expired, 'evicted': self.evicted,
+                    'disk_free_bytes': shutil.disk_usage(self.root).free}
@@ -3,98 +3,89 @@
 
 import requests
 import os
-from audio import synthesize_audio
-from gpio_handler_no_debounce import GPIOHandler  # Import the GPIOHandler class
+from announcement import build_announcement, render_text
+from audio import shutdown_audio
+from detection_table import DetectionTable
+from detector_backend import create_detector
+from gpio_handler_no_debounce import GPIOHandler, LONG_PRESS  # Import the GPIOHandler class
+from monitor import SceneMonitor
+from spatial import summarize
+from tts_backends import create_tts_backend
 import time
 
-def calculate_position(bbox, image_width, image_height):
+# "local" runs the detection engine in this process, "remote" sends frames to the detection server
+DETECTOR_MODE = os.environ.get('DETECTOR_MODE', 'remote')
+# "button" scans on each button press, "monitor" watches the scene and announces what changes
+SCAN_MODE = os.environ.get('SCAN_MODE', 'button')
+MONITOR_SAMPLE_RATE = float(os.environ.get('MONITOR_SAMPLE_RATE', 2.0))  # Camera samples per second
+# "gtts" synthesizes speech online, "offline" plays pre-rendered clips of the announcement vocabulary
+TTS_BACKEND = os.environ.get('TTS_BACKEND', 'gtts')
+MONITOR_CPU_BUDGET = float(os.environ.get('MONITOR_CPU_BUDGET', 0.5))  # Fraction of time spent in inference
+# Positions are announced on a grid of 3 or 5 columns and rows, optionally with a distance estimated from box sizes
+SPATIAL_GRID_COLUMNS = int(os.environ.get('SPATIAL_GRID_COLUMNS', 3))
+SPATIAL_GRID_ROWS = int(os.environ.get('SPATIAL_GRID_ROWS', 3))
+SPATIAL_DISTANCES = os.environ.get('SPATIAL_DISTANCES') == '1'
+
+def process_image(image, language, detector=None, tts=None):
     """
-    Determines the position of the object relative to the image center.
+    Process the image with the detector backend and speak a summary of the detections.
 
-    :param bbox: Bounding box as [x_min, y_min, x_max, y_max].
-    :param image_width: Width of the image.
-    :param image_height: Height of the image.
-    :return: String describing the position (e.g., "to the left", "in the center").
+    :param image: The captured BGR frame, or the path of an image file.
+    :param language: The language code the summary is translated and spoken in.
+    :param detector: The detector backend, see detector_backend. Defaults to the remote detection server.
+    :param tts: The text-to-speech backend, see tts_backends. Defaults to TTS_BACKEND.
+    :return: The tokens of the spoken summary, or None if the detection failed.
     """
-    x_center = (bbox[0] + bbox[2]) / 2
-    y_center = (bbox[1] + bbox[3]) / 2
-
-    # Relative horizontal positioning
-    horizontal = (
-        "to the left of the camera" if x_center < image_width / 3 else
-        "to the right of the camera" if x_center > 2 * image_width / 3 else
-        "in front of the camera"
-    )
-
-    # Relative vertical positioning
-    vertical = (
-        "towards the top of the view" if y_center < image_height / 3 else
-        "towards the bottom of the view" if y_center > 2 * image_height / 3 else
-        "at the center of the view"
-    )
-
-    return f"{horizontal} and {vertical}"
-
-def process_image(filename, language):
-    """Process the image and send it to the server for detections."""
-    backend_url = "http://localhost:5000"
+    if detector is None:
+        detector = create_detector(DETECTOR_MODE)
+    if tts is None:
+        tts = create_tts_backend(TTS_BACKEND)
 
     try:
-        with open(filename, 'rb') as file:
-            image_bytes = file.read()
-            files = {'file': ('current.png', image_bytes, 'image/png')}
-
-            # Send request for detections
-            response = requests.post(
-                f"{backend_url}/get_detections",
-                files=files,
-                data={'auto_select': 'true', 'min_confidence': '0.25', 'model_size': 'n', 'target_language': language}
-            )
-
-            if response.status_code == 200:
-                detections_data = response.json()
-                detections_hashmap = {}
-
-                # Collect detections with bounding boxes
-                for detection in detections_data.get("detections", []):
-                    object_name = detection.get("translated_name", "unknown")
-                    bbox = detection.get("bounding_box", [0, 0, 0, 0])
-                    image_width = detections_data.get("image_width", 1)
-                    image_height = detections_data.get("image_height", 1)
-
-                    position = calculate_position(bbox, image_width, image_height)
-                    if object_name in detections_hashmap:
-                        detections_hashmap[object_name].append(position)
-                    else:
-                        detections_hashmap[object_name] = [position]
-
-                # Construct string
-                output_string = "Summary of inferences: "
-                for key, positions in detections_hashmap.items():
-                    count = len(positions)
-                    instances = "instance" if count == 1 else "instances"
-                    position_descriptions = ", ".join(positions)
-
-                    if count == 1:
-                        output_string += f"1 {key} located {position_descriptions}. "
-                    else:
-                        output_string += f"{count} {key}s located {position_descriptions}. "
-
-                print(output_string)
-                synthesize_audio(output_string, language)
-            else:
-                print(f"Error in detections request: {response.text}")
+        result = detector.detect(image, language)
+        table = result.table
+        if table is None:
+            table = DetectionTable.from_records(result.detections, result.image_width, result.image_height)
+
+        # Group identical objects found in the same place, then construct the summary
+        groups = summarize(table, SPATIAL_GRID_COLUMNS, SPATIAL_GRID_ROWS, distances=SPATIAL_DISTANCES)
+        tokens = build_announcement(groups, SPATIAL_GRID_COLUMNS, SPATIAL_GRID_ROWS)
+        print(render_text(tokens))
+        tts.speak_tokens(tokens, language)
+        return tokens
 
     except FileNotFoundError:
-        print(f"Error: The file {filename} does not exist.")
+        print(f"Error: The file {image} does not exist.")
     except requests.RequestException as e:
         print(f"Error: Failed to connect to the server. Details: {e}")
+    except RuntimeError as e:
+        print(e)
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+    return None
 
-def main(language="en"):
+def monitor_scene(gpio, detector, tts, language):
+    """
+    Watch the scene hands-free, announcing objects as they appear or leave.
+
+    :param gpio: The GPIOHandler whose camera is sampled.
+    :param detector: The detector backend.
+    :param tts: The text-to-speech backend.
+    :param language: The language code the announcements are spoken in.
+    """
+    monitor = SceneMonitor(gpio.take_picture, detector, language, tts.speak_tokens,
+                           sample_rate=MONITOR_SAMPLE_RATE, cpu_budget=MONITOR_CPU_BUDGET)
+    print("Monitoring the scene (Ctrl+C to exit)...")
+    try:
+        monitor.run()
+    finally:
+        print(f"Monitor statistics: {monitor.stats}")
+
+def main(language="en", detector_mode=DETECTOR_MODE, scan_mode=SCAN_MODE, tts_backend=TTS_BACKEND):
     url = "http://127.0.0.1:5000/"
-    while True:
+    detector = create_detector(detector_mode)
+    tts = create_tts_backend(tts_backend)
+    while detector_mode == 'remote':
         try:
             break # No ned for this
             response=requests.get(url)
@@ -105,23 +96,37 @@ def main(language="en"):
               print("Waiting for app to be ready")
         time.sleep(1)
 
+    if detector_mode == 'local':
+        detector.warm_up()  # Load the models now rather than on the first button press
+
     gpio = GPIOHandler(button_pin=17)  # Initialize GPIOHandler
+    gpio.start_capture()  # Keep the freshest frame ready for the next press
 
-    print("Press the button to take a picture (Ctrl+C to exit)...")
     try:
+        if scan_mode == 'monitor':
+            monitor_scene(gpio, detector, tts, language)
+            return
+
+        print("Press the button to take a picture, hold it to repeat the last summary (Ctrl+C to exit)...")
+        last_summary = None
         while True:
-            if gpio.is_button_pressed():
-                gpio.take_picture()  # Take a picture when the button is pressed
-                process_image(os.path.join(gpio.upload_directory, 'current.png'), language)  # Process the image
-                time.sleep(2)  # Debounce delay to prevent multiple captures
-                #gpio.cleanup()
-                #gpio = GPIOHandler(button_pin=17) # TODO: find a better workaround
+            event = gpio.wait_for_press()  # Sleeps until the button interrupt fires
+            if event.kind == LONG_PRESS:
+                if last_summary:
+                    tts.speak_tokens(last_summary, language)
+            else:
+                frame = gpio.take_picture()  # Take a picture when the button is pressed
+                if frame is not None:
+                    last_summary = process_image(frame, language, detector, tts) or last_summary  # Process the image in memory
+            gpio.button.clear()  # Drop the presses made while the scan was being spoken
 
     except KeyboardInterrupt:
         print("\nExiting...")
     finally:
         #pass
+        print(f"Capture statistics: {gpio.capture_stats()}")
         gpio.cleanup()  # Clean up GPIO and camera on exit
+        shutdown_audio()  # Release the audio mixer
 
 if __name__ == "__main__":
     main()
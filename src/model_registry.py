@@ -0,0 +1,224 @@
+"""
+Module summary: Lazy, memory-bounded registry of YOLOv10 models.
+
+Models are downloaded and constructed the first time a size is requested rather than at import time.
+Loaded models are kept in least-recently-used order and cold sizes are evicted once the resident
+weights exceed the configured memory budget. A subset of sizes can be pre-warmed at boot.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import wget
+
+try:
+    import psutil
+except ImportError:  # psutil is optional, it only refines the resident size report
+    psutil = None
+
+
+def estimate_model_bytes(model):
+    """
+    Estimates the memory held by a model's weights.
+
+    Args:
+        model: A YOLOv10 model wrapper, or any object exposing a torch ``nn.Module`` through ``.model``.
+
+    Returns:
+        int: The number of bytes held by the parameters and buffers of the model, the size of the model file
+        for exported models, or 0 if unknown.
+    """
+    module = getattr(model, 'model', model)
+    if isinstance(module, str):
+        # Exported models are only referenced by path until their runtime loads them
+        return os.path.getsize(module) if os.path.exists(module) else 0
+    total = 0
+    for attribute in ('parameters', 'buffers'):
+        tensors = getattr(module, attribute, None)
+        if not callable(tensors):
+            continue
+        for tensor in tensors():
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _current_rss():
+    """Returns the resident set size of this process in bytes, or None if psutil is unavailable."""
+    if psutil is None:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+class ModelRegistry:
+    """
+    Loads YOLOv10 models on demand and evicts the least recently used ones past a memory budget.
+
+    The registry behaves like the old ``models`` dictionary: ``registry[size]`` returns a ready model,
+    loading (and if needed downloading) it on first access.
+
+    Args:
+        model_folder (str): Directory where the ``yolov10{size}.pt`` weights are stored.
+        model_sizes (List[str]): The known model sizes, in ascending order.
+        model_urls (Dict[str, str]): Download URL for each model size.
+        memory_budget_mb (float, optional): Maximum resident weight size in megabytes. None disables eviction.
+        loader (Callable[[str, str], object], optional): Builds a model from ``(size, weights_path)``.
+    """
+
+    def __init__(self, model_folder, model_sizes, model_urls, memory_budget_mb=None, loader=None):
+        self.model_folder = model_folder
+        self.model_sizes = list(model_sizes)
+        self.model_urls = dict(model_urls)
+        self.memory_budget_bytes = None if memory_budget_mb is None else int(memory_budget_mb * 1024 * 1024)
+        self._loader = loader
+        self._models = OrderedDict()  # size -> model, least recently used first
+        self._stats = {size: {'loaded': False, 'loads': 0, 'hits': 0, 'evictions': 0, 'load_time_s': None,
+                              'resident_bytes': 0, 'rss_delta_bytes': None, 'last_used': None}
+                       for size in self.model_sizes}
+        self._lock = threading.Lock()
+        self._load_locks = {size: threading.Lock() for size in self.model_sizes}
+
+    def weights_path(self, size):
+        """Returns the path of the PyTorch weights for a model size."""
+        return os.path.join(self.model_folder, f'yolov10{size}.pt')
+
+    def _ensure_weights(self, size):
+        model_path = self.weights_path(size)
+        if not os.path.exists(model_path):
+            print(f"Downloading model {model_path}...")
+            wget.download(self.model_urls[size], model_path)
+        return model_path
+
+    def _load(self, size):
+        if self._loader is None:
+            from ultralytics import YOLOv10  # Deferred so that importing the registry stays cheap
+            loader = lambda _size, path: YOLOv10(path)
+        else:
+            loader = self._loader
+
+        model_path = self._ensure_weights(size)
+        rss_before = _current_rss()
+        start = time.perf_counter()
+        model = loader(size, model_path)
+        load_time = time.perf_counter() - start
+        rss_after = _current_rss()
+
+        stats = self._stats[size]
+        stats['loads'] += 1
+        stats['load_time_s'] = load_time
+        stats['resident_bytes'] = estimate_model_bytes(model)
+        stats['rss_delta_bytes'] = None if rss_before is None else rss_after - rss_before
+        print(f"Loaded model {size} in {load_time:.2f}s ({stats['resident_bytes'] / 1e6:.1f} MB of weights)")
+        return model
+
+    def get(self, size):
+        """
+        Returns the model for a size, loading it if it is not resident.
+
+        Args:
+            size (str): The model size to retrieve.
+
+        Returns:
+            The loaded YOLOv10 model.
+
+        Raises:
+            KeyError: If the size is not a known model size.
+        """
+        if size not in self._load_locks:
+            raise KeyError(f"Unknown model size: {size}")
+
+        with self._lock:
+            model = self._models.get(size)
+            if model is not None:
+                self._models.move_to_end(size)
+                self._stats[size]['hits'] += 1
+                self._stats[size]['last_used'] = time.time()
+                return model
+
+        # Serialise loads of the same size so that concurrent requests do not construct it twice
+        with self._load_locks[size]:
+            with self._lock:
+                model = self._models.get(size)
+            if model is None:
+                model = self._load(size)
+                with self._lock:
+                    self._models[size] = model
+                    self._stats[size]['loaded'] = True
+                    self._evict_over_budget(keep=size)
+
+        with self._lock:
+            self._stats[size]['last_used'] = time.time()
+        return model
+
+    def __getitem__(self, size):
+        return self.get(size)
+
+    def __contains__(self, size):
+        return size in self._load_locks
+
+    def _evict_over_budget(self, keep):
+        """Evicts least recently used models until the budget is met. Must hold ``self._lock``."""
+        if self.memory_budget_bytes is None:
+            return
+        for size in list(self._models):
+            if self._resident_bytes_locked() <= self.memory_budget_bytes:
+                break
+            if size == keep:
+                continue
+            self._evict_locked(size)
+
+    def _evict_locked(self, size):
+        self._models.pop(size, None)
+        stats = self._stats[size]
+        stats['loaded'] = False
+        stats['evictions'] += 1
+        print(f"Evicted model {size} from memory")
+
+    def evict(self, size):
+        """Drops a model from memory. It will be reloaded the next time it is requested."""
+        with self._lock:
+            if size in self._models:
+                self._evict_locked(size)
+
+    def prewarm(self, sizes):
+        """
+        Loads the given model sizes ahead of the first request.
+
+        Args:
+            sizes (Iterable[str]): The model sizes to load. Unknown sizes are ignored with a warning.
+        """
+        for size in sizes:
+            if size not in self:
+                print(f"Skipping pre-warm of unknown model size: {size}")
+                continue
+            self.get(size)
+
+    def loaded_sizes(self):
+        """Returns the resident model sizes, least recently used first."""
+        with self._lock:
+            return list(self._models)
+
+    def _resident_bytes_locked(self):
+        """Sums the resident sizes of the loaded models. Must hold ``self._lock``."""
+        return sum(self._stats[size]['resident_bytes'] for size in self._models)
+
+    def resident_bytes(self):
+        """Returns the estimated number of bytes held by the resident models' weights."""
+        with self._lock:
+            return self._resident_bytes_locked()
+
+    def stats(self):
+        """
+        Reports the state of every model size.
+
+        Returns:
+            Dict[str, Dict]: For each size, whether it is loaded, how many times it was loaded, hit and
+            evicted, the last load time in seconds and the resident size of its weights in bytes.
+        """
+        with self._lock:
+            return {
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'resident_bytes': self._resident_bytes_locked(),
+                'models': {size: dict(stats) for size, stats in self._stats.items()},
+            }
@@ -0,0 +1,182 @@
+"""
+Module summary: Hands-free scene monitoring.
+
+The camera is sampled continuously, but the detector only runs when the scene has meaningfully changed
+since the last inference. Change is judged on a tiny grayscale thumbnail, by the mean absolute pixel
+difference and by the Hamming distance between difference hashes, both of which cost a fraction of a
+millisecond. Inference is further rate limited to a CPU budget, and only objects that appeared or left
+since the previous inference are announced.
+"""
+
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+import announcement
+
+THUMBNAIL_SIZE = (64, 48)
+
+
+def thumbnail(frame):
+    """Returns a small grayscale version of a BGR frame, used to compare scenes cheaply."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def difference_hash(gray):
+    """
+    Computes the 64-bit difference hash of a grayscale image.
+
+    Args:
+        gray (numpy.ndarray): The grayscale image.
+
+    Returns:
+        numpy.ndarray: 64 booleans, one per horizontally adjacent pixel pair of an 9x8 thumbnail.
+    """
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def count_objects(detections):
+    """Counts the detections per translated object name."""
+    return Counter(detection.get('translated_name', 'unknown') for detection in detections)
+
+
+def describe_changes(previous_counts, current_counts):
+    """
+    Describes which objects appeared and which left between two inferences.
+
+    Args:
+        previous_counts (Counter): The object counts of the previous inference.
+        current_counts (Counter): The object counts of the current inference.
+
+    Returns:
+        List[str]: The tokens of the announcement, see announcement.build_change_announcement, or None if the
+        objects did not change.
+    """
+    tokens = announcement.build_change_announcement(current_counts - previous_counts,
+                                                    previous_counts - current_counts)
+    return tokens or None
+
+
+class SceneMonitor:
+    """
+    Watches a camera and announces the objects that appear in or leave the scene.
+
+    Args:
+        capture (Callable[[], numpy.ndarray]): Returns the current camera frame, or None if it failed.
+        detector: A detector backend from detector_backend.
+        language (str): The language code of the announcements.
+        announce (Callable[[List[str], str], None]): Speaks the tokens of an announcement in a language, e.g.
+            the speak_tokens method of a text-to-speech backend.
+        sample_rate (float, optional): Camera samples per second. Defaults to 2.
+        pixel_threshold (float, optional): Mean absolute difference, out of 255, between thumbnails above
+            which the scene is considered changed. Defaults to 8.
+        hash_threshold (int, optional): Number of differing hash bits, out of 64, above which the scene is
+            considered changed. Defaults to 10.
+        cpu_budget (float, optional): Maximum fraction of wall time spent in inference. Defaults to 0.5.
+    """
+
+    def __init__(self, capture, detector, language, announce, sample_rate=2.0, pixel_threshold=8.0,
+                 hash_threshold=10, cpu_budget=0.5):
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be in (0, 1]")
+        self.capture = capture
+        self.detector = detector
+        self.language = language
+        self.announce = announce
+        self.sample_interval = 1.0 / sample_rate
+        self.pixel_threshold = pixel_threshold
+        self.hash_threshold = hash_threshold
+        self.cpu_budget = cpu_budget
+
+        self._reference = None  # Thumbnail of the last frame that was sent to the detector
+        self._reference_hash = None
+        self._counts = Counter()
+        self._next_inference_at = 0.0
+        self.stats = {'samples': 0, 'unchanged': 0, 'deferred': 0, 'inferences': 0, 'announcements': 0,
+                      'inference_time_s': 0.0}
+
+    def has_changed(self, gray):
+        """
+        Decides whether a thumbnail differs enough from the last inferred one to run the detector.
+
+        Args:
+            gray (numpy.ndarray): The grayscale thumbnail of the current frame.
+
+        Returns:
+            bool: True if the scene changed, or if nothing was inferred yet.
+        """
+        if self._reference is None:
+            return True
+        pixel_difference = float(np.mean(cv2.absdiff(gray, self._reference)))
+        hash_distance = int(np.count_nonzero(difference_hash(gray) != self._reference_hash))
+        return pixel_difference > self.pixel_threshold or hash_distance > self.hash_threshold
+
+    def step(self):
+        """
+        Samples one frame and runs the detector on it if the scene changed and the CPU budget allows.
+
+        Returns:
+            str: The text of the announcement made for this frame, or None.
+        """
+        frame = self.capture()
+        if frame is None:
+            return None
+        self.stats['samples'] += 1
+
+        gray = thumbnail(frame)
+        if not self.has_changed(gray):
+            self.stats['unchanged'] += 1
+            return None
+
+        now = time.monotonic()
+        if now < self._next_inference_at:
+            # The reference is left untouched, so the change is picked up once the budget allows
+            self.stats['deferred'] += 1
+            return None
+
+        start = time.monotonic()
+        result = self.detector.detect(frame, self.language)
+        inference_time = time.monotonic() - start
+        self.stats['inferences'] += 1
+        self.stats['inference_time_s'] += inference_time
+        # Idle long enough after this inference for it to stay within the budget
+        self._next_inference_at = start + inference_time / self.cpu_budget
+
+        self._reference = gray
+        self._reference_hash = difference_hash(gray)
+        counts = count_objects(result.detections)
+        tokens = describe_changes(self._counts, counts)
+        self._counts = counts
+
+        if not tokens:
+            return None
+        text = announcement.render_text(tokens)
+        print(text)
+        self.stats['announcements'] += 1
+        self.announce(tokens, self.language)
+        return text
+
+    def run(self, stop_event=None):
+        """
+        Monitors the scene until interrupted.
+
+        Args:
+            stop_event (threading.Event, optional): Stops the monitor when set. Without one, it runs until
+                KeyboardInterrupt.
+        """
+        while stop_event is None or not stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.step()
+            except Exception as e:
+                print(f"Error while monitoring the scene: {e}")
+            remaining = self.sample_interval - (time.monotonic() - started)
+            if remaining > 0:
+                if stop_event is None:
+                    time.sleep(remaining)
+                else:
+                    stop_event.wait(remaining)
@@ -0,0 +1,155 @@
+"""
+Module summary: Adaptive input resolution with region-of-interest tiling.
+
+Detecting at a low input size is several times cheaper than at the model's native size, and is enough
+for large, clearly visible objects. The policy runs the whole image at a low size first and only spends
+more compute where it found small or uncertain objects:
+
+- If the image is not much larger than the high input size, the whole image is run again at that size.
+- Otherwise the image is cut into overlapping tiles of the high input size, and only the tiles that
+  overlap a small or uncertain detection are run, at their native resolution.
+
+The detections of every pass are merged with class-aware non-maximum suppression, and the time spent at
+each input size is reported.
+"""
+
+import time
+
+import numpy as np
+
+
+def box_area_fractions(boxes, width, height):
+    """Returns the fraction of the image area covered by each (N, 4) xyxy box."""
+    sizes = np.clip(boxes[:, 2:4] - boxes[:, 0:2], 0, None)
+    return sizes[:, 0] * sizes[:, 1] / max(width * height, 1)
+
+
+def non_max_suppression(detections, iou_threshold):
+    """
+    Keeps the most confident of the overlapping detections of each class.
+
+    Args:
+        detections (numpy.ndarray): The (N, 6) x1, y1, x2, y2, confidence, class rows.
+        iou_threshold (float): The overlap above which the less confident detection is dropped.
+
+    Returns:
+        numpy.ndarray: The kept rows, from the most to the least confident.
+    """
+    if len(detections) == 0:
+        return detections
+    # Offsetting the boxes of each class far apart keeps the classes from suppressing each other
+    offsets = detections[:, 5:6] * (detections[:, :4].max() + 1)
+    boxes = detections[:, :4] + offsets
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-detections[:, 4])
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        top_left = np.maximum(boxes[best, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[rest, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        overlaps = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[overlaps <= iou_threshold]
+    return detections[keep]
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """
+    Covers an image with overlapping square tiles.
+
+    Args:
+        width (int): The width of the image.
+        height (int): The height of the image.
+        tile_size (int): The side of the tiles, shrunk to the image if it is smaller.
+        overlap (float): The fraction of a tile shared with its neighbours.
+
+    Returns:
+        numpy.ndarray: The (T, 4) x1, y1, x2, y2 tiles.
+    """
+    def starts(length, size):
+        if length <= size:
+            return [0]
+        stride = max(1, int(size * (1 - overlap)))
+        positions = list(range(0, length - size, stride))
+        return positions + [length - size]
+
+    tile_width, tile_height = min(tile_size, width), min(tile_size, height)
+    return np.array([(x, y, x + tile_width, y + tile_height)
+                     for y in starts(height, tile_height) for x in starts(width, tile_width)], dtype=np.int32)
+
+
+class ResolutionPolicy:
+    """
+    Runs a detector at a low input size, and at a high one or on tiles only where needed.
+
+    Args:
+        run (Callable[[List[numpy.ndarray], int], List[numpy.ndarray]]): Runs the detector on a list of
+            BGR images at an input size, returning the (N, 6) detection rows of each image.
+        low_imgsz (int, optional): The input size of the first pass. Defaults to 320.
+        high_imgsz (int, optional): The input size of the second pass, and the side of the tiles. Defaults to 640.
+        uncertain_confidence (float, optional): Detections below this confidence are looked at again. Defaults to 0.5.
+        small_area (float, optional): Detections covering less than this fraction of the image are looked
+            at again. Defaults to 0.01.
+        tile_overlap (float, optional): The fraction of a tile shared with its neighbours. Defaults to 0.2.
+        nms_iou (float, optional): The overlap above which merged detections of a class are suppressed. Defaults to 0.5.
+    """
+
+    def __init__(self, run, low_imgsz=320, high_imgsz=640, uncertain_confidence=0.5, small_area=0.01,
+                 tile_overlap=0.2, nms_iou=0.5):
+        self.run = run
+        self.low_imgsz = low_imgsz
+        self.high_imgsz = high_imgsz
+        self.uncertain_confidence = uncertain_confidence
+        self.small_area = small_area
+        self.tile_overlap = tile_overlap
+        self.nms_iou = nms_iou
+
+    def _timed(self, images, imgsz, timings):
+        start = time.perf_counter()
+        outputs = self.run(images, imgsz)
+        timings.append({'imgsz': imgsz, 'inputs': len(images), 'latency_ms': (time.perf_counter() - start) * 1000})
+        return outputs
+
+    def regions_of_interest(self, detections, width, height):
+        """Returns the (R, 4) boxes of the detections that are uncertain or small."""
+        uncertain = detections[:, 4] < self.uncertain_confidence
+        small = box_area_fractions(detections[:, :4], width, height) < self.small_area
+        return detections[uncertain | small, :4]
+
+    def detect(self, image):
+        """
+        Detects objects in an image, refining only the regions where the first pass was not sure.
+
+        Args:
+            image (numpy.ndarray): The BGR image.
+
+        Returns:
+            Tuple[numpy.ndarray, List[Dict]]: The merged (N, 6) detection rows, and for each pass its
+            'imgsz', the number of 'inputs' it ran on and its 'latency_ms'.
+        """
+        height, width = image.shape[:2]
+        timings = []
+        detections = self._timed([image], self.low_imgsz, timings)[0]
+        regions = self.regions_of_interest(detections, width, height)
+        if len(regions) == 0:
+            return detections, timings
+
+        if max(width, height) <= self.high_imgsz * 1.5:
+            refined = self._timed([image], self.high_imgsz, timings)[0]
+            passes = [detections, refined]
+        else:
+            tiles = tile_grid(width, height, self.high_imgsz, self.tile_overlap)
+            # A tile is run if it overlaps any region of interest
+            overlapping = ((tiles[:, None, 0] < regions[None, :, 2]) & (tiles[:, None, 2] > regions[None, :, 0])
+                           & (tiles[:, None, 1] < regions[None, :, 3]) & (tiles[:, None, 3] > regions[None, :, 1]))
+            tiles = tiles[overlapping.any(axis=1)]
+            crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+            passes = [detections]
+            for (x1, y1, _, _), tile_detections in zip(tiles, self._timed(crops, self.high_imgsz, timings)):
+                shifted = tile_detections.copy()
+                shifted[:, [0, 2]] += x1
+                shifted[:, [1, 3]] += y1
+                passes.append(shifted)
+
+        return non_max_suppression(np.concatenate(passes).astype(np.float32), self.nms_iou), timings
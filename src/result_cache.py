@@ -0,0 +1,142 @@
+"""
+Module summary: Content-addressed cache of detection results.
+
+Results are keyed by a hash of the image pixels together with the parameters that affect them, so the
+same image sent twice, whether as a JPEG, a PNG or a raw frame, is only processed once. The cache is
+bounded by the approximate number of bytes it holds and evicts the least recently used entries first.
+
+Concurrent requests for a key that is still being computed wait for that computation instead of
+starting their own, and share its result.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def image_digest(image):
+    """
+    Hashes the pixels and shape of an image.
+
+    Args:
+        image (numpy.ndarray): The image.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image.shape, image.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A thread-safe LRU cache, bounded in bytes, that coalesces concurrent computations of the same key.
+
+    Args:
+        max_bytes (int): The maximum total size of the cached values. 0 disables caching, while still
+            coalescing concurrent computations.
+        sizeof (Callable[[object], int]): Returns the approximate size of a value, in bytes.
+    """
+
+    def __init__(self, max_bytes, sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size), least recently used first
+        self._in_flight = {}  # key -> Future of the running computation
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached value of a key, or None, marking it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """Caches a value, replacing the previous value of the key, and evicts entries that no longer fit."""
+        size = self.sizeof(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value of a key, computing and caching it on a miss.
+
+        Args:
+            key (Hashable): The key.
+            compute (Callable[[], object]): Computes the value. Exceptions are raised to every caller
+                waiting for this computation and nothing is cached.
+
+        Returns:
+            Tuple[object, bool]: The value, and whether it was served without running `compute`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], True
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result(), True
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        # Cached before the computation is unregistered, so that no request in between computes it again
+        self.put(key, value)
+        with self._lock:
+            del self._in_flight[key]
+        future.set_result(value)
+        return value, False
+
+    def clear(self):
+        """Drops every cached value."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Reports the state of the cache.
+
+        Returns:
+            Dict[str, int]: The number of 'entries', the cached 'bytes' and 'max_bytes', and the number of
+            'hits', 'misses', 'coalesced' requests that waited for a running computation, and 'evictions'.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced,
+                    'evictions': self.evictions}
@@ -0,0 +1,310 @@
+"""
+Module summary: Inference runtimes for the YOLOv10 models.
+
+The PyTorch weights are the slowest way to run the models on an ARM CPU. A runtime exports each model
+size once and caches the artifact next to its ``.pt`` file:
+
+- "torch" runs the PyTorch weights, as before.
+- "onnx" exports the model to ONNX and runs it with ONNX Runtime.
+- "onnx-int8" additionally quantizes the weights and activations of the convolutions to INT8, with the
+  activation ranges calibrated on frames saved from the rooms the scanner is used in, e.g. copied from
+  the uploads saved with 'save_upload', into ``models/calibration``.
+
+The runtime is chosen at startup, see ``create_loader``, and the models keep the same interface, so the
+rest of the detector does not depend on it. Running this module compares a runtime against PyTorch on
+the calibration frames and reports the speed-up and how closely the detections agree.
+
+Example:
+    python runtimes.py --runtime onnx-int8 --sizes n,s --images ./models/calibration
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+RUNTIMES = ('torch', 'onnx', 'onnx-int8')
+EXPORT_IMGSZ = 640
+CALIBRATION_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MAX_CALIBRATION_FRAMES = 64
+PARITY_MATCH_IOU = 0.5
+
+
+def artifact_path(weights_path, runtime):
+    """Returns where the exported model of a runtime is cached, e.g. models/yolov10n.int8.onnx."""
+    stem = os.path.splitext(weights_path)[0]
+    if runtime == 'onnx':
+        return f'{stem}.onnx'
+    if runtime == 'onnx-int8':
+        return f'{stem}.int8.onnx'
+    return weights_path
+
+
+def _is_fresh(path, source_path):
+    """Returns True if an artifact exists and was produced after its source."""
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def calibration_frames(folder, limit=MAX_CALIBRATION_FRAMES):
+    """
+    Lists the frames used to calibrate the quantization and to compare the runtimes.
+
+    Args:
+        folder (str): The folder of saved frames.
+        limit (int, optional): The maximum number of frames. Defaults to MAX_CALIBRATION_FRAMES.
+
+    Returns:
+        List[str]: The image paths, sorted.
+    """
+    paths = sorted(path for path in glob.glob(os.path.join(folder, '*'))
+                   if path.lower().endswith(CALIBRATION_EXTENSIONS))
+    return paths[:limit]
+
+
+def letterbox(image, size=EXPORT_IMGSZ):
+    """
+    Prepares a BGR image as the exported models expect it.
+
+    Args:
+        image (numpy.ndarray): The BGR image.
+        size (int, optional): The side of the square input. Defaults to EXPORT_IMGSZ.
+
+    Returns:
+        numpy.ndarray: The (1, 3, size, size) float32 RGB tensor, scaled to [0, 1] and padded with gray.
+    """
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255
+
+
+def export_onnx(weights_path):
+    """
+    Exports PyTorch weights to ONNX, unless an up-to-date export is cached.
+
+    Args:
+        weights_path (str): The ``.pt`` weights.
+
+    Returns:
+        str: The path of the ONNX model.
+    """
+    onnx_path = artifact_path(weights_path, 'onnx')
+    if _is_fresh(onnx_path, weights_path):
+        return onnx_path
+
+    from ultralytics import YOLOv10
+
+    print(f"Exporting {weights_path} to ONNX...")
+    # Dynamic axes keep micro-batching and other input sizes possible
+    exported = YOLOv10(weights_path).export(format='onnx', imgsz=EXPORT_IMGSZ, dynamic=True, simplify=True)
+    if os.path.abspath(exported) != os.path.abspath(onnx_path):
+        os.replace(exported, onnx_path)
+    return onnx_path
+
+
+class _CalibrationReader:
+    """Feeds the calibration frames to ONNX Runtime's static quantization, one at a time."""
+
+    def __init__(self, input_name, paths):
+        self.input_name = input_name
+        self.paths = iter(paths)
+
+    def get_next(self):
+        for path in self.paths:
+            image = cv2.imread(path)
+            if image is not None:
+                return {self.input_name: letterbox(image)}
+        return None
+
+
+def quantize_int8(weights_path, calibration_folder):
+    """
+    Quantizes the ONNX export of a model to INT8, unless an up-to-date quantized model is cached.
+
+    Only convolutions and matrix multiplications are quantized. The post-processing at the end of the
+    model keeps its float precision.
+
+    Args:
+        weights_path (str): The ``.pt`` weights.
+        calibration_folder (str): The folder of frames the activation ranges are calibrated on.
+
+    Returns:
+        str: The path of the quantized model.
+
+    Raises:
+        FileNotFoundError: If the calibration folder holds no frame.
+    """
+    int8_path = artifact_path(weights_path, 'onnx-int8')
+    onnx_path = export_onnx(weights_path)
+    if _is_fresh(int8_path, onnx_path):
+        return int8_path
+
+    frames = calibration_frames(calibration_folder)
+    if not frames:
+        raise FileNotFoundError(f"No calibration frames in {calibration_folder}")
+
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    print(f"Quantizing {onnx_path} to INT8 on {len(frames)} calibration frames...")
+    quantize_static(onnx_path, int8_path, _CalibrationReader(input_name, frames),
+                    quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    per_channel=True, op_types_to_quantize=['Conv', 'MatMul'],
+                    calibrate_method=CalibrationMethod.MinMax)
+    return int8_path
+
+
+def create_loader(runtime, calibration_folder=None):
+    """
+    Builds the model loader of a runtime, for the model registry.
+
+    Args:
+        runtime (str): One of RUNTIMES.
+        calibration_folder (str, optional): The frames the INT8 quantization is calibrated on. Without
+            frames, "onnx-int8" falls back to the float ONNX model.
+
+    Returns:
+        Callable[[str, str], object]: Builds a model from ``(size, weights_path)``.
+
+    Raises:
+        ValueError: If the runtime is unknown.
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown inference runtime: {runtime!r}, expected one of {RUNTIMES}")
+
+    def load(size, weights_path):
+        from ultralytics import YOLOv10  # Deferred so that importing the runtimes stays cheap
+
+        if runtime == 'torch':
+            return YOLOv10(weights_path)
+        path = export_onnx(weights_path)
+        if runtime == 'onnx-int8':
+            try:
+                path = quantize_int8(weights_path, calibration_folder)
+            except FileNotFoundError as e:
+                print(f"{e}, running model {size} with the float ONNX model")
+        return YOLOv10(path, task='detect')
+
+    return load
+
+
+def _box_iou_matrix(boxes_a, boxes_b):
+    """Returns the (N, M) intersection over union between two arrays of xyxy boxes."""
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def compare_detections(reference, candidate, iou=PARITY_MATCH_IOU):
+    """
+    Matches the detections of a runtime to those of the reference, greedily by confidence.
+
+    Args:
+        reference (numpy.ndarray): The (N, 6) x1, y1, x2, y2, confidence, class rows of the reference.
+        candidate (numpy.ndarray): The (M, 6) rows of the runtime being compared.
+        iou (float, optional): The minimum overlap of two matching boxes of the same class.
+
+    Returns:
+        Tuple[int, List[float]]: The number of matches and the confidence difference of each match.
+    """
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, []
+    overlaps = _box_iou_matrix(reference[:, :4], candidate[:, :4])
+    overlaps[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0
+    matched = np.zeros(len(candidate), dtype=bool)
+    differences = []
+    for index in np.argsort(-reference[:, 4]):
+        available = np.where(matched, 0, overlaps[index])
+        best = int(np.argmax(available))
+        if available[best] >= iou:
+            matched[best] = True
+            differences.append(float(candidate[best, 4] - reference[index, 4]))
+    return len(differences), differences
+
+
+def parity_report(size, runtime, weights_path, image_paths, calibration_folder=None):
+    """
+    Compares a runtime against PyTorch on a set of images.
+
+    Args:
+        size (str): The model size.
+        runtime (str): The runtime to compare, one of RUNTIMES.
+        weights_path (str): The ``.pt`` weights.
+        image_paths (List[str]): The images to run.
+        calibration_folder (str, optional): The calibration frames of "onnx-int8".
+
+    Returns:
+        Dict: The median latency of each runtime in milliseconds, the 'speedup', and the 'precision' and
+        'recall' of the runtime's detections against those of PyTorch with the 'mean_confidence_delta'
+        of the matched detections.
+    """
+    reference_model = create_loader('torch')(size, weights_path)
+    candidate_model = create_loader(runtime, calibration_folder)(size, weights_path)
+
+    latencies = {'torch': [], runtime: []}
+    reference_count = candidate_count = matches = 0
+    differences = []
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        outputs = {}
+        for name, model in (('torch', reference_model), (runtime, candidate_model)):
+            model(image, verbose=False)  # Warm-up, the first call of a runtime includes its initialization
+            start = time.perf_counter()
+            result = model(image, verbose=False)[0]
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            outputs[name] = result.boxes.data.cpu().numpy()
+        count, deltas = compare_detections(outputs['torch'], outputs[runtime])
+        reference_count += len(outputs['torch'])
+        candidate_count += len(outputs[runtime])
+        matches += count
+        differences += deltas
+
+    torch_ms = float(np.median(latencies['torch'])) if latencies['torch'] else None
+    runtime_ms = float(np.median(latencies[runtime])) if latencies[runtime] else None
+    return {
+        'model_size': size,
+        'runtime': runtime,
+        'images': len(latencies['torch']),
+        'torch_median_ms': torch_ms,
+        'runtime_median_ms': runtime_ms,
+        'speedup': torch_ms / runtime_ms if torch_ms and runtime_ms else None,
+        'precision': matches / candidate_count if candidate_count else None,
+        'recall': matches / reference_count if reference_count else None,
+        'mean_confidence_delta': float(np.mean(differences)) if differences else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the models to a runtime and compare it with PyTorch.')
+    parser.add_argument('--runtime', default='onnx', choices=RUNTIMES[1:], help='The runtime to compare.')
+    parser.add_argument('--sizes', default='n', help='Comma separated model sizes. Defaults to n.')
+    parser.add_argument('--models', default='./models', help='The folder of the .pt weights.')
+    parser.add_argument('--images', default='./models/calibration',
+                        help='Frames to calibrate the quantization and to compare the runtimes on.')
+    args = parser.parse_args()
+
+    images = calibration_frames(args.images)
+    for model_size in filter(None, args.sizes.split(',')):
+        weights = os.path.join(args.models, f'yolov10{model_size}.pt')
+        if not os.path.exists(weights):
+            print(f"Skipping model {model_size}, {weights} was not downloaded yet")
+            continue
+        report = parity_report(model_size, args.runtime, weights, images, args.images)
+        report_path = os.path.join(args.models, f'parity_{model_size}_{args.runtime}.json')
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(json.dumps(report, indent=2))
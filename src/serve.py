@@ -0,0 +1,104 @@
+"""
+Module summary: Production launcher for the detection service.
+
+The Flask development server started by ``python detector.py`` serves one request at a time per thread
+and is not meant for deployment. This launcher runs the same app under gunicorn:
+
+- The chosen model sizes are loaded once, in the master process, before the workers are forked. The
+  workers share the weight pages copy-on-write, and the garbage collector is frozen before forking so
+  that it does not write to, and therefore duplicate, those pages.
+- Each worker serves a bounded number of concurrent requests with its threads, and the PyTorch thread
+  pool of each worker is sized so that all workers together use the cores once.
+- Sending SIGHUP to the master gracefully replaces the workers, letting in-flight requests finish.
+
+One worker is the default, and the supported setup. The result cache, the in-memory translations, the batch
+scheduler and the metrics at /metrics belong to a process. With several workers, duplicate requests are
+only coalesced within a worker, and each scrape of /metrics returns the numbers of whichever worker served it,
+labelled with its pid in 'worker'. Scale with --threads first; more workers need --allow-multiple-workers.
+
+Example:
+    python serve.py --threads 4 --bind 0.0.0.0:5000 --preload n,s
+"""
+
+import argparse
+import gc
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+def _worker_torch_threads(workers):
+    """Returns the number of PyTorch threads per worker, so that the workers do not oversubscribe the cores."""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+class DetectionServer(BaseApplication):
+    """
+    Runs the Flask app of detector.py under gunicorn with the models pre-loaded in the master.
+
+    Args:
+        options (Dict): gunicorn settings, e.g. 'bind', 'workers', 'threads', 'timeout'.
+        preload_sizes (List[str]): The model sizes to load before forking the workers.
+    """
+
+    def __init__(self, options, preload_sizes):
+        self.options = options
+        self.preload_sizes = preload_sizes
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+        self.cfg.set('preload_app', True)
+        self.cfg.set('post_fork', self._post_fork)
+
+    def load(self):
+        import detector  # Loaded once, in the master, because preload_app is set
+
+        detector.models.prewarm(self.preload_sizes)
+        # Objects created so far are never collected nor touched by the collector again, so the pages
+        # holding them, the model weights included, stay shared with the forked workers
+        gc.freeze()
+        return detector.app
+
+    def _post_fork(self, server, worker):
+        import torch
+
+        torch.set_num_threads(_worker_torch_threads(self.cfg.workers))
+        if self.cfg.workers > 1:
+            import telemetry
+
+            # The metrics of each worker only cover its own requests, keep them apart
+            telemetry.registry.const_labels = {'worker': str(worker.pid)}
+        server.log.info(f"Worker {worker.pid} using {torch.get_num_threads()} PyTorch threads")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the detection service with pre-forked workers.')
+    parser.add_argument('--bind', default='0.0.0.0:5000', help='Address to listen on. Defaults to 0.0.0.0:5000.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes. Defaults to 1, see --allow-multiple-workers.')
+    parser.add_argument('--allow-multiple-workers', action='store_true',
+                        help='Allow more than one worker. Caches and metrics are then kept per worker.')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Concurrent requests per worker. Defaults to 4.')
+    parser.add_argument('--timeout', type=int, default=120, help='Seconds before a silent worker is restarted.')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='Seconds workers get to finish their requests on reload or shutdown.')
+    parser.add_argument('--preload', default=os.environ.get('PREWARM_MODEL_SIZES', 'n'),
+                        help='Comma separated model sizes to load before forking. Defaults to PREWARM_MODEL_SIZES.')
+    args = parser.parse_args()
+    if args.workers > 1 and not args.allow_multiple_workers:
+        parser.error('the result cache and /metrics are per worker, pass --allow-multiple-workers to run '
+                     f'{args.workers} workers anyway')
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+    }
+    DetectionServer(options, [size for size in args.preload.split(',') if size]).run()
@@ -0,0 +1,73 @@
+"""
+Module summary: Spatial summaries of detections.
+
+All the boxes of a DetectionTable are binned into a grid at once, optionally together with a rough
+distance estimated from the share of the image each box covers. Detections of the same object that fall
+in the same cell, at the same distance, are grouped, so that three chairs on the left become a single
+"3 chairs to the left" instead of three repeated positions. The result is structured data, rendered into
+words by the announcement module.
+"""
+
+import numpy as np
+
+# Distance buckets, from the nearest to the farthest, by the fraction of the image area covered by a box.
+# Object sizes vary a lot between classes, so this only separates what fills the view from what does not.
+DISTANCE_AREA_THRESHOLDS = (0.15, 0.03)
+NEAR, MIDDLE, FAR = range(3)
+
+
+def estimate_distances(table):
+    """
+    Estimates how far every detection is from the camera from the size of its box.
+
+    Args:
+        table (DetectionTable): The detections.
+
+    Returns:
+        numpy.ndarray: The (N,) distance buckets, NEAR, MIDDLE or FAR.
+    """
+    sizes = table.boxes[:, 2:] - table.boxes[:, :2]
+    areas = np.clip(sizes[:, 0], 0, None) * np.clip(sizes[:, 1], 0, None)
+    fractions = areas / max(table.image_width * table.image_height, 1)
+    # Thresholds in descending order, so the bucket is the number of thresholds the fraction is below
+    return (fractions[:, None] < np.asarray(DISTANCE_AREA_THRESHOLDS)).sum(axis=1).astype(np.int32)
+
+
+def summarize(table, columns=3, rows=3, distances=False):
+    """
+    Groups the detections of identical objects found in the same place.
+
+    Args:
+        table (DetectionTable): The detections.
+        columns (int, optional): The number of columns of the grid, from left to right. Defaults to 3.
+        rows (int, optional): The number of rows of the grid, from top to bottom. Defaults to 3.
+        distances (bool, optional): Also group by estimated distance. Defaults to False.
+
+    Returns:
+        List[Dict[str, Union[str, int, None]]]: One group per object and place, with the translated object
+        'name', its 'class_id', the 'count' of detections, the 'column' and 'row' of the grid cell and the
+        'distance' bucket, None unless distances are estimated. Objects come in the order they were first
+        detected, and the places of an object from the most to the least crowded.
+    """
+    if len(table) == 0:
+        return []
+
+    column, row = table.grid_cells(columns, rows)
+    distance = estimate_distances(table) if distances else np.zeros(len(table), dtype=np.int32)
+    keys = np.stack([table.class_ids, column, row, distance], axis=1)
+    groups, first_index, counts = np.unique(keys, axis=0, return_index=True, return_counts=True)
+
+    # Rank each class by its first detection, so the summary follows the order of the detections
+    classes, class_first_index = np.unique(table.class_ids, return_index=True)
+    class_rank = np.searchsorted(np.sort(class_first_index), class_first_index)
+    group_rank = class_rank[np.searchsorted(classes, groups[:, 0])]
+    order = np.lexsort((first_index, -counts, group_rank))
+
+    names = table.labels()
+    return [{'name': names[first_index[index]],
+             'class_id': int(groups[index, 0]),
+             'count': int(counts[index]),
+             'column': int(groups[index, 1]),
+             'row': int(groups[index, 2]),
+             'distance': int(groups[index, 3]) if distances else None}
+            for index in order]
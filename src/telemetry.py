@@ -0,0 +1,283 @@
+"""
+Module summary: Lightweight metrics and sampled structured logs for the detection service.
+
+Counters and histograms are kept in memory and rendered in the Prometheus text exposition format, see
+`Registry.render`. Values that other components already track, such as the result cache or the janitor
+statistics, are read through callbacks when the metrics are rendered, so they are never counted twice.
+
+A span times a stage of a request (decode, inference, translation, annotation, file I/O) into the
+`STAGE_SECONDS` histogram. Spans and events can also be written as one JSON object per line, for a
+sampled fraction of the requests set by TELEMETRY_LOG_SAMPLE_RATE. The log is off by default, and
+then costs a single comparison per event.
+
+Metrics are kept per process. serve.py runs a single worker by default. When it runs several, each worker
+reports its own metrics, told apart by the 'worker' label set in `Registry.const_labels`.
+
+Example:
+    with span('inference', model_size='n'):
+        results = model(image)
+"""
+
+import bisect
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Fraction of the requests whose spans and events are logged, 0 disables the log and 1 logs every request
+LOG_SAMPLE_RATE = float(os.environ.get('TELEMETRY_LOG_SAMPLE_RATE', 0))
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    """Formats labels as '{a="1",b="2"}', leaving out empty values."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in labels if value != '' and value is not None]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count, per combination of label values.
+
+    Args:
+        name (str): The metric name, ending with '_total' by convention.
+        documentation (str): The help text.
+        labelnames (Tuple[str, ...], optional): The names of the labels. Defaults to none.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Adds to the count of a combination of label values."""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Returns the (name, labels, value) samples to render."""
+        with self._lock:
+            return [(self.name, tuple(zip(self.labelnames, key)), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets, per combination of label values.
+
+    Args:
+        name (str): The metric name, ending with the unit, e.g. '_seconds'.
+        documentation (str): The help text.
+        labelnames (Tuple[str, ...], optional): The names of the labels. Defaults to none.
+        buckets (Tuple[float, ...], optional): The upper bounds of the buckets, ascending. Defaults to DEFAULT_BUCKETS.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Records an observation for a combination of label values."""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        """Returns the (name, labels, value) samples to render, with cumulative bucket counts."""
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        samples = []
+        for key, values in series:
+            labels = tuple(zip(self.labelnames, key))
+            counts = itertools.accumulate(values[:len(self.buckets) + 1])
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                samples.append((f'{self.name}_bucket', labels + (('le', _format_value(float(bound))),), count))
+            samples.append((f'{self.name}_sum', labels, values[-2]))
+            samples.append((f'{self.name}_count', labels, values[-1]))
+        return samples
+
+
+class CallbackMetric:
+    """
+    A metric whose values are read from a callback when the metrics are rendered.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The help text.
+        callback (Callable[[], Union[float, List[Tuple[Dict[str, str], float]]]]): Returns the value, or a
+            list of (labels, value) pairs.
+        kind (str, optional): 'gauge' or 'counter'. Defaults to 'gauge'.
+    """
+
+    def __init__(self, name, documentation, callback, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, list):
+            values = [({}, values)]
+        return [(self.name, tuple(sorted(labels.items())), value) for labels, value in values if value is not None]
+
+
+class Registry:
+    """
+    Holds the metrics of a process and renders them in the Prometheus text format.
+
+    Attributes:
+        const_labels (Dict[str, str]): Labels added to every sample, e.g. the worker process.
+    """
+
+    def __init__(self):
+        self.const_labels = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Registers and returns a Counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Registers and returns a Histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, kind='gauge'):
+        """Registers and returns a CallbackMetric."""
+        return self._register(CallbackMetric(name, documentation, callback, kind))
+
+    def render(self):
+        """
+        Renders every metric.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format, version 0.0.4. A callback that
+            fails is left out, with a comment giving the error.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        const_labels = tuple(self.const_labels.items())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+                continue
+            lines.append(f'# HELP {metric.name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines += [f'{name}{_format_labels(const_labels + tuple(labels))} {_format_value(value)}'
+                      for name, labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = Registry()
+STAGE_SECONDS = registry.histogram('detector_stage_seconds', 'Time spent in each stage of the requests.',
+                                   ('stage', 'model_size'))
+
+_trace = threading.local()
+_trace_ids = itertools.count(1)
+
+
+def begin_trace(name):
+    """
+    Starts the trace of a request on the current thread, deciding whether its spans and events are logged.
+
+    Args:
+        name (str): What is traced, e.g. the route.
+    """
+    _trace.name = name
+    _trace.id = f'{os.getpid()}-{next(_trace_ids)}'
+    _trace.sampled = LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE
+
+
+def end_trace():
+    """Ends the trace of the current thread."""
+    _trace.sampled = None
+
+
+def log(event, **fields):
+    """
+    Writes an event as a line of JSON, if the current trace is sampled.
+
+    Outside of a trace, each event is sampled on its own.
+
+    Args:
+        event (str): The event name.
+        **fields: The fields of the event, converted with str if they are not JSON types.
+    """
+    if LOG_SAMPLE_RATE <= 0:
+        return
+    sampled = getattr(_trace, 'sampled', None)
+    if sampled is None:
+        if random.random() >= LOG_SAMPLE_RATE:
+            return
+        record = {'time': round(time.time(), 3), 'event': event}
+    elif not sampled:
+        return
+    else:
+        record = {'time': round(time.time(), 3), 'event': event, 'trace': _trace.id, 'name': _trace.name}
+    record.update(fields)
+    print(json.dumps(record, default=str, ensure_ascii=False), flush=True)
+
+
+@contextmanager
+def span(stage, model_size=''):
+    """
+    Times a stage into STAGE_SECONDS, and logs it if the current trace is sampled.
+
+    Args:
+        stage (str): The stage, e.g. 'decode', 'inference' or 'translation'.
+        model_size (str, optional): The model size the stage ran with, if any. Defaults to ''.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, model_size=model_size)
+        log('span', stage=stage, model_size=model_size or None, duration_ms=round(elapsed * 1000, 3))
@@ -0,0 +1,224 @@
+"""
+Module summary: Persistent translation table for object class names.
+
+Translations are memoized per (source language, target language, label) and persisted to a JSON file.
+The labels a request needs are translated in a single batch the first time they are used for a language
+pair, so detection never waits on a translation round trip per box. In offline mode the table is
+only read, and labels missing from it are returned untranslated.
+
+Example:
+    Pre-build the table for French and Spanish before deploying a unit without internet access:
+
+        python translation.py --languages fr,es
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+# The class names of the COCO dataset, which the YOLOv10 weights are trained on
+COCO_CLASS_NAMES = [
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
+    'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
+    'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee',
+    'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard',
+    'tennis racket', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple',
+    'sandwich', 'orange', 'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch',
+    'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard',
+    'cell phone', 'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors',
+    'teddy bear', 'hair drier', 'toothbrush',
+]
+
+DEFAULT_TRANSLATION_CACHE_PATH = './models/translations.json'
+# Seconds during which a label that could not be translated is served untranslated before it is retried
+TRANSLATION_RETRY_S = 300
+
+
+def _google_translator(source_language, target_language):
+    from deep_translator import GoogleTranslator  # Deferred so that offline units never import it
+    return GoogleTranslator(source=source_language, target=target_language)
+
+
+class TranslationCache:
+    """
+    Memoizes label translations in memory and on disk.
+
+    Args:
+        path (str): The JSON file the table is loaded from and saved to. None keeps the table in memory only.
+        offline (bool, optional): Never contact the translator, only use the pre-built table. Defaults to False.
+        translator_factory (Callable[[str, str], object], optional): Builds a translator for a
+            (source, target) pair, exposing ``translate`` and ``translate_batch``. Defaults to GoogleTranslator.
+        retry_s (float, optional): Seconds during which a label that could not be translated is returned
+            untranslated, without contacting the translator again. Defaults to TRANSLATION_RETRY_S.
+    """
+
+    def __init__(self, path=DEFAULT_TRANSLATION_CACHE_PATH, offline=False, translator_factory=None,
+                 retry_s=TRANSLATION_RETRY_S):
+        self.path = path
+        self.offline = offline
+        self.retry_s = retry_s
+        self._translator_factory = translator_factory or _google_translator
+        self._table = {}  # source -> target -> label -> translation
+        self._failed = {}  # (source, target, label) -> time of the last failed attempt, in memory only
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Loads the table from disk, keeping the in-memory table if the file is missing or unreadable."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                table = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Could not load translation cache {self.path}: {e}")
+            return
+        with self._lock:
+            for source, targets in table.items():
+                for target, labels in targets.items():
+                    self._table.setdefault(source, {}).setdefault(target, {}).update(labels)
+
+    def save(self):
+        """Writes the table to disk atomically."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._lock:
+            data = json.dumps(self._table, ensure_ascii=False, indent=1, sort_keys=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+    def lookup(self, label, target_language, source_language):
+        """Returns the memoized translation of a label, or None if it has not been translated yet."""
+        if source_language == target_language:
+            return label
+        return self._table.get(source_language, {}).get(target_language, {}).get(label)
+
+    def has_language_pair(self, source_language, target_language, labels):
+        """Returns True if every label has a memoized translation for the language pair."""
+        return all(self.lookup(label, target_language, source_language) is not None for label in labels)
+
+    def _store(self, source_language, target_language, translations):
+        with self._lock:
+            self._table.setdefault(source_language, {}).setdefault(target_language, {}).update(translations)
+            for label in translations:
+                self._failed.pop((source_language, target_language, label), None)
+
+    def _mark_failed(self, labels, target_language, source_language):
+        now = time.monotonic()
+        with self._lock:
+            for label in labels:
+                self._failed[(source_language, target_language, label)] = now
+
+    def recently_failed(self, label, target_language, source_language):
+        """Returns True if translating a label failed less than `retry_s` seconds ago."""
+        failed_at = self._failed.get((source_language, target_language, label))
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_s
+
+    def translate(self, label, target_language, source_language):
+        """
+        Translates a label, using the memoized table when possible.
+
+        Args:
+            label (str): The label to translate.
+            target_language (str): The target language code.
+            source_language (str): The source language code.
+
+        Returns:
+            str: The translated label, or the original label if it cannot be translated or failed to be
+            translated in the last `retry_s` seconds.
+        """
+        translated = self.lookup(label, target_language, source_language)
+        if translated is not None:
+            return translated
+        if self.offline or self.recently_failed(label, target_language, source_language):
+            return label
+
+        try:
+            translated = self._translator_factory(source_language, target_language).translate(label)
+        except Exception as e:
+            print(f"Translation error: {e}")
+            translated = None
+        if not translated:
+            # Not memoized on disk, so that it is retried once the translator is reachable again
+            self._mark_failed([label], target_language, source_language)
+            return label
+        self._store(source_language, target_language, {label: translated})
+        self.save()
+        return translated
+
+    def translate_vocabulary(self, labels, target_language, source_language, needed=None):
+        """
+        Translates a whole vocabulary, only contacting the translator for the labels that are needed.
+
+        The `needed` labels missing from the table are translated in a single batch, see `prefetch`. The
+        other labels are looked up, and returned untranslated until they are needed once, so the result
+        covers the whole vocabulary while a request only pays for the labels it uses.
+
+        Args:
+            labels (Iterable[str]): The vocabulary, typically the model's class names.
+            target_language (str): The target language code.
+            source_language (str): The source language code.
+            needed (Iterable[str], optional): The labels to translate now, e.g. those of the detected objects.
+                Defaults to the whole vocabulary.
+
+        Returns:
+            List[str]: The translation of each label, or the label itself if it is not translated yet.
+        """
+        labels = list(labels)
+        self.prefetch(labels if needed is None else needed, target_language=target_language,
+                      source_language=source_language)
+        translated = [self.lookup(label, target_language, source_language) for label in labels]
+        return [label if translation is None else translation for label, translation in zip(labels, translated)]
+
+    def prefetch(self, labels, target_language, source_language):
+        """
+        Translates every label missing from the table for a language pair in a single batch.
+
+        Labels the batch fails to translate are marked as failed, so that `translate` does not contact the
+        translator for them one at a time until `retry_s` seconds have passed.
+
+        Args:
+            labels (Iterable[str]): The vocabulary to translate, typically the model's class names.
+            target_language (str): The target language code.
+            source_language (str): The source language code.
+
+        Returns:
+            int: The number of labels that were newly translated.
+        """
+        missing = sorted({label for label in labels if self.lookup(label, target_language, source_language) is None
+                          and not self.recently_failed(label, target_language, source_language)})
+        if not missing or self.offline:
+            return 0
+
+        try:
+            translated = self._translator_factory(source_language, target_language).translate_batch(missing)
+        except Exception as e:
+            print(f"Bulk translation error for {source_language}->{target_language}: {e}")
+            self._mark_failed(missing, target_language, source_language)
+            return 0
+        translations = {label: text for label, text in zip(missing, translated or []) if text}
+        self._mark_failed([label for label in missing if label not in translations], target_language, source_language)
+        if translations:
+            self._store(source_language, target_language, translations)
+            self.save()
+        print(f"Translated {len(translations)} of {len(missing)} labels from {source_language} to {target_language}")
+        return len(translations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-build the translation table of the COCO class names.')
+    parser.add_argument('--languages', required=True, help='Comma separated target language codes, e.g. fr,es')
+    parser.add_argument('--source', default='en', help='The language of the class names. Defaults to en.')
+    parser.add_argument('--path', default=DEFAULT_TRANSLATION_CACHE_PATH, help='The translation table to update.')
+    args = parser.parse_args()
+
+    cache = TranslationCache(args.path)
+    for language in args.languages.split(','):
+        cache.prefetch(COCO_CLASS_NAMES, target_language=language, source_language=args.source)
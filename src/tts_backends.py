@@ -0,0 +1,280 @@
+"""
+Module summary: Pluggable text-to-speech backends.
+
+"gtts" streams phrases synthesized by Google Text-to-Speech, see audio.py. It needs the network.
+
+"offline" pre-renders every token of the announcement grammar once per language with espeak-ng, and
+builds each announcement by concatenating the PCM clips of its tokens in memory. Speech then starts
+within milliseconds of the detections and never touches the network. Tokens outside the pre-rendered
+vocabulary are rendered on the fly, still offline, and kept for next time. Free text passed to `speak`
+is also rendered on the fly, but never kept, so it cannot grow the clips without bound.
+
+Example:
+    Pre-render the clips for English and French:
+
+        python tts_backends.py --languages en,fr
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+import announcement
+from translation import COCO_CLASS_NAMES, DEFAULT_TRANSLATION_CACHE_PATH, TranslationCache
+
+CLIP_FOLDER = os.path.relpath("tts_clips")
+# Silence inserted after each kind of token, in seconds
+WORD_GAP_S = 0.04
+PUNCTUATION_GAP_S = {',': 0.15, '.': 0.3}
+
+
+class TTSBackend:
+    """The interface of the text-to-speech backends."""
+
+    def speak(self, text, language):
+        """
+        Speaks a sentence and returns once it has been played.
+
+        :param text: The sentence.
+        :param language: The language code.
+        """
+        raise NotImplementedError
+
+    def speak_tokens(self, tokens, language):
+        """
+        Speaks a summary built by announcement.build_announcement.
+
+        :param tokens: The tokens of the summary.
+        :param language: The language code.
+        """
+        self.speak(announcement.render_text(tokens), language)
+
+
+class GTTSBackend(TTSBackend):
+    """Streams phrases synthesized by Google Text-to-Speech."""
+
+    def speak(self, text, language):
+        from audio import synthesize_audio  # Deferred, it imports gtts
+        synthesize_audio(text, language)
+
+
+class EspeakEngine:
+    """
+    Renders text to 16-bit mono PCM with the espeak-ng command line tool.
+
+    :param executable: The espeak binary. Defaults to espeak-ng, or espeak if it is not installed.
+    """
+
+    def __init__(self, executable=None):
+        self.executable = executable or shutil.which('espeak-ng') or shutil.which('espeak')
+        if self.executable is None:
+            raise RuntimeError("The offline TTS backend requires espeak-ng, install it with: sudo apt install espeak-ng")
+
+    def render(self, text, language):
+        """
+        Renders a text.
+
+        :param text: The text to render.
+        :param language: The espeak voice, which for most languages is the language code.
+        :return: The samples as an int16 array and their sample rate.
+        """
+        output = subprocess.run([self.executable, '-v', language, '--stdout', text],
+                                check=True, capture_output=True).stdout
+        with wave.open(io.BytesIO(output)) as wav:
+            rate = wav.getframerate()
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            if wav.getnchannels() > 1:
+                samples = samples.reshape(-1, wav.getnchannels())[:, 0]
+        return samples, rate
+
+
+class OfflineClipBackend(TTSBackend):
+    """
+    Speaks announcements by concatenating pre-rendered clips of their tokens.
+
+    :param engine: Renders the clips, defaults to EspeakEngine.
+    :param clip_folder: Where the clips are stored, as WAV files per language.
+    """
+
+    def __init__(self, engine=None, clip_folder=CLIP_FOLDER):
+        self._engine = engine
+        self.clip_folder = clip_folder
+        self._clips = {}  # (language, token) -> (samples, rate)
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = EspeakEngine()
+        return self._engine
+
+    def clip_path(self, token, language):
+        """Returns the file of the clip for a token in a language."""
+        key = hashlib.sha1(token.encode('utf-8')).hexdigest()
+        return os.path.join(self.clip_folder, language, f"{key}.wav")
+
+    def _save_clip(self, path, samples, rate):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temporary file of its own, so that concurrent renders of a clip never write to the same file
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as file:
+            try:
+                with wave.open(file, 'wb') as wav:
+                    wav.setnchannels(1)
+                    wav.setsampwidth(2)
+                    wav.setframerate(rate)
+                    wav.writeframes(samples.tobytes())
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
+        os.replace(file.name, path)
+
+    def clip(self, token, language):
+        """
+        Returns the clip of a token, loading or rendering it if it is not in memory yet.
+
+        :param token: The token.
+        :param language: The language code.
+        :return: The samples as an int16 array and their sample rate.
+        """
+        key = (language, token)
+        with self._lock:
+            cached = self._clips.get(key)
+        if cached is not None:
+            return cached
+
+        path = self.clip_path(token, language)
+        if os.path.exists(path):
+            with wave.open(path) as wav:
+                cached = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16), wav.getframerate()
+        else:
+            cached = self.engine.render(token, language)
+            self._save_clip(path, *cached)
+
+        with self._lock:
+            self._clips[key] = cached
+        return cached
+
+    def prerender(self, tokens, language):
+        """
+        Renders the clips of a vocabulary, skipping the ones already on disk.
+
+        :param tokens: The tokens to render.
+        :param language: The language code.
+        :return: The number of clips that were rendered.
+        """
+        rendered = 0
+        for token in tokens:
+            if not os.path.exists(self.clip_path(token, language)):
+                samples, rate = self.engine.render(token, language)
+                self._save_clip(self.clip_path(token, language), samples, rate)
+                rendered += 1
+        return rendered
+
+    def compose(self, tokens, language):
+        """
+        Concatenates the clips of the tokens of an announcement.
+
+        :param tokens: The tokens, punctuation included.
+        :param language: The language code.
+        :return: The samples as an int16 array and their sample rate.
+        """
+        pieces = []
+        rate = None
+        for token in tokens:
+            if token in PUNCTUATION_GAP_S:
+                if rate is not None:
+                    pieces.append(np.zeros(int(rate * PUNCTUATION_GAP_S[token]), dtype=np.int16))
+                continue
+            samples, clip_rate = self.clip(token, language)
+            if rate is None:
+                rate = clip_rate
+            elif clip_rate != rate:
+                samples = _resample(samples, clip_rate, rate)
+            pieces.append(samples)
+            pieces.append(np.zeros(int(rate * WORD_GAP_S), dtype=np.int16))
+        if not pieces:
+            return np.zeros(0, dtype=np.int16), rate or 22050
+        return np.concatenate(pieces), rate
+
+    def speak_tokens(self, tokens, language):
+        samples, rate = self.compose(tokens, language)
+        play_samples(samples, rate)
+
+    def speak(self, text, language):
+        # Free text is rendered on the fly and not kept, only the tokens of the vocabulary are clips
+        if (language, text) in self._clips or os.path.exists(self.clip_path(text, language)):
+            samples, rate = self.clip(text, language)
+        else:
+            samples, rate = self.engine.render(text, language)
+        play_samples(samples, rate)
+
+
+def _resample(samples, rate, target_rate):
+    """Linearly resamples int16 mono samples."""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    length = int(round(len(samples) * target_rate / rate))
+    positions = np.linspace(0, len(samples) - 1, length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+
+def play_samples(samples, rate):
+    """
+    Plays int16 mono samples through the pygame mixer and returns once they have been played.
+
+    :param samples: The samples.
+    :param rate: Their sample rate.
+    """
+    from pygame import mixer  # Deferred so that pre-rendering does not need an audio device
+
+    if not mixer.get_init():
+        mixer.init(frequency=rate, size=-16, channels=1)
+    mixer_rate, _, channels = mixer.get_init()
+    samples = _resample(samples, rate, mixer_rate)
+    if channels > 1:
+        samples = np.repeat(samples[:, np.newaxis], channels, axis=1)
+    sound = mixer.Sound(buffer=np.ascontiguousarray(samples).tobytes())
+    channel = sound.play()
+    while channel is not None and channel.get_busy():
+        time.sleep(0.02)
+
+
+def create_tts_backend(name):
+    """
+    Builds a text-to-speech backend.
+
+    :param name: Either "gtts" or "offline".
+    :return: The backend.
+    :raises ValueError: If the name is unknown.
+    """
+    if name == 'gtts':
+        return GTTSBackend()
+    if name == 'offline':
+        return OfflineClipBackend()
+    raise ValueError(f"Unknown TTS backend: {name!r}, expected 'gtts' or 'offline'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render the vocabulary of the announcements for offline speech.')
+    parser.add_argument('--languages', required=True, help='Comma separated language codes, e.g. en,fr')
+    parser.add_argument('--translations', default=DEFAULT_TRANSLATION_CACHE_PATH,
+                        help='The translation table used for the object names.')
+    args = parser.parse_args()
+
+    translations = TranslationCache(args.translations)
+    backend = OfflineClipBackend()
+    for language in args.languages.split(','):
+        translations.prefetch(COCO_CLASS_NAMES, target_language=language, source_language='en')
+        names = [translations.translate(name, language, 'en') for name in COCO_CLASS_NAMES]
+        rendered = backend.prerender(announcement.vocabulary(names), language)
+        print(f"Rendered {rendered} clips for {language}")
@@ -0,0 +1,241 @@
+"""
+Module summary: Pipelined video detection.
+
+Decoding, inference, annotation and encoding run on their own threads, connected by bounded queues, so
+the stages overlap instead of running one after another for every frame, and a slow consumer applies
+back-pressure instead of letting decoded frames pile up in memory.
+
+With a stride above 1, only every stride-th frame goes through the model. The boxes of the frames in
+between are tracked from the previous frame with sparse optical flow.
+"""
+
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+from annotation import draw_detections
+
+_END = object()
+TRACKING_GRID = 3  # Points tracked per box, along each axis
+
+
+def _empty_detections():
+    return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+
+def track_boxes(previous_gray, gray, boxes):
+    """
+    Moves boxes from one frame to the next by the median optical flow of a grid of points inside each box.
+
+    Args:
+        previous_gray (numpy.ndarray): The previous frame, in grayscale.
+        gray (numpy.ndarray): The current frame, in grayscale.
+        boxes (numpy.ndarray): The (N, 4) xyxy boxes in the previous frame.
+
+    Returns:
+        numpy.ndarray: The (N, 4) boxes in the current frame. Boxes whose points were lost are left in place.
+    """
+    if len(boxes) == 0:
+        return boxes
+
+    steps = (np.arange(TRACKING_GRID) + 0.5) / TRACKING_GRID
+    xs = boxes[:, 0:1] + (boxes[:, 2:3] - boxes[:, 0:1]) * steps  # (N, grid)
+    ys = boxes[:, 1:2] + (boxes[:, 3:4] - boxes[:, 1:2]) * steps
+    points = np.stack([np.repeat(xs, TRACKING_GRID, axis=1), np.tile(ys, (1, TRACKING_GRID))], axis=-1)
+    points = points.reshape(-1, 1, 2).astype(np.float32)
+
+    moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None)
+    displacement = (moved - points).reshape(len(boxes), -1, 2)
+    tracked = status.reshape(len(boxes), -1).astype(bool)
+
+    shifted = boxes.copy()
+    for index in range(len(boxes)):
+        if tracked[index].any():
+            dx, dy = np.median(displacement[index][tracked[index]], axis=0)
+            shifted[index] += (dx, dy, dx, dy)
+    return shifted
+
+
+class VideoPipeline:
+    """
+    Runs detection over a video with overlapping decode, inference and annotation stages.
+
+    Args:
+        video_path (str): The video to process.
+        infer (Callable[[numpy.ndarray], Tuple]): Detects objects in a BGR frame, returning the (N, 4) xyxy
+            boxes, the (N,) class ids and the (N,) confidences as arrays.
+        labels (Dict[int, str]): The label drawn for each class id.
+        stride (int, optional): Run the model on every stride-th frame, track the boxes in between. Defaults to 1.
+        queue_size (int, optional): Capacity of the queues between the stages. Defaults to 8.
+
+    Raises:
+        FileNotFoundError: If the video file cannot be opened.
+    """
+
+    def __init__(self, video_path, infer, labels, stride=1, queue_size=8):
+        self.capture = cv2.VideoCapture(video_path)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"Could not open video file: {video_path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.infer = infer
+        self.labels = labels
+        self.stride = max(1, int(stride))
+        self.queue_size = queue_size
+        self.inferred_frames = 0
+        self.tracked_frames = 0
+
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = []
+
+    def _put(self, target, item):
+        """Puts an item on a queue, giving up if the pipeline is stopped. Returns False if it was stopped."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        """Takes an item from a queue, returning the end marker if the pipeline is stopped."""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _stage(self, work, source, target):
+        def run():
+            try:
+                while True:
+                    item = self._get(source) if source is not None else None
+                    if item is _END or self._stop.is_set():
+                        break
+                    produced = work(item)
+                    if produced is _END or not self._put(target, produced):
+                        break
+            except Exception as e:
+                self._error = e
+                self._stop.set()
+            finally:
+                try:
+                    target.put(_END, timeout=1)
+                except queue.Full:
+                    pass  # The pipeline was stopped and nobody is reading any more
+        return run
+
+    def _decode(self, _):
+        ret, frame = self.capture.read()
+        if not ret:
+            return _END
+        return frame
+
+    def _make_detect(self):
+        state = {'index': 0, 'gray': None, 'detections': _empty_detections()}
+
+        def detect(frame):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if self.stride > 1 else None
+            if state['index'] % self.stride == 0:
+                boxes, class_ids, confidences = self.infer(frame)
+                state['detections'] = (np.asarray(boxes, dtype=np.float32), np.asarray(class_ids),
+                                       np.asarray(confidences))
+                self.inferred_frames += 1
+            else:
+                boxes, class_ids, confidences = state['detections']
+                state['detections'] = (track_boxes(state['gray'], gray, boxes), class_ids, confidences)
+                self.tracked_frames += 1
+            state['gray'] = gray
+            state['index'] += 1
+            return (frame,) + state['detections']
+
+        return detect
+
+    def _annotate(self, item):
+        frame, boxes, class_ids, confidences = item
+        labels = [self.labels.get(int(class_id), str(int(class_id))) for class_id in class_ids]
+        # The decoded frame is not used again, so it is drawn on in place
+        return draw_detections(frame, boxes, class_ids, confidences, labels, out=frame)
+
+    def frames(self):
+        """
+        Starts the pipeline and yields the annotated frames in order, as soon as each is ready.
+
+        Raises:
+            Exception: The first error raised by a stage.
+        """
+        decoded = queue.Queue(self.queue_size)
+        detected = queue.Queue(self.queue_size)
+        annotated = queue.Queue(self.queue_size)
+        self._threads = [
+            threading.Thread(target=self._stage(self._decode, None, decoded), name='video-decode', daemon=True),
+            threading.Thread(target=self._stage(self._make_detect(), decoded, detected), name='video-infer',
+                             daemon=True),
+            threading.Thread(target=self._stage(self._annotate, detected, annotated), name='video-annotate',
+                             daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        try:
+            while True:
+                frame = annotated.get()
+                if frame is _END or self._error is not None:
+                    break
+                yield frame
+        finally:
+            self.close()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Stops the stages, e.g. when a streaming client disconnects, and releases the video."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.capture.release()
+
+    def write(self, output_path, fourcc='mp4v'):
+        """
+        Runs the pipeline and encodes the annotated frames into a video file.
+
+        Args:
+            output_path (str): The video file to write.
+            fourcc (str, optional): The codec. Defaults to 'mp4v'.
+
+        Returns:
+            str: The output path.
+        """
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), self.fps, (self.width, self.height))
+        try:
+            for frame in self.frames():
+                writer.write(frame)
+        finally:
+            writer.release()
+        return output_path
+
+    def stream_jpeg(self, boundary='frame', quality=80):
+        """
+        Runs the pipeline and yields the annotated frames as the parts of a multipart/x-mixed-replace stream.
+
+        Args:
+            boundary (str, optional): The multipart boundary. Defaults to 'frame'.
+            quality (int, optional): The JPEG quality. Defaults to 80.
+
+        Yields:
+            bytes: One multipart part per frame.
+        """
+        parameters = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        for frame in self.frames():
+            ok, encoded = cv2.imencode('.jpg', frame, parameters)
+            if not ok:
+                continue
+            yield (f"--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(encoded)}\r\n\r\n".encode()
+                   + encoded.tobytes() + b"\r\n")
@@ -0,0 +1,147 @@
+"""
+Module summary: Compact binary encoding of detections.
+
+A response is a fixed header, an optional label table and one packed record per detection:
+
+    header   magic b'YDET', version (u8), flags (u8), model size (1 byte), padding (1 byte),
+             image width (u32), image height (u32), detection count (u32), label table id (u32)
+    labels   if FLAG_LABELS is set: length (u32) and UTF-8 JSON of {class_id: [name, translated_name]}
+    records  count x (class_id u16, confidence f32, x1 f32, y1 f32, x2 f32, y2 f32)
+
+All integers and floats are little-endian. The label table maps the class ids of the whole vocabulary to
+their names, so a client only needs it once per language: it sends back the id of the table it already
+holds, and the server leaves the table out of the following responses. The id only changes when a class is
+translated for the first time, see `detector.translate_vocabulary`. Records decode into NumPy arrays
+without a copy.
+"""
+
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from detection_table import DetectionTable
+
+WIRE_MIMETYPE = 'application/x-detections'
+LABEL_TABLE_HEADER = 'X-Label-Table'  # Request header carrying the id of the label table the client holds
+MAGIC = b'YDET'
+VERSION = 2  # 2 widened the image dimensions from u16 to u32
+FLAG_LABELS = 0x01
+
+HEADER = struct.Struct('<4sBBcxIIII')
+LENGTH = struct.Struct('<I')
+RECORD = np.dtype([('class_id', '<u2'), ('confidence', '<f4'), ('box', '<f4', (4,))])
+
+
+def encode_label_table(names, translated_names):
+    """
+    Encodes the names of every class id.
+
+    Args:
+        names (Dict[int, str]): The object name of each class id, in the source language.
+        translated_names (Dict[int, str]): The object name of each class id, in the target language.
+
+    Returns:
+        Tuple[int, bytes]: The id of the table, a checksum of its content, and the encoded table.
+    """
+    table = {str(class_id): [name, translated_names.get(class_id, name)] for class_id, name in names.items()}
+    encoded = json.dumps(table, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return zlib.crc32(encoded), encoded
+
+
+def parse_label_table_id(value):
+    """
+    Parses the label table id sent by a client in the X-Label-Table header.
+
+    Args:
+        value (str): The header value, or None.
+
+    Returns:
+        int: The id, or None if the header is missing or malformed, so that the full label table is sent.
+    """
+    try:
+        label_table_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return label_table_id if 0 <= label_table_id <= 0xFFFFFFFF else None
+
+
+def encode(table, model_size, client_label_table_id=None):
+    """
+    Encodes a table of detections.
+
+    Args:
+        table (DetectionTable): The detections, with the names of the whole vocabulary.
+        model_size (str): The model size that produced the detections.
+        client_label_table_id (int, optional): The id of the label table the client already holds. The
+            table is left out of the response if it is the current one. Defaults to None.
+
+    Returns:
+        bytes: The encoded detections.
+    """
+    label_table_id, labels = encode_label_table(table.names, table.translated_names)
+    send_labels = client_label_table_id != label_table_id
+
+    records = np.empty(len(table), dtype=RECORD)
+    records['class_id'] = table.class_ids
+    records['confidence'] = table.confidences
+    records['box'] = table.boxes
+
+    parts = [HEADER.pack(MAGIC, VERSION, FLAG_LABELS if send_labels else 0, model_size.encode('ascii')[:1],
+                         table.image_width, table.image_height, len(table), label_table_id)]
+    if send_labels:
+        parts += [LENGTH.pack(len(labels)), labels]
+    parts.append(records.tobytes())
+    return b''.join(parts)
+
+
+def decode(data, label_tables=None):
+    """
+    Decodes detections encoded by `encode`.
+
+    Args:
+        data (bytes): The encoded detections.
+        label_tables (Dict[int, Tuple[Dict[int, str], Dict[int, str]]], optional): The label tables received
+            so far, keyed by id. A table contained in the data is added to it. Defaults to None.
+
+    Returns:
+        Tuple[str, DetectionTable, int]: The model size, the detections and the id of their label table.
+
+    Raises:
+        ValueError: If the data is not in this format, is of another version, is truncated, or refers to an
+            unknown label table.
+    """
+    if label_tables is None:
+        label_tables = {}
+    if len(data) < HEADER.size:
+        raise ValueError('Truncated detections header')
+    magic, version, flags, model_size, width, height, count, label_table_id = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not an encoded detections response')
+    if version != VERSION:
+        raise ValueError(f'Unsupported detections version {version}, expected {VERSION}')
+
+    offset = HEADER.size
+    if flags & FLAG_LABELS:
+        if len(data) < offset + LENGTH.size:
+            raise ValueError('Truncated label table length')
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        if len(data) < offset + length:
+            raise ValueError(f'Truncated label table: expected {length} bytes, got {len(data) - offset}')
+        decoded = json.loads(bytes(data[offset:offset + length]).decode('utf-8'))
+        offset += length
+        label_tables[label_table_id] = ({int(class_id): names[0] for class_id, names in decoded.items()},
+                                        {int(class_id): names[1] for class_id, names in decoded.items()})
+    if label_table_id not in label_tables:
+        raise ValueError(f'Unknown label table {label_table_id}')
+
+    if len(data) - offset != count * RECORD.itemsize:
+        raise ValueError(f'Truncated or corrupted detections: expected {count} records of {RECORD.itemsize} '
+                         f'bytes, got {len(data) - offset} bytes')
+    records = np.frombuffer(data, dtype=RECORD, count=count, offset=offset)
+    names, translated_names = label_tables[label_table_id]
+    table = DetectionTable(records['class_id'], records['confidence'], records['box'], names, translated_names,
+                           width, height)
+    return model_size.decode('ascii'), table, label_table_id
@@ -0,0 +1,116 @@
+"""Tests of BatchScheduler."""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from batching import BatchScheduler, percentile  # noqa: E402
+
+
+class RecordingModel:
+    """Returns each image doubled and remembers the batches it was called with."""
+
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.batches = []
+
+    def __call__(self, model_size, images):
+        self.batches.append((model_size, list(images)))
+        time.sleep(self.delay_s)
+        return [image * 2 for image in images]
+
+
+def submit_concurrently(scheduler, requests):
+    """Submits (model_size, images) requests from one thread each and returns their results in order."""
+    results = [None] * len(requests)
+
+    def submit(index, model_size, images):
+        results[index] = scheduler.submit(model_size, images)
+
+    threads = [threading.Thread(target=submit, args=(index,) + request) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+class BatchSchedulerTest(unittest.TestCase):
+    def test_single_request(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=1)
+        self.assertEqual(scheduler.submit('n', [1, 2]), [2, 4])
+        self.assertEqual(model.batches, [('n', [1, 2])])
+
+    def test_concurrent_requests_are_batched_and_get_their_own_results(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=200)
+        results = submit_concurrently(scheduler, [('n', [index]) for index in range(4)])
+        self.assertEqual(results, [[0], [2], [4], [6]])
+        self.assertEqual(len(model.batches), 1)
+        self.assertEqual(sorted(model.batches[0][1]), [0, 1, 2, 3])
+        self.assertEqual(scheduler.stats()['n']['batch_size_histogram'], {4: 1})
+
+    def test_batches_never_exceed_the_maximum_size(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model, max_batch_size=3, max_wait_ms=100)
+        results = submit_concurrently(scheduler, [('n', [index, index]) for index in range(4)])
+        self.assertEqual(results, [[0, 0], [2, 2], [4, 4], [6, 6]])
+        self.assertTrue(all(len(images) <= 3 for _, images in model.batches))
+        self.assertEqual(sum(len(images) for _, images in model.batches), 8)
+
+    def test_model_sizes_are_batched_separately(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=100)
+        results = submit_concurrently(scheduler, [('n', [1]), ('s', [2]), ('n', [3])])
+        self.assertEqual(results, [[2], [4], [6]])
+        self.assertEqual({model_size for model_size, _ in model.batches}, {'n', 's'})
+        self.assertTrue(all(len({image % 2 for image in images}) == 1 for _, images in model.batches))
+
+    def test_failure_is_raised_to_every_request_of_the_batch(self):
+        def fail(model_size, images):
+            raise RuntimeError('model failed')
+
+        scheduler = BatchScheduler(fail, max_batch_size=8, max_wait_ms=100)
+        errors = []
+
+        def submit():
+            try:
+                scheduler.submit('n', [1])
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=submit) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(len(errors), 3)
+
+        # The worker survives the failure
+        scheduler.run_batch = RecordingModel()
+        self.assertEqual(scheduler.submit('n', [5]), [10])
+
+    def test_stats(self):
+        scheduler = BatchScheduler(RecordingModel(), max_batch_size=4, max_wait_ms=1)
+        scheduler.submit('n', [1])
+        stats = scheduler.stats()['n']
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['batches'], 1)
+        self.assertIsNotNone(stats['p50_ms'])
+
+
+class PercentileTest(unittest.TestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+        self.assertEqual(percentile(list(range(100)), 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Tests of ButtonListener against fake_gpio."""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ['GPIO_BACKEND'] = 'fake'
+
+import fake_gpio  # noqa: E402
+from gpio_handler_no_debounce import LONG_PRESS, SHORT_PRESS, ButtonListener  # noqa: E402
+
+PIN = 17
+
+
+class ButtonListenerTest(unittest.TestCase):
+    def setUp(self):
+        fake_gpio.setup(PIN, fake_gpio.IN, pull_up_down=fake_gpio.PUD_UP)
+        self.listener = ButtonListener(fake_gpio, PIN, debounce_ms=50, long_press_s=1.0)
+        self.listener.start()
+
+    def tearDown(self):
+        self.listener.stop()
+        fake_gpio.cleanup()
+
+    def test_press_is_reported_once(self):
+        fake_gpio.press(PIN, duration=0.1)
+        event = self.listener.wait_for_press(timeout=1)
+        self.assertEqual(event.kind, SHORT_PRESS)
+        self.assertIsNone(self.listener.wait_for_press(timeout=0.1))
+
+    def test_fast_tap_within_debounce_delay_ends_the_press(self):
+        fake_gpio.press(PIN, duration=0.01)
+        event = self.listener.wait_for_press(timeout=1)
+        self.assertIsNotNone(event)
+        self.assertEqual(event.kind, SHORT_PRESS)
+
+        # The next press is timed from its own press edge, not from the tap
+        time.sleep(0.1)
+        fake_gpio.press(PIN, duration=0.1)
+        event = self.listener.wait_for_press(timeout=1)
+        self.assertIsNotNone(event)
+        self.assertEqual(event.kind, SHORT_PRESS)
+        self.assertLess(event.duration, 0.5)
+
+    def test_bouncing_contacts_give_a_single_press(self):
+        for level in (fake_gpio.LOW, fake_gpio.HIGH, fake_gpio.LOW):
+            thread = fake_gpio.set_input(PIN, level)
+            if thread is not None:
+                thread.join()
+        time.sleep(0.1)
+        thread = fake_gpio.set_input(PIN, fake_gpio.HIGH)  # Release
+        if thread is not None:
+            thread.join()
+        event = self.listener.wait_for_press(timeout=1)
+        self.assertEqual(event.kind, SHORT_PRESS)
+        self.assertIsNone(self.listener.wait_for_press(timeout=0.2))
+
+    def test_long_press(self):
+        fake_gpio.press(PIN, duration=1.1)
+        self.assertEqual(self.listener.wait_for_press(timeout=1).kind, LONG_PRESS)
+
+
+if __name__ == '__main__':
+    unittest.main()
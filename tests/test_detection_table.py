@@ -0,0 +1,73 @@
+"""Tests of DetectionTable."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from detection_table import DetectionTable  # noqa: E402
+
+NAMES = {0: 'person', 56: 'chair', 41: 'cup'}
+TRANSLATED_NAMES = {0: 'personne', 56: 'chaise', 41: 'tasse'}
+
+
+def make_table():
+    return DetectionTable([56, 0, 56], [0.9, 0.4, 0.7],
+                          [[10, 10, 50, 50], [500, 100, 600, 400], [200, 300, 260, 380]],
+                          NAMES, TRANSLATED_NAMES, 640, 480)
+
+
+class DetectionTableTest(unittest.TestCase):
+    def test_labels(self):
+        table = make_table()
+        self.assertEqual(table.labels().tolist(), ['chaise', 'personne', 'chaise'])
+        self.assertEqual(table.labels(translated=False).tolist(), ['chair', 'person', 'chair'])
+
+    def test_unknown_class_is_labelled_unknown(self):
+        table = DetectionTable([7], [0.5], [[0, 0, 1, 1]], NAMES, TRANSLATED_NAMES, 10, 10)
+        self.assertEqual(table.labels().tolist(), ['unknown'])
+
+    def test_above_filters_by_confidence(self):
+        table = make_table().above(0.5)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.class_ids.tolist(), [56, 56])
+        self.assertEqual((table.image_width, table.image_height), (640, 480))
+
+    def test_grid_cells(self):
+        columns, rows = make_table().grid_cells()
+        self.assertEqual(columns.tolist(), [0, 2, 1])
+        self.assertEqual(rows.tolist(), [0, 1, 2])
+
+    def test_columns_round_trip(self):
+        table = make_table()
+        columns = table.to_columns()
+        self.assertEqual(columns['names'], {'0': 'person', '56': 'chair'})  # Only the detected classes
+        restored = DetectionTable.from_columns(columns)
+        np.testing.assert_array_equal(restored.class_ids, table.class_ids)
+        np.testing.assert_allclose(restored.confidences, table.confidences, atol=1e-4)
+        np.testing.assert_allclose(restored.boxes, table.boxes)
+        self.assertEqual(restored.labels().tolist(), table.labels().tolist())
+        self.assertEqual((restored.image_width, restored.image_height), (640, 480))
+
+    def test_records_round_trip(self):
+        records = make_table().to_records()
+        self.assertEqual(records[0]['name'], 'chair')
+        self.assertEqual(records[0]['translated_name'], 'chaise')
+        self.assertEqual(records[0]['box'], [[10.0, 10.0, 50.0, 50.0]])
+
+        restored = DetectionTable.from_records(records, 640, 480)
+        self.assertEqual(restored.to_records(), records)
+
+    def test_empty_table(self):
+        table = DetectionTable([], [], np.zeros((0, 4)), NAMES, TRANSLATED_NAMES, 640, 480)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.labels().tolist(), [])
+        self.assertEqual(table.to_records(), [])
+        self.assertEqual(len(DetectionTable.from_columns(table.to_columns())), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests of FileJanitor expiry, quota and pinning."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from janitor import FileJanitor  # noqa: E402
+
+
+class FileJanitorTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.janitor = FileJanitor(self.root, max_age_s=3600, max_bytes=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, size=100):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as file:
+            file.write(b'x' * size)
+        return path
+
+    def wait_until_deleted(self, path, timeout=2):
+        deadline = time.monotonic() + timeout
+        while os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not os.path.exists(path)
+
+    def test_file_is_deleted_once_it_expires(self):
+        path = self.write('a')
+        self.janitor.schedule(path, 0.05)
+        self.assertTrue(self.wait_until_deleted(path))
+        self.assertEqual(self.janitor.stats()['expired'], 1)
+        self.assertEqual(self.janitor.stats()['bytes'], 0)
+
+    def test_rescheduled_file_keeps_its_new_expiry(self):
+        path = self.write('a')
+        self.janitor.schedule(path, 0.05)
+        self.janitor.schedule(path, 3600)
+        time.sleep(0.2)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.janitor.stats()['files'], 1)
+
+    def test_quota_evicts_the_files_closest_to_expiry(self):
+        first, second = self.write('first'), self.write('second')
+        self.janitor.schedule(first, 60)
+        self.janitor.schedule(second, 120)
+        third = self.write('third')
+        self.janitor.schedule(third, 180)
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        self.assertTrue(os.path.exists(third))
+        self.assertEqual(self.janitor.stats()['evicted'], 1)
+        self.assertEqual(self.janitor.stats()['bytes'], 200)
+
+    def test_quota_skips_pinned_files(self):
+        first, second = self.write('first'), self.write('second')
+        self.janitor.pin(first)
+        self.janitor.schedule(first, 60)
+        self.janitor.schedule(second, 120)
+        third = self.write('third')
+        self.janitor.schedule(third, 180)
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertEqual(self.janitor.stats()['pinned'], 1)
+
+        self.janitor.unpin(first)
+        self.assertEqual(self.janitor.stats()['pinned'], 0)
+        self.assertTrue(os.path.exists(first))  # Within the quota again, it is kept until it expires
+
+    def test_pinned_file_expires_once_unpinned(self):
+        path = self.write('a')
+        self.janitor.pin(path)
+        self.janitor.pin(path)
+        self.janitor.schedule(path, 0.05)
+        time.sleep(0.2)
+        self.assertTrue(os.path.exists(path))
+        self.janitor.unpin(path)
+        time.sleep(0.1)
+        self.assertTrue(os.path.exists(path))  # Still used once
+        self.janitor.unpin(path)
+        self.assertTrue(self.wait_until_deleted(path))
+        self.assertEqual(self.janitor.stats()['expired'], 1)
+
+    def test_files_left_by_a_previous_run_are_found(self):
+        path = self.write('left-over')
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+        self.janitor.start()
+        self.assertTrue(self.wait_until_deleted(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
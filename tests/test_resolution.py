@@ -0,0 +1,99 @@
+"""Tests of the adaptive resolution policy, tiling and non-maximum suppression."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from resolution import ResolutionPolicy, box_area_fractions, non_max_suppression, tile_grid  # noqa: E402
+
+
+def rows(*detections):
+    return np.array(detections, dtype=np.float32).reshape(-1, 6)
+
+
+class BoxAreaFractionsTest(unittest.TestCase):
+    def test_fractions_of_the_image(self):
+        np.testing.assert_allclose(box_area_fractions(np.array([[0, 0, 50, 20], [10, 10, 5, 5]]), 100, 100),
+                                   [0.1, 0.0])
+
+
+class NonMaxSuppressionTest(unittest.TestCase):
+    def test_overlapping_boxes_of_a_class_keep_the_most_confident(self):
+        kept = non_max_suppression(rows([0, 0, 10, 10, 0.6, 1], [1, 1, 11, 11, 0.9, 1], [50, 50, 60, 60, 0.5, 1]),
+                                   0.5)
+        np.testing.assert_allclose(kept[:, 4], [0.9, 0.5])
+
+    def test_classes_do_not_suppress_each_other(self):
+        kept = non_max_suppression(rows([0, 0, 10, 10, 0.6, 1], [0, 0, 10, 10, 0.9, 2]), 0.5)
+        self.assertEqual(sorted(kept[:, 5].tolist()), [1, 2])
+
+    def test_empty(self):
+        self.assertEqual(len(non_max_suppression(rows(), 0.5)), 0)
+
+
+class TileGridTest(unittest.TestCase):
+    def test_tiles_cover_the_image(self):
+        tiles = tile_grid(1500, 700, 640, 0.2)
+        self.assertTrue(np.all(tiles[:, 2] - tiles[:, 0] == 640))
+        self.assertTrue(np.all(tiles[:, 3] - tiles[:, 1] == 640))
+        self.assertEqual(tiles[:, 0].min(), 0)
+        self.assertEqual(tiles[:, 2].max(), 1500)
+        self.assertEqual(tiles[:, 3].max(), 700)
+        covered = np.zeros((700, 1500), dtype=bool)
+        for x1, y1, x2, y2 in tiles:
+            covered[y1:y2, x1:x2] = True
+        self.assertTrue(covered.all())
+
+    def test_small_image_is_a_single_tile(self):
+        self.assertEqual(tile_grid(300, 200, 640, 0.2).tolist(), [[0, 0, 300, 200]])
+
+
+class ResolutionPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def runner(self, outputs):
+        """Returns a detector whose successive calls return `outputs`, each a function of the image."""
+        outputs = iter(outputs)
+
+        def run(images, imgsz):
+            self.calls.append((imgsz, [image.shape for image in images]))
+            output = next(outputs)
+            return [output(image) for image in images]
+
+        return run
+
+    def test_confident_large_objects_need_a_single_pass(self):
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        policy = ResolutionPolicy(self.runner([lambda image: rows([0, 0, 400, 400, 0.9, 0])]))
+        detections, timings = policy.detect(image)
+        self.assertEqual(len(detections), 1)
+        self.assertEqual([timing['imgsz'] for timing in timings], [320])
+
+    def test_uncertain_object_reruns_the_whole_image_at_the_high_size(self):
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        policy = ResolutionPolicy(self.runner([lambda image: rows([0, 0, 400, 400, 0.3, 0]),
+                                               lambda image: rows([2, 2, 402, 402, 0.8, 0])]))
+        detections, timings = policy.detect(image)
+        self.assertEqual([timing['imgsz'] for timing in timings], [320, 640])
+        np.testing.assert_allclose(detections[:, 4], [0.8])  # Merged by NMS
+
+    def test_small_object_in_a_large_image_runs_only_the_overlapping_tiles(self):
+        image = np.zeros((2000, 3000, 3), dtype=np.uint8)
+        policy = ResolutionPolicy(self.runner([lambda image: rows([2900, 1900, 2950, 1950, 0.9, 0]),
+                                               lambda image: rows([10, 10, 30, 30, 0.7, 3])]))
+        detections, timings = policy.detect(image)
+        self.assertEqual([timing['imgsz'] for timing in timings], [320, 640])
+        self.assertEqual(timings[1]['inputs'], 1)  # Only the bottom right tile
+        self.assertEqual(self.calls[1][1], [(640, 640, 3)])
+        # Tile detections are shifted back into image coordinates
+        tile_box = detections[detections[:, 5] == 3][0, :4]
+        np.testing.assert_allclose(tile_box, [3000 - 640 + 10, 2000 - 640 + 10, 3000 - 640 + 30, 2000 - 640 + 30])
+
+
+if __name__ == '__main__':
+    unittest.main()
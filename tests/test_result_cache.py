@@ -0,0 +1,103 @@
+"""Tests of ResultCache and image_digest."""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from result_cache import ResultCache, image_digest  # noqa: E402
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_hit_after_miss(self):
+        cache = ResultCache(100, sizeof=len)
+        self.assertEqual(cache.get_or_compute('a', lambda: 'value'), ('value', False))
+        self.assertEqual(cache.get_or_compute('a', lambda: self.fail('computed twice')), ('value', True))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(10, sizeof=len)
+        cache.put('a', 'aaaa')
+        cache.put('b', 'bbbb')
+        cache.get('a')  # 'b' is now the least recently used
+        cache.put('c', 'cccc')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'aaaa')
+        self.assertEqual(cache.get('c'), 'cccc')
+        self.assertEqual(cache.stats()['bytes'], 8)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_value_larger_than_the_cache_is_not_kept(self):
+        cache = ResultCache(4, sizeof=len)
+        cache.put('a', 'aaaa')
+        cache.put('a', 'too large')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_disabled_cache_still_computes(self):
+        cache = ResultCache(0, sizeof=len)
+        self.assertEqual(cache.get_or_compute('a', lambda: 'value'), ('value', False))
+        self.assertEqual(cache.get_or_compute('a', lambda: 'again'), ('again', False))
+
+    def test_concurrent_requests_share_one_computation(self):
+        cache = ResultCache(100, sizeof=len)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(timeout=5)
+            return 'value'
+
+        results = []
+        owner = threading.Thread(target=lambda: results.append(cache.get_or_compute('a', compute)))
+        owner.start()
+        started.wait(timeout=5)
+        waiters = [threading.Thread(target=lambda: results.append(cache.get_or_compute('a', compute)))
+                   for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        while cache.stats()['coalesced'] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in [owner] + waiters:
+            thread.join(timeout=5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('value', False)] + [('value', True)] * 3)
+
+    def test_failure_is_raised_and_not_cached(self):
+        cache = ResultCache(100, sizeof=len)
+
+        def fail():
+            raise RuntimeError('model failed')
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_compute('a', fail)
+        self.assertEqual(cache.get_or_compute('a', lambda: 'value'), ('value', False))
+
+
+class ImageDigestTest(unittest.TestCase):
+    def test_digest_depends_on_pixels_and_shape(self):
+        image = np.zeros((4, 6, 3), dtype=np.uint8)
+        self.assertEqual(image_digest(image), image_digest(image.copy()))
+        self.assertNotEqual(image_digest(image), image_digest(image.reshape(6, 4, 3)))
+        changed = image.copy()
+        changed[0, 0, 0] = 1
+        self.assertNotEqual(image_digest(image), image_digest(changed))
+
+    def test_non_contiguous_view_matches_its_copy(self):
+        image = np.arange(48, dtype=np.uint8).reshape(4, 4, 3)
+        view = image[:, ::2]
+        self.assertEqual(image_digest(view), image_digest(np.ascontiguousarray(view)))
+
+
+if __name__ == '__main__':
+    unittest.main()
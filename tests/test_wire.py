@@ -0,0 +1,92 @@
+"""Tests of the binary encoding of detections."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import wire  # noqa: E402
+from detection_table import DetectionTable  # noqa: E402
+
+NAMES = {0: 'person', 41: 'cup', 56: 'chair'}
+TRANSLATED_NAMES = {0: 'personne', 41: 'tasse', 56: 'chaise'}
+
+
+def make_table(class_ids=(56, 0), width=640, height=480):
+    boxes = [[10, 20, 30, 40], [100, 110, 300, 400]][:len(class_ids)]
+    return DetectionTable(list(class_ids), [0.9, 0.5][:len(class_ids)], boxes, NAMES, TRANSLATED_NAMES,
+                          width, height)
+
+
+class WireTest(unittest.TestCase):
+    def test_round_trip(self):
+        table = make_table()
+        model_size, decoded, label_table_id = wire.decode(wire.encode(table, 's'))
+        self.assertEqual(model_size, 's')
+        np.testing.assert_array_equal(decoded.class_ids, table.class_ids)
+        np.testing.assert_allclose(decoded.confidences, table.confidences)
+        np.testing.assert_allclose(decoded.boxes, table.boxes)
+        self.assertEqual(decoded.labels().tolist(), ['chaise', 'personne'])
+        self.assertEqual((decoded.image_width, decoded.image_height), (640, 480))
+        self.assertEqual(label_table_id, wire.encode_label_table(NAMES, TRANSLATED_NAMES)[0])
+
+    def test_label_table_is_left_out_once_the_client_holds_it(self):
+        label_tables = {}
+        first = wire.encode(make_table(), 'n')
+        _, _, label_table_id = wire.decode(first, label_tables)
+        second = wire.encode(make_table((41,)), 'n', client_label_table_id=label_table_id)
+        self.assertLess(len(second), len(first) - len(wire.encode_label_table(NAMES, TRANSLATED_NAMES)[1]))
+
+        _, decoded, second_id = wire.decode(second, label_tables)
+        self.assertEqual(second_id, label_table_id)  # The same table, whatever the detected classes
+        self.assertEqual(decoded.labels().tolist(), ['tasse'])
+        with self.assertRaisesRegex(ValueError, 'Unknown label table'):
+            wire.decode(second)
+
+    def test_label_table_id_changes_with_the_names(self):
+        first_id, _ = wire.encode_label_table(NAMES, TRANSLATED_NAMES)
+        second_id, _ = wire.encode_label_table(NAMES, {**TRANSLATED_NAMES, 41: 'bol'})
+        self.assertNotEqual(first_id, second_id)
+        self.assertEqual(first_id, wire.encode_label_table(dict(reversed(NAMES.items())), TRANSLATED_NAMES)[0])
+
+    def test_large_images(self):
+        _, decoded, _ = wire.decode(wire.encode(make_table(width=70000, height=90000), 'n'))
+        self.assertEqual((decoded.image_width, decoded.image_height), (70000, 90000))
+
+    def test_empty_table(self):
+        table = DetectionTable([], [], np.zeros((0, 4)), NAMES, TRANSLATED_NAMES, 640, 480)
+        _, decoded, _ = wire.decode(wire.encode(table, 'n'))
+        self.assertEqual(len(decoded), 0)
+
+    def test_truncated_data_is_rejected(self):
+        data = wire.encode(make_table(), 'n')
+        for length in (0, wire.HEADER.size - 1, wire.HEADER.size + 2, wire.HEADER.size + 10, len(data) - 1):
+            with self.subTest(length=length), self.assertRaises(ValueError):
+                wire.decode(data[:length])
+
+    def test_other_formats_are_rejected(self):
+        data = bytearray(wire.encode(make_table(), 'n'))
+        with self.assertRaisesRegex(ValueError, 'Not an encoded detections response'):
+            wire.decode(b'{"detections": []}' + bytes(wire.HEADER.size))
+        data[4] = wire.VERSION + 1
+        with self.assertRaisesRegex(ValueError, 'Unsupported detections version'):
+            wire.decode(bytes(data))
+
+
+class ParseLabelTableIdTest(unittest.TestCase):
+    def test_valid_ids(self):
+        self.assertEqual(wire.parse_label_table_id('0'), 0)
+        self.assertEqual(wire.parse_label_table_id(' 123 '), 123)
+        self.assertEqual(wire.parse_label_table_id(str(0xFFFFFFFF)), 0xFFFFFFFF)
+
+    def test_missing_or_malformed_ids(self):
+        for value in (None, '', 'abc', '1.5', '-1', str(0x100000000)):
+            with self.subTest(value=value):
+                self.assertIsNone(wire.parse_label_table_id(value))
+
+
+if __name__ == '__main__':
+    unittest.main()